@@ -0,0 +1,59 @@
+import sys
+import time
+
+from src.tokens import TokenCache, extract_csrf
+from src.utils import REGEX_CSRF
+from testing.fixtures import chunked, order_page
+
+
+def regex(page: bytes):
+    # the current path: resp.text decodes everything, REGEX_CSRF scans (and backtracks over) all of it
+    return REGEX_CSRF.match(page.decode("utf-8")).groups(), len(page)
+
+
+def streaming(chunks):
+    return extract_csrf(iter(chunks))
+
+
+def cpu(fn, page, repeat: int = 20):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.process_time()
+        found, read = fn(page)
+        best = min(best, time.process_time() - started)
+    return found, read, best
+
+
+def extraction(sizes=(32 * 1024, 256 * 1024, 1024 * 1024)):
+    for size in sizes:
+        for token_at in (0.05, 0.5, 1.0):
+            page = order_page(size, token_at)
+            expected, read_before, before = cpu(regex, page)
+            found, read_after, after = cpu(streaming, chunked(page))
+            assert found == expected, (found, expected)
+            print(f"page={size // 1024:5d} KiB token_at={token_at:4.0%} "
+                  f"regex: read={read_before // 1024:5d} KiB cpu={before * 1000:7.2f} ms | "
+                  f"streaming: read={read_after // 1024:5d} KiB cpu={after * 1000:7.2f} ms")
+
+
+def order_pages(count: int = 1000):
+    # Order pages fetched and bytes received for one run, with one token set per VIN (before) and per session (after)
+    from testing.fixtures import offline_watcher
+    from testing.standins import LocalSMTPServer, LocalTeslaServer, TeslaFixture
+    fixture = TeslaFixture.synthetic(count)
+    for label, cache in (("per VIN", TokenCache(max_uses=1)), ("per session", TokenCache())):
+        with LocalTeslaServer(fixture, order_page_bytes=256 * 1024) as tesla, LocalSMTPServer() as smtp:
+            watcher = offline_watcher(tesla, smtp, count)
+            watcher.tokens = cache
+            start = time.perf_counter()
+            watcher.run()
+            elapsed = time.perf_counter() - start
+            received = watcher.http_stats["bytes_received"] / 2 ** 20
+            print(f"{label:>12}: elapsed={elapsed:6.2f} s order_pages={tesla.requests['order']:5d} "
+                  f"taxes={tesla.requests['taxes']:5d} received={received:7.1f} MiB")
+
+
+if __name__ == "__main__":
+    extraction()
+    if "--offline-run" in sys.argv:
+        order_pages()
@@ -0,0 +1,36 @@
+import sys
+import time
+import tracemalloc
+
+from testing.fixtures import offline_watcher
+from testing.standins import LocalSMTPServer, LocalTeslaServer, TeslaFixture
+
+
+def run_once(fixture: TeslaFixture, count: int, traced: bool = False, **server_options):
+    with LocalTeslaServer(fixture, **server_options) as tesla, LocalSMTPServer() as smtp:
+        watcher = offline_watcher(tesla, smtp, count)
+        if traced:
+            tracemalloc.start()
+        start = time.perf_counter()
+        page = watcher.run()
+        elapsed = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if traced else 0
+        if traced:
+            tracemalloc.stop()
+        return page, elapsed, peak, tesla.requests, watcher.http_stats
+
+
+def main(sizes=(10, 1_000, 50_000)):
+    sizes = [int(arg) for arg in sys.argv[1:]] or sizes
+    for count in sizes:
+        fixture = TeslaFixture.synthetic(count)
+        page, elapsed, _, requests, http = run_once(fixture, count)
+        # a separate run for memory: tracemalloc slows everything down several times over
+        _, _, peak, _, _ = run_once(fixture, count, traced=True)
+        print(f"results={count:6d} elapsed={elapsed:8.2f} s VINs/s={page.count / elapsed:8.0f} "
+              f"peak={peak / 2 ** 20:7.1f} MiB requests={dict(requests)} "
+              f"connections={http.get('connections_opened')}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import os
+import random
+import tempfile
+import time
+from types import SimpleNamespace
+
+from src.history import HistoryStore, SECONDS_PER_DAY
+
+TRIMS = ["LRAWD", "PAWD", "RWD"]
+
+
+def synthetic_runs(vins: int, runs: int, seed: int = 3):
+    # A rolling inventory: each run some VINs sell (leave) and new ones arrive; prices drop now and then
+    rng = random.Random(seed)
+    listed = {f"7SAYGDEE{i:09d}": float(rng.randrange(45000, 65000)) for i in range(vins)}
+    next_vin = vins
+    start = time.time() - runs * 3 * 60 * 60
+    for run in range(runs):
+        for vin in rng.sample(sorted(listed), k=max(1, vins // 100)):
+            del listed[vin]
+            listed[f"7SAYGDEE{next_vin:09d}"] = float(rng.randrange(45000, 65000))
+            next_vin += 1
+        for vin in rng.sample(sorted(listed), k=max(1, vins // 50)):
+            listed[vin] -= 500.0
+        cars = [SimpleNamespace(vin=vin, purchase_price=price, taxes_amount=round(price * 0.06625, 2),
+                                fees_amount=1748.0, incentives_amount=7500.0) for (vin, price) in listed.items()]
+        yield start + run * 3 * 60 * 60, cars
+
+
+def timed(label, fn, *args, **kwargs):
+    started = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"{label:>36}: {(time.perf_counter() - started) * 1000:10.1f} ms")
+    return result
+
+
+def main(vins=10_000, runs=200):
+    with tempfile.TemporaryDirectory() as tmp:
+        store = HistoryStore(os.path.join(tmp, "history.db"))
+        started = time.perf_counter()
+        for taken_at, cars in synthetic_runs(vins, runs):
+            store.record(cars, seen_at=taken_at, model="my", trim=TRIMS[int(taken_at) % 3], zipcode="07065")
+        store.flush()
+        elapsed = time.perf_counter() - started
+        print(f"{'write':>36}: {elapsed * 1000:10.1f} ms ({store.rows_written / elapsed:,.0f} rows/s, "
+              f"{store.rows_written:,} rows)")
+        vin = "7SAYGDEE000000001"
+        timed("price history of one VIN", store.price_history, vin)
+        timed("cheapest ever per trim", store.cheapest_ever, "my")
+        timed("daily counts (one trim)", store.daily_counts, "my", "LRAWD")
+        dropped = timed("compact (everything older than 1 day)", store.compact, older_than_seconds=SECONDS_PER_DAY)
+        print(f"{'dropped':>36}: {dropped:,} rows, {os.path.getsize(store.path) / 2 ** 20:.1f} MiB left")
+        timed("price history of one VIN (compacted)", store.price_history, vin)
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
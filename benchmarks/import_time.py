@@ -0,0 +1,107 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+# Startup budget for `python -m src.main` up to the first run, as measured by -X importtime (cumulative microseconds)
+BUDGET_MS = float(os.environ.get("TESLA_WATCHER_IMPORT_BUDGET_MS", "250"))
+# Optional subsystems a run with a cached geocode and a non-GCS storage backend must not import
+FORBIDDEN = ("google.cloud", "geopy", "timezonefinder", "pytz", "asyncio")
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# A whole run, not just the imports: lazy imports only prove themselves once the code paths behind them have executed.
+# The address is left to geocode (from the pre-filled cache) and storage comes from TESLA_WATCHER_STORAGE.
+RUN_STATEMENT = """
+from src.mailer import Mailer
+from src.metrics import NullMetrics
+from src.tesla_watcher import TeslaWatcher
+from testing.fixtures import SENDER, WATCH
+from testing.standins import LocalSMTPServer, LocalTeslaServer, TeslaFixture
+address = {k: v for (k, v) in WATCH.items() if k not in ("latitude", "longitude", "timezone")}
+with LocalTeslaServer(TeslaFixture.synthetic(5)) as tesla, LocalSMTPServer() as smtp:
+    mailer = Mailer(host="127.0.0.1", port=smtp.port, user=SENDER, password="stand-in", starttls=False)
+    watcher = TeslaWatcher(**address, tesla_base_url=tesla.url, top_results_count=5, http_backoff_factor=0.0,
+                           smtp_user_email=SENDER, smtp_user_password="stand-in", mailer=mailer,
+                           recipients=([SENDER], []), metrics=NullMetrics())
+    assert watcher.run().count == 5 and watcher.notifier.drain(timeout_seconds=10)
+    watcher.notifier.close()
+"""
+
+
+def import_times(statement: str) -> List[Tuple[str, int, int]]:
+    # [(module, self us, cumulative us)] in import order, from a fresh interpreter
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        capture_output=True, text=True, cwd=ROOT)
+    if result.returncode != 0:
+        raise SystemExit(f"`{statement}` failed: {result.stderr.strip().splitlines()[-1]}")
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|", 2)
+        times.append((name.rstrip(), int(own), int(cumulative)))
+    return times
+
+
+def top_level(times: List[Tuple[str, int, int]]) -> Dict[str, int]:
+    # Nesting is shown by indentation: only unindented entries add up to the total without double counting
+    return {name.strip(): cumulative for (name, _, cumulative) in times if name.startswith(" ") and
+            not name.startswith("  ")}
+
+
+def forbidden_in(modules: List[str]) -> List[str]:
+    return sorted({name for name in modules for prefix in FORBIDDEN if name == prefix or name.startswith(prefix + ".")})
+
+
+def modules_of(statement: str, env: Dict[str, str]) -> List[str]:
+    report = "\nimport json, sys\nprint(json.dumps(sorted(sys.modules)))"
+    result = subprocess.run(
+        [sys.executable, "-c", statement + report], capture_output=True, text=True, cwd=ROOT, env=env)
+    if result.returncode != 0:
+        raise SystemExit(f"`{statement.strip().splitlines()[0]}` failed: {result.stderr.strip().splitlines()[-1]}")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def modules_after_run() -> List[str]:
+    # Modules an offline run with a cached geocode and file:// storage adds to a fresh interpreter. Namespace packages
+    # preloaded at startup (google-cloud's *-nspkg.pth puts an empty google.cloud in every process) don't count.
+    from testing.fixtures import WATCH
+    # TeslaWatcher.address_text for the fixture address: a mismatch would geocode, and fail the check
+    address = ", ".join([WATCH["street"], WATCH["city"], f"{WATCH['county']} County", WATCH["state"], WATCH["country"],
+                         WATCH["zipcode"]])
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = os.path.join(tmp, "geocode.json")
+        with open(cache, "w", encoding="utf-8") as f:
+            json.dump({address: [WATCH["latitude"], WATCH["longitude"], WATCH["timezone"]]}, f)
+        env = os.environ | {"TESLA_WATCHER_GEOCODE_CACHE": cache, "TESLA_WATCHER_STORAGE": f"file://{tmp}"}
+        baseline = set(modules_of("pass", env))
+        return [name for name in modules_of(RUN_STATEMENT, env) if name not in baseline]
+
+
+def main():
+    statement = "import src.main"
+    # interpreter startup (site, encodings, ...) is paid by any Python process: only count what the statement adds
+    baseline = top_level(import_times("pass"))
+    times = import_times(statement)
+    roots = {name: cumulative for (name, cumulative) in top_level(times).items() if name not in baseline}
+    total_ms = sum(roots.values()) / 1000
+    loaded = [name.strip() for (name, _, _) in times]
+    forbidden = forbidden_in(loaded)
+    print(f"{statement}: {total_ms:.1f} ms in {len(loaded)} modules (budget {BUDGET_MS:.0f} ms)")
+    for name, cumulative in sorted(roots.items(), key=lambda item: -item[1])[:15]:
+        print(f"{cumulative / 1000:10.1f} ms  {name}")
+    if forbidden:
+        print(f"FAIL: imported optional subsystems: {forbidden}")
+    if total_ms > BUDGET_MS:
+        print(f"FAIL: over budget by {total_ms - BUDGET_MS:.1f} ms")
+    after_run = forbidden_in(modules_after_run())
+    print(f"offline run (cached geocode, file:// storage): "
+          f"{'FAIL: imported ' + str(after_run) if after_run else 'no optional subsystems imported'}")
+    sys.exit(1 if forbidden or after_run or total_ms > BUDGET_MS else 0)
+
+
+if __name__ == "__main__":
+    main()
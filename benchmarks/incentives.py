@@ -0,0 +1,81 @@
+import random
+import time
+from datetime import date
+
+from src.incentives import IncentiveTable, RULES
+
+STATES = ["AL", "AK", "AZ", "AR", "CA", "CO", "CT", "DE", "FL", "GA", "HI", "ID", "IL", "IN", "IA", "KS", "KY", "LA",
+          "ME", "MD", "MA", "MI", "MN", "MS", "MO", "MT", "NE", "NV", "NH", "NJ", "NM", "NY", "NC", "ND", "OH", "OK",
+          "OR", "PA", "RI", "SC", "SD", "TN", "TX", "UT", "VT", "VA", "WA", "WV", "WI", "WY"]
+MODELS = ["MDLS", "MDL3", "MDLX", "MDLY"]
+TRIMS = ["RWD", "LRAWD", "PAWD"]
+
+
+def synthetic_rules(rng, counties=5, cities=5):
+    # Illustrative amounts only: a state rebate plus county and city utility rebates for every state
+    rules = list(RULES)
+    for state in STATES:
+        rules.append({"name": f"state_{state}", "country": "US", "state": state,
+                      "bands": [[rng.randrange(40, 50) * 1000, 2000], [rng.randrange(50, 80) * 1000, 750]]})
+        for c in range(counties):
+            rules.append({"name": f"county_{state}_{c}", "country": "US", "state": state, "county": f"County{c}",
+                          "models": rng.sample(MODELS, 2), "bands": [[60000, 500]]})
+            for t in range(cities):
+                rules.append({"name": f"city_{state}_{c}_{t}", "country": "US", "state": state, "county": f"County{c}",
+                              "city": f"City{t}", "trims": rng.sample(TRIMS, 1), "bands": [[None, 250]],
+                              "effective_from": "2023-01-01", "effective_to": "2030-01-01"})
+    return rules
+
+
+def callbacks(car, country, state, county, city):
+    # Per-car Python callbacks as before: parse the price again for every rule
+    total = 0
+    if country == "US" and int(car["PurchasePrice"]) < 55000:
+        total += 7500
+    if country == "US" and state == "NJ":
+        if int(car["PurchasePrice"]) < 45000:
+            total += 4000
+        elif int(car["PurchasePrice"]) < 55000:
+            total += 1500
+    if country == "US" and state == "NY":
+        if int(car["PurchasePrice"]) < 42000:
+            total += 2000
+        elif int(car["PurchasePrice"]) < 80000:
+            total += 500
+    return total
+
+
+def main(n=100_000, seed=7):
+    rng = random.Random(seed)
+    table = IncentiveTable(synthetic_rules(rng))
+    on = date(2024, 6, 1)
+    locations = [("US", s, f"County{rng.randrange(5)}", f"City{rng.randrange(5)}") for s in STATES]
+    cars = [{"PurchasePrice": rng.randrange(35000, 110000), "model": rng.choice(MODELS), "trim": rng.choice(TRIMS),
+             "location": rng.choice(locations)} for _ in range(n)]
+    print(f"rules={len(table)} cars={n}")
+
+    start = time.perf_counter()
+    for car in cars:
+        callbacks(car, *car["location"])
+    elapsed = time.perf_counter() - start
+    print(f"callbacks (3 rules only):      {elapsed * 1000:9.1f} ms  {n / elapsed:12.0f} cars/s")
+
+    start = time.perf_counter()
+    for car in cars:
+        table.for_location(*car["location"]).evaluate(car["PurchasePrice"], car["model"], car["trim"], on)
+    elapsed = time.perf_counter() - start
+    print(f"compiled table, per car:       {elapsed * 1000:9.1f} ms  {n / elapsed:12.0f} cars/s")
+
+    start = time.perf_counter()
+    by_location = {}
+    for car in cars:
+        by_location.setdefault(car["location"], []).append(car)
+    for location, group in by_location.items():
+        table.for_location(*location).evaluate_batch(
+            [c["PurchasePrice"] for c in group], [c["model"] for c in group], [c["trim"] for c in group], on)
+    elapsed = time.perf_counter() - start
+    print(f"compiled table, batched:       {elapsed * 1000:9.1f} ms  {n / elapsed:12.0f} cars/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import gc
+import json
+import random
+import tracemalloc
+
+from testing.fixtures import synthetic_options
+from src.tesla_results import TeslaBatch, TeslaSummary
+
+
+class LegacySummary:
+    # The eager, __dict__-based record this replaced: every field pre-formatted, raw numbers discarded
+    def __init__(self, year, demo, miles, options, price, taxes, fees, incentives, referral, order_url):
+        self.demo = demo
+        self.miles = miles
+        self.year = f"{year}"
+        self.make = "Tesla"
+        self.model = f'{options["MODEL"]["name"]}'
+        self.trim = f'{options["TRIM"]["name"]}'
+        self.paint = f'{options["PAINT"]["name"]}'
+        self.wheels = f'{options["WHEELS"]["name"]}'.replace("’’", "''")
+        self.range = f'{options["SPECS_RANGE"]["value"]} {options["SPECS_RANGE"]["unit_short"]}'
+        self.speed = f'{options["SPECS_TOP_SPEED"]["value"]} {options["SPECS_TOP_SPEED"]["unit_short"]}'
+        self.acceleration = f'{options["SPECS_ACCELERATION"]["acceleration_value"]} '\
+                            f'{options["SPECS_ACCELERATION"]["acceleration_unit_short"]} in '\
+                            f'{options["SPECS_ACCELERATION"]["value"]} '\
+                            f'{options["SPECS_ACCELERATION"]["unit_short"]}'
+        self.interior = f'{options["INTERIOR"]["name"]}'
+        self.seating = f'{options["REAR_SEATS"]["name"]}'
+        self.autopilot = f'{options["AUTOPILOT"]["name"]}'
+        self.price = f'${price:,.2f}'
+        self.payment = f'${price + taxes + fees:,.2f}'
+        self.cost = f'${price + taxes + fees - incentives - referral:,.2f}'
+        self.link = f'{order_url}'
+
+
+def api_rows(n, seed=5):
+    # Fresh (non-shared) strings per car, as json.loads would produce for a real inventory response
+    rng = random.Random(seed)
+    return json.loads(json.dumps([{
+        "year": rng.choice([2023, 2024]),
+        "demo": rng.choice(["", "[DEMO]"]),
+        "miles": rng.choice(["", f"[{rng.randrange(10, 5000)} mi]"]),
+        "options": synthetic_options(rng),
+        "price": rng.randrange(45000, 65000),
+        "taxes": rng.randrange(2000, 4000) + 0.5,
+        "fees": rng.randrange(1000, 2000) + 0.25,
+        "incentives": rng.choice([0, 7500]),
+        "referral": 500.0,
+        "order_url": f"https://www.tesla.com/my/order/7SAYGDEE{i:09d}",
+        "vin": f"7SAYGDEE{i:09d}"
+    } for i in range(n)]))
+
+
+def retained(build):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    kept = build()
+    gc.collect()
+    size = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(before, "filename"))
+    tracemalloc.stop()
+    return kept, size
+
+
+def main(n=100_000):
+    rows = api_rows(n)
+    legacy_rows = [{k: v for (k, v) in row.items() if k != "vin"} for row in rows]
+    _, legacy = retained(lambda: [LegacySummary(**row) for row in legacy_rows])
+    cars, slotted = retained(lambda: [TeslaSummary(**row) for row in rows])
+    _, columnar = retained(lambda: TeslaBatch(cars))
+    for name, size in (("legacy __dict__ records", legacy), ("__slots__ records", slotted), ("TeslaBatch", columnar)):
+        print(f"{name:>24}: {size / 2 ** 20:8.1f} MiB per {n} cars ({size / n:6.0f} B/car)")
+
+
+if __name__ == "__main__":
+    main()
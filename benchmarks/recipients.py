@@ -0,0 +1,87 @@
+import contextlib
+import io
+import random
+import sys
+import time
+
+from src.recipients import RecipientIndex
+from src.utils import REGEX_EMAIL, REGEX_PHONE, SMS_GATEWAYS
+
+WATCHES = ["rahway-my-lrawd", "rahway-m3-lrawd", "my/PAWD", "m3/RWD"]
+
+
+def synthetic_mailing_list(lines: int, seed: int = 5):
+    # Mostly plain emails, a fifth SMS gateways in assorted phone formats, some duplicates, subscriptions and junk
+    rng = random.Random(seed)
+    gateways = sorted(SMS_GATEWAYS)
+    out = []
+    for i in range(lines):
+        kind = rng.random()
+        if kind < 0.7:
+            line = f"first.last+{i}@mail{i % 97}.example.com"
+        elif kind < 0.9:
+            area, exchange, number = rng.randrange(201, 990), rng.randrange(100, 999), rng.randrange(0, 9999)
+            phone = rng.choice([f"{area}{exchange}{number:04d}", f"{area}-{exchange}-{number:04d}",
+                                f"({area}){exchange}-{number:04d}", f"+1{area}{exchange}{number:04d}"])
+            line = f"{phone}@{rng.choice(gateways)}"
+        elif kind < 0.97:
+            line = out[rng.randrange(len(out))].split(":")[0].upper() if out else "dup@example.com"
+        else:
+            line = rng.choice(["not an email", "a@b", "5551234567@example.com", "bad..dots@example.com"])
+        if rng.random() < 0.3:
+            line += ": " + ", ".join(rng.sample(WATCHES, k=rng.randrange(1, 3)))
+        out.append(line)
+    return "\n".join(out)
+
+
+def legacy_parse(recipients):
+    # The original parse_recipients: REGEX_EMAIL and REGEX_PHONE on every line, a print per bad one, no dedupe
+    email_list, sms_list = [], []
+    for recipient in recipients:
+        recipient = recipient.split(":")[0].strip()
+        matched = REGEX_EMAIL.match(recipient)
+        if matched is None:
+            print(f"WARNING: invalid email: {recipient}")
+            continue
+        local, domain = matched.groups()
+        known_sms_gateway = domain in SMS_GATEWAYS
+        matched = REGEX_PHONE.match(local)
+        cell_10_digit = None if matched is None else matched.group(3).strip("()") + matched.group(5) + matched.group(7)
+        if known_sms_gateway and cell_10_digit:
+            sms_list.append(f"{cell_10_digit}@{domain}")
+        elif not known_sms_gateway and not cell_10_digit:
+            email_list.append(recipient)
+        else:
+            print(f"WARNING: RECIPIENT IGNORED: {recipient}")
+    return email_list, sms_list
+
+
+def timed(label, fn, *args, **kwargs):
+    with contextlib.redirect_stdout(io.StringIO()):
+        started = time.perf_counter()
+        result = fn(*args, **kwargs)
+        elapsed = time.perf_counter() - started
+    print(f"{label:>40}: {elapsed * 1000:10.1f} ms")
+    return result
+
+
+def main(lines=100_000):
+    text = synthetic_mailing_list(lines)
+    print(f"{lines:,} lines, {len(text) / 2 ** 20:.1f} MiB")
+    emails, sms = timed("legacy parse_recipients", legacy_parse, text.split("\n"))
+    print(f"{'':>40}  {len(emails):,} emails, {len(sms):,} sms")
+    index = RecipientIndex()
+    timed("index: cold load", index.load, text)
+    print(f"{'':>40}  {len(index.emails):,} emails, {len(index.sms):,} sms after dedupe, {index.carriers()}")
+    timed("index: reload, unchanged", index.load, text)
+    edited = text.split("\n")
+    for i in range(0, len(edited), 100):
+        edited[i] = f"new.subscriber{i}@example.org"
+    timed("index: reload, 1% of lines changed", index.load, "\n".join(edited))
+    timed("index: recipients for one watch", index.for_watch, "rahway-my-lrawd", "my/LRAWD")
+    timed("index: same watch again (cached)", index.for_watch, "rahway-my-lrawd", "my/LRAWD")
+    print(f"{'stats':>40}: {index.stats}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
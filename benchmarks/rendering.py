@@ -0,0 +1,33 @@
+import time
+
+from src.tesla_results import ResultPage
+from testing.fixtures import synthetic_cars
+from testing.legacy import LEGACY_FORMS, legacy_format_page
+
+
+def main():
+    for n in (10, 1_000, 50_000):
+        cars = synthetic_cars(n)
+        page = ResultPage(timestamp="Oct 18, 3 PM", total=n, link="https://www.tesla.com/inventory/new/my", cars=cars)
+
+        start = time.perf_counter()
+        legacy = [legacy_format_page(page, *form) for form in LEGACY_FORMS] + \
+            [legacy_format_page(page, *LEGACY_FORMS[2])] * 2
+        legacy_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        # notify reads plain_text several times; memoized forms are rendered once
+        current = [page.html_long_form, page.html_short_form, page.plain_text, page.plain_text, page.plain_text]
+        elapsed = time.perf_counter() - start
+        assert current == legacy
+
+        start = time.perf_counter()
+        chunks = sum(1 for _ in page.stream("html_long_form"))
+        streamed = time.perf_counter() - start
+
+        print(f"cars={n:6d} legacy={legacy_elapsed * 1000:9.1f} ms precompiled+memoized={elapsed * 1000:9.1f} ms "
+              f"streamed html_long_form={streamed * 1000:9.1f} ms in {chunks} chunks")
+
+
+if __name__ == "__main__":
+    main()
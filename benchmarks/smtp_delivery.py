@@ -0,0 +1,47 @@
+import smtplib
+import time
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+
+from src.mailer import Mailer
+from testing.standins import LocalSMTPServer
+
+SENDER = "watcher@example.com"
+BODY = "<html><body>" + "<p>2023 Tesla Model Y Long Range AWD | $47,490.00</p>" * 10 + "</body></html>"
+
+
+def per_recipient_connections(port, recipients):
+    # The original delivery loop: a fresh connection per recipient, each mailing the whole list
+    for recipient in recipients:
+        msg = MIMEMultipart()
+        msg['From'] = SENDER
+        msg['To'] = recipient
+        msg['Subject'] = "Tesla"
+        msg.attach(MIMEText(BODY, 'html'))
+        with smtplib.SMTP(host="127.0.0.1", port=port) as server:
+            server.sendmail(SENDER, recipients, msg.as_string())
+
+
+def batched(port, recipients):
+    with Mailer(host="127.0.0.1", port=port, user=SENDER, password=None, starttls=False) as mailer:
+        return mailer.send("EMAIL", recipients, "Tesla", BODY)
+
+
+def main():
+    for count in (10, 100, 1000):
+        recipients = [f"user{i}@example.com" for i in range(count)]
+        for name, fn in (("per-recipient", per_recipient_connections), ("batched", batched)):
+            if name == "per-recipient" and count > 100:
+                continue
+            with LocalSMTPServer() as server:
+                start = time.perf_counter()
+                fn(server.port, recipients)
+                elapsed = time.perf_counter() - start
+                deliveries = sum(len(r) for (_, r, _) in server.messages)
+                print(f"{name:>14} recipients={count:5d} connections={server.connections:5d} "
+                      f"messages={len(server.messages):5d} deliveries={deliveries:7d} "
+                      f"elapsed={elapsed * 1000:9.1f} ms recipients/s={count / elapsed:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+import os
+import tempfile
+import time
+
+from src.cache import GeocodeCache
+from src.utils import enrich_address, timezone_finder
+
+ADDRESS = "1245 Main St, Rahway, Union County, NJ, US, 07065"
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "geocode.json")
+        cold = timed(enrich_address, ADDRESS, cache=GeocodeCache(path=path))
+        # a new process (fresh cache object, same file) with the TimezoneFinder already loaded
+        warm_process = timed(enrich_address, ADDRESS, cache=GeocodeCache(path=path))
+        timezone_finder.cache_clear()
+        # a new container: geocode cached on disk, but the timezone polygons must be loaded again
+        warm_disk = timed(enrich_address, ADDRESS, cache=GeocodeCache(path=path))
+        latitude, longitude, _ = enrich_address(ADDRESS, cache=GeocodeCache(path=path))
+        timezone_finder.cache_clear()
+        seeded = timed(lambda: timezone_finder().timezone_at(lng=longitude, lat=latitude))
+    print(f"cold (network geocode + timezone load): {cold * 1000:10.1f} ms")
+    print(f"warm (cached geocode, new process):     {warm_disk * 1000:10.1f} ms")
+    print(f"warm (cached geocode, same process):    {warm_process * 1000:10.1f} ms")
+    print(f"pre-seeded lat/lng (timezone only):     {seeded * 1000:10.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
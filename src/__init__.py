@@ -1,12 +1,31 @@
+from importlib import import_module
 from types import TracebackType
 from typing import Callable, List, Tuple, Optional, Type
 
-from src.incentives import federal_us, state_nj, state_ny
-from src.tesla_watcher import TeslaWatcher
-
 WSGI_START_RESPONSE_TYPEDEF = Callable[
     [str,
      List[Tuple[str, str]],
      Optional[tuple[Type[BaseException], BaseException, TracebackType] | tuple[None, None, None]]],
     Callable[[bytes], None]
 ]
+
+# Public names are resolved on first use, so importing the package (e.g. for `python -m src.main`) loads nothing else
+LAZY_EXPORTS = {
+    "TeslaWatcher": "src.tesla_watcher",
+    "WatchSet": "src.watch_set",
+    "INCENTIVES": "src.incentives",
+    "IncentiveTable": "src.incentives",
+}
+
+
+def __getattr__(name):
+    module = LAZY_EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(LAZY_EXPORTS))
@@ -0,0 +1,188 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class TTLCache:
+    def __init__(
+            self, max_entries: int = 1024, ttl_seconds: float = 60 * 60 * 24, clock: Callable[[], float] = time.time):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key: Hashable, default=None):
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            stored_at, value = entry
+            if now - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        with self._lock:
+            self._entries[key] = (self.clock() if stored_at is None else stored_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        with self._lock:
+            doomed = [k for k in self._entries if predicate is None or predicate(k)]
+            for key in doomed:
+                del self._entries[key]
+            return len(doomed)
+
+    def items(self):
+        with self._lock:
+            return [(k, stored_at, v) for (k, (stored_at, v)) in self._entries.items()]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+
+class TaxQuoteCache(TTLCache):
+    # Key: (country, state, city, postal, model_code, trim_code, vehicle_price) -> Value: (taxes, fees)
+
+    def __init__(
+            self,
+            path: Optional[str] = None,
+            download: Optional[Callable[[str], str]] = None,
+            upload: Optional[Callable[[str, str], None]] = None,
+            rules_version: str = "1",
+            **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.path = path
+        self.download = download
+        self.upload = upload
+        self.rules_version = rules_version
+        self.dirty = False
+
+    @staticmethod
+    def key(country, state, city, postal, model, trim, price) -> Tuple:
+        return country, state, city, postal, model, trim, int(price)
+
+    def put(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        super().put(key, value, stored_at)
+        self.dirty = True
+
+    def invalidate(self, predicate: Optional[Callable[[Hashable], bool]] = None) -> int:
+        dropped = super().invalidate(predicate)
+        self.dirty = self.dirty or bool(dropped)
+        return dropped
+
+    def dumps(self) -> str:
+        now = self.clock()
+        return json.dumps({
+            "version": self.rules_version,
+            "quotes": [[list(k), stored_at, list(v)] for (k, stored_at, v) in self.items()
+                       if now - stored_at <= self.ttl_seconds]
+        }, separators=(",", ":"))
+
+    def loads(self, text: str) -> int:
+        data = json.loads(text)
+        if data.get("version") != self.rules_version:
+            print(f"INFO: Discarding tax quotes cached under rules version {data.get('version')}")
+            return 0
+        now = self.clock()
+        loaded = 0
+        for key, stored_at, value in data.get("quotes", []):
+            if now - stored_at <= self.ttl_seconds:
+                super().put(tuple(key), tuple(value), stored_at)
+                loaded += 1
+        return loaded
+
+    def load(self) -> int:
+        if not (self.path and self.download):
+            return 0
+        # noinspection PyBroadException
+        try:
+            return self.loads(self.download(self.path))
+        except Exception as e:
+            print(f"Couldn't read cached tax quotes: {e}")
+            return 0
+
+    def save(self) -> None:
+        if not (self.path and self.upload and self.dirty):
+            return
+        # noinspection PyBroadException
+        try:
+            self.upload(self.path, self.dumps())
+            self.dirty = False
+        except Exception as e:
+            print(f"Couldn't save cached tax quotes: {e}")
+
+
+class GeocodeCache:
+    # address_text -> (latitude, longitude, timezone name); addresses don't move, so entries never expire
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._entries: Dict[str, Tuple[float, float, str]] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    def _load(self) -> None:
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path:
+            return
+        # noinspection PyBroadException
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self._entries.update({k: tuple(v) for (k, v) in json.load(f).items()})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Couldn't read geocode cache: {e}")
+
+    def get(self, address_text: str) -> Optional[Tuple[float, float, str]]:
+        with self._lock:
+            self._load()
+            return self._entries.get(address_text)
+
+    def put(self, address_text: str, latitude: float, longitude: float, timezone_name: str) -> None:
+        with self._lock:
+            self._load()
+            self._entries[address_text] = (latitude, longitude, timezone_name)
+            if not self.path:
+                return
+            # noinspection PyBroadException
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, separators=(",", ":"))
+                os.replace(tmp_path, self.path)
+            except Exception as e:
+                print(f"Couldn't save geocode cache: {e}")
@@ -0,0 +1,98 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from src.tesla_results import TeslaSummary
+from src.tesla_watcher import TeslaWatcher
+from src.utils import local_download_text, local_upload_text
+
+
+class InventoryCrawler:
+    # Streams the whole inventory for a watcher: fetch -> parse -> enrich -> sink, one page at a time.
+    # At most two pages are alive at once (the one being enriched and the prefetched next one).
+
+    def __init__(
+            self,
+            watcher: TeslaWatcher,
+            page_size: int = 50,
+            prefetch: bool = True,
+            offset: int = 0,
+            max_results: Optional[int] = None,
+            checkpoint_path: Optional[str] = None
+    ):
+        self.watcher = watcher
+        self.page_size = page_size
+        self.prefetch = prefetch
+        self.offset = offset
+        self.max_results = max_results
+        self.checkpoint_path = checkpoint_path
+        self.total: Optional[int] = None
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            self.resume()
+
+    @property
+    def query_id(self) -> str:
+        return self.watcher.tesla_search_page_params(offset=0, count=self.page_size)["query"]
+
+    def resume(self) -> None:
+        checkpoint = json.loads(local_download_text(self.checkpoint_path))
+        if checkpoint.get("query") == self.query_id:
+            self.offset = checkpoint["offset"]
+            print(f"INFO: Resuming crawl at offset {self.offset}")
+        else:
+            print("INFO: Ignoring checkpoint of a different query")
+
+    def checkpoint(self, done: bool = False) -> None:
+        if not self.checkpoint_path:
+            return
+        if done:
+            if os.path.exists(self.checkpoint_path):
+                os.remove(self.checkpoint_path)
+            return
+        local_upload_text(self.checkpoint_path, json.dumps({"query": self.query_id, "offset": self.offset}))
+
+    def remaining(self, offset: int) -> bool:
+        if self.max_results is not None and offset >= self.max_results:
+            return False
+        return self.total is None or offset < self.total
+
+    def page_count(self, offset: int) -> int:
+        if self.max_results is None:
+            return self.page_size
+        return max(0, min(self.page_size, self.max_results - offset))
+
+    def pages(self) -> Iterator[Dict[str, Any]]:
+        pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tesla-prefetch") if self.prefetch else None
+        try:
+            # bypasses the watcher's single-flight memo, which would otherwise hold on to every page of the crawl
+            fetch = (lambda o: self.watcher.fetch_page(self.watcher.tesla_search_page_params(o, self.page_count(o))))
+            pending = pool.submit(fetch, self.offset) if pool else None
+            while self.remaining(self.offset):
+                page = pending.result() if pool else fetch(self.offset)
+                self.total = page["total_matches_found"]
+                results = page["results"]
+                if not results:
+                    break
+                next_offset = self.offset + len(results)
+                pending = pool.submit(fetch, next_offset) if (pool and self.remaining(next_offset)) else None
+                yield page
+                # only advance (and checkpoint) once the consumer has finished with the page
+                self.offset = next_offset
+                self.checkpoint()
+            self.checkpoint(done=True)
+        finally:
+            if pool:
+                pool.shutdown(wait=False, cancel_futures=True)
+
+    def batches(self) -> Iterator[List[TeslaSummary]]:
+        for page in self.pages():
+            yield self.watcher.enrich_all(page["results"])
+
+    def crawl(self, sink: Callable[[List[TeslaSummary]], None]) -> int:
+        count = 0
+        for batch in self.batches():
+            sink(batch)
+            count += len(batch)
+            print(f"INFO: Crawled offset {self.offset}/{self.total} (enriched {count})")
+        return count
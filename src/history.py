@@ -0,0 +1,250 @@
+import argparse
+import os
+import sqlite3
+import sys
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Append-only price history. "observations" holds one row per VIN per run (compaction later drops the rows in the
+# middle of unchanged stretches); "vins" keeps each VIN's first/last sighting and prices up to date on every write, so
+# time-on-market and churn never need to scan observations; "runs" has one row per search with its total match count.
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS observations (
+        vin TEXT NOT NULL,
+        seen_at INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        trim TEXT NOT NULL,
+        zipcode TEXT NOT NULL,
+        price REAL NOT NULL,
+        taxes REAL NOT NULL,
+        fees REAL NOT NULL,
+        incentives REAL NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS observations_vin_seen ON observations (vin, seen_at)",
+    "CREATE INDEX IF NOT EXISTS observations_trim_price ON observations (model, trim, price)",
+    "CREATE INDEX IF NOT EXISTS observations_zipcode_seen ON observations (zipcode, seen_at)",
+    "CREATE INDEX IF NOT EXISTS observations_seen ON observations (seen_at)",
+    """CREATE TABLE IF NOT EXISTS vins (
+        vin TEXT PRIMARY KEY,
+        model TEXT NOT NULL,
+        trim TEXT NOT NULL,
+        zipcode TEXT NOT NULL,
+        first_seen INTEGER NOT NULL,
+        last_seen INTEGER NOT NULL,
+        first_price REAL NOT NULL,
+        last_price REAL NOT NULL,
+        min_price REAL NOT NULL
+    ) WITHOUT ROWID""",
+    "CREATE INDEX IF NOT EXISTS vins_trim_first_seen ON vins (model, trim, first_seen)",
+    "CREATE INDEX IF NOT EXISTS vins_trim_last_seen ON vins (model, trim, last_seen)",
+    """CREATE TABLE IF NOT EXISTS runs (
+        taken_at INTEGER NOT NULL,
+        model TEXT NOT NULL,
+        trim TEXT NOT NULL,
+        zipcode TEXT NOT NULL,
+        total INTEGER NOT NULL,
+        listed INTEGER NOT NULL
+    )""",
+    "CREATE INDEX IF NOT EXISTS runs_trim_taken ON runs (model, trim, zipcode, taken_at)",
+]
+
+INSERT_OBSERVATION = "INSERT INTO observations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+UPSERT_VIN = """INSERT INTO vins VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) ON CONFLICT (vin) DO UPDATE SET
+    first_seen = MIN(first_seen, excluded.first_seen),
+    first_price = CASE WHEN excluded.first_seen < first_seen THEN excluded.first_price ELSE first_price END,
+    last_seen = MAX(last_seen, excluded.last_seen),
+    last_price = CASE WHEN excluded.last_seen >= last_seen THEN excluded.last_price ELSE last_price END,
+    min_price = MIN(min_price, excluded.min_price)"""
+INSERT_RUN = "INSERT INTO runs VALUES (?, ?, ?, ?, ?, ?)"
+
+SECONDS_PER_DAY = 24 * 60 * 60
+
+
+class HistoryStore:
+    def __init__(self, path: str, batch_size: int = 5000):
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        # inserts land at random spots of the VIN indexes: keep their hot pages in memory rather than the default 2 MiB
+        self._db.execute("PRAGMA cache_size=-65536")
+        self._db.execute("PRAGMA temp_store=MEMORY")
+        for statement in SCHEMA:
+            self._db.execute(statement)
+        self._lock = threading.Lock()
+        self._observations: List[tuple] = []
+        self._vins: Dict[str, list] = {}
+        self._runs: List[tuple] = []
+        self.rows_written = 0
+
+    def record(self, cars: Iterable, seen_at: float, model: str, trim: str, zipcode: str,
+               total: Optional[int] = None) -> int:
+        # Buffers one search's results; rows reach the database batch_size at a time, or on flush()
+        seen_at = int(seen_at)
+        with self._lock:
+            listed = 0
+            for car in cars:
+                listed += 1
+                price = float(car.purchase_price)
+                self._observations.append((car.vin, seen_at, model, trim, zipcode, price, float(car.taxes_amount),
+                                           float(car.fees_amount), float(car.incentives_amount)))
+                vin = self._vins.get(car.vin)
+                if vin is None:
+                    self._vins[car.vin] = [car.vin, model, trim, zipcode, seen_at, seen_at, price, price, price]
+                else:  # seen again before the last batch was written: merge as the upsert would
+                    if seen_at >= vin[5]:
+                        vin[5], vin[7] = seen_at, price
+                    vin[8] = min(vin[8], price)
+            self._runs.append((seen_at, model, trim, zipcode, listed if total is None else total, listed))
+            if len(self._observations) >= self.batch_size:
+                self._write()
+        return listed
+
+    def flush(self) -> None:
+        with self._lock:
+            self._write()
+
+    def _write(self) -> None:
+        if not (self._observations or self._runs):
+            return
+        observations, vins, runs = self._observations, list(self._vins.values()), self._runs
+        with self._db:  # one transaction per batch
+            self._db.execute("BEGIN")
+            self._db.executemany(INSERT_OBSERVATION, observations)
+            self._db.executemany(UPSERT_VIN, vins)
+            self._db.executemany(INSERT_RUN, runs)
+        self.rows_written += len(observations)
+        self._observations, self._vins, self._runs = [], {}, []
+
+    def query(self, sql: str, params: tuple = ()) -> List[tuple]:
+        self.flush()
+        with self._lock:
+            return self._db.execute(sql, params).fetchall()
+
+    def price_history(self, vin: str) -> List[Tuple[int, float, float, float]]:
+        # [(seen_at, price, taxes, fees)], oldest first
+        return self.query("SELECT seen_at, price, taxes, fees FROM observations WHERE vin = ? ORDER BY seen_at",
+                          (vin,))
+
+    def listing(self, vin: str) -> Optional[dict]:
+        rows = self.query("SELECT first_seen, last_seen, first_price, last_price, min_price FROM vins WHERE vin = ?",
+                          (vin,))
+        if not rows:
+            return None
+        first_seen, last_seen, first_price, last_price, min_price = rows[0]
+        return {"vin": vin, "first_seen": first_seen, "last_seen": last_seen, "days_listed":
+                round((last_seen - first_seen) / SECONDS_PER_DAY, 2), "first_price": first_price,
+                "last_price": last_price, "min_price": min_price}
+
+    def cheapest_ever(self, model: str) -> List[Tuple[str, float, str, int]]:
+        # [(trim, price, vin, seen_at)]: one MIN() per trim, each a single seek on (model, trim, price)
+        trims = [trim for (trim,) in self.query("SELECT DISTINCT trim FROM runs WHERE model = ?", (model,))]
+        cheapest = []
+        for trim in sorted(trims):
+            cheapest.extend(self.query(
+                "SELECT trim, price, vin, seen_at FROM observations WHERE model = ? AND trim = ? "
+                "ORDER BY price LIMIT 1", (model, trim)))
+        return cheapest
+
+    def daily_counts(self, model: str, trim: str, zipcode: Optional[str] = None,
+                     since: float = 0) -> List[Tuple[str, int, int, int]]:
+        # [(UTC day, listed, new, gone)]: listed is the day's largest total from runs, new/gone come from first/last
+        # sightings in vins (a VIN still listed in the latest run isn't gone)
+        where, params = "model = ? AND trim = ?", (model, trim)
+        if zipcode is not None:
+            where, params = where + " AND zipcode = ?", params + (zipcode,)
+        latest = self.query(f"SELECT MAX(taken_at) FROM runs WHERE {where}", params)[0][0] or 0
+        days: Dict[str, List[int]] = {}
+        for day, listed in self.query(
+                f"SELECT date(taken_at, 'unixepoch'), MAX(total) FROM runs WHERE {where} AND taken_at >= ? "
+                f"GROUP BY 1", params + (int(since),)):
+            days.setdefault(day, [0, 0, 0])[0] = listed
+        for day, new in self.query(
+                f"SELECT date(first_seen, 'unixepoch'), COUNT(*) FROM vins WHERE {where} AND first_seen >= ? "
+                f"GROUP BY 1", params + (int(since),)):
+            days.setdefault(day, [0, 0, 0])[1] = new
+        for day, gone in self.query(
+                f"SELECT date(last_seen, 'unixepoch'), COUNT(*) FROM vins WHERE {where} AND last_seen >= ? "
+                f"AND last_seen < ? GROUP BY 1", params + (int(since), latest)):
+            days.setdefault(day, [0, 0, 0])[2] = gone
+        return [(day, *counts) for (day, counts) in sorted(days.items())]
+
+    def compact(self, older_than_seconds: float = 30 * SECONDS_PER_DAY, vacuum: bool = True) -> int:
+        # Drops observations strictly inside a stretch where a VIN's price, taxes and fees didn't change: the first
+        # and last sighting of every stretch remain, so price history, first/last seen and cheapest-ever are unchanged
+        cutoff = int(time.time() - older_than_seconds)
+        self.flush()
+        with self._lock:
+            with self._db:
+                self._db.execute("BEGIN")
+                deleted = self._db.execute("""DELETE FROM observations WHERE rowid IN (
+                    SELECT id FROM (
+                        SELECT rowid AS id, seen_at, price, taxes, fees,
+                            LAG(price) OVER w AS prev_price, LAG(taxes) OVER w AS prev_taxes,
+                            LAG(fees) OVER w AS prev_fees, LEAD(price) OVER w AS next_price,
+                            LEAD(taxes) OVER w AS next_taxes, LEAD(fees) OVER w AS next_fees
+                        FROM observations
+                        WHERE seen_at < ?
+                        WINDOW w AS (PARTITION BY vin ORDER BY seen_at)
+                    )
+                    WHERE price = prev_price AND taxes = prev_taxes AND fees = prev_fees
+                        AND price = next_price AND taxes = next_taxes AND fees = next_fees
+                )""", (cutoff,)).rowcount
+            if vacuum and deleted:
+                self._db.execute("VACUUM")
+            self._db.execute("PRAGMA optimize")
+        return deleted
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._db.close()
+
+
+@lru_cache(maxsize=None)
+def open_history(path: Optional[str]) -> Optional[HistoryStore]:
+    # One store per file per process, shared by every watch writing to it
+    return HistoryStore(path) if path else None
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="python -m src.history")
+    parser.add_argument("path", help="history database (SQLite)")
+    commands = parser.add_subparsers(dest="command", required=True)
+    compact = commands.add_parser("compact", help="drop unchanged observations older than --days")
+    compact.add_argument("--days", type=float, default=30)
+    vin = commands.add_parser("vin", help="price history of a VIN")
+    vin.add_argument("vin")
+    cheapest = commands.add_parser("cheapest", help="cheapest price ever seen per trim")
+    cheapest.add_argument("model")
+    daily = commands.add_parser("daily", help="listed/new/gone per day")
+    daily.add_argument("model")
+    daily.add_argument("trim")
+    daily.add_argument("--zipcode")
+    args = parser.parse_args(argv)
+    store = HistoryStore(args.path)
+    try:
+        if args.command == "compact":
+            print(f"Compacted: {store.compact(older_than_seconds=args.days * SECONDS_PER_DAY)} observations dropped")
+        elif args.command == "vin":
+            print(store.listing(args.vin))
+            for seen_at, price, taxes, fees in store.price_history(args.vin):
+                print(f"{time.strftime('%Y-%m-%d %H:%M', time.gmtime(seen_at))} ${price:,.2f} "
+                      f"(taxes ${taxes:,.2f}, fees ${fees:,.2f})")
+        elif args.command == "cheapest":
+            for trim, price, vin_, seen_at in store.cheapest_ever(args.model):
+                print(f"{trim}: ${price:,.2f} {vin_} on {time.strftime('%Y-%m-%d', time.gmtime(seen_at))}")
+        elif args.command == "daily":
+            for day, listed, new, gone in store.daily_counts(args.model, args.trim, zipcode=args.zipcode):
+                print(f"{day} listed={listed} new={new} gone={gone}")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
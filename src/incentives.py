@@ -1,24 +1,145 @@
+import json
+import math
+from array import array
+from bisect import bisect_right
+from datetime import date
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
+# Declarative incentive rules. A rule applies to every car sold in its jurisdiction (country, plus optionally state,
+# county and city) that matches its model/trim codes (None: any) on a date within [effective_from, effective_to).
+# "bands" are (upper price bound, amount) pairs in ascending order: a car priced strictly below a bound gets the amount
+# of the first such band; a bound of None means no upper limit.
+RULES = [
+    {"name": "federal_us", "country": "US", "bands": [[55000, 7500]]},
+    {"name": "state_nj", "country": "US", "state": "NJ", "bands": [[45000, 4000], [55000, 1500]]},
+    {"name": "state_ny", "country": "US", "state": "NY", "bands": [[42000, 2000], [80000, 500]]},
+]
 
-def federal_us(car, country, state, county, city):
-    if country == "US" and int(car["PurchasePrice"]) < 55000:
-        return 7500
+Jurisdiction = Tuple[str, Optional[str], Optional[str], Optional[str]]
 
 
-def state_nj(car, country, state, county, city):
-    if country == "US" and state == "NJ":
-        if int(car["PurchasePrice"]) < 45000:
-            return 4000
-        if int(car["PurchasePrice"]) < 55000:
-            return 1500
+def normalize(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    name = name.strip().upper()
+    return name[:-len(" COUNTY")] if name.endswith(" COUNTY") else name
 
 
-def state_ny(car, country, state, county, city):
-    if country == "US" and state == "NY":
-        if int(car["PurchasePrice"]) < 42000:
-            return 2000
-        if int(car["PurchasePrice"]) < 80000:
-            return 500
+class IncentiveRule:
+    def __init__(
+            self,
+            name: str,
+            country: str,
+            bands: List[List[Optional[float]]],
+            state: Optional[str] = None,
+            county: Optional[str] = None,
+            city: Optional[str] = None,
+            models: Optional[List[str]] = None,
+            trims: Optional[List[str]] = None,
+            effective_from: Optional[str] = None,
+            effective_to: Optional[str] = None
+    ):
+        self.name = name
+        self.jurisdiction: Jurisdiction = (normalize(country), normalize(state), normalize(county), normalize(city))
+        self.models = frozenset(models) if models else None
+        self.trims = frozenset(trims) if trims else None
+        self.effective_from = date.fromisoformat(effective_from) if effective_from else date.min
+        self.effective_to = date.fromisoformat(effective_to) if effective_to else date.max
+        self.thresholds = [math.inf if upper is None else float(upper) for (upper, _) in bands]
+        self.amounts = [float(amount) for (_, amount) in bands]
+        if self.thresholds != sorted(self.thresholds):
+            raise ValueError(f"Incentive bands must be in ascending price order: Rule={name}")
 
+    def applies(self, model: Optional[str], trim: Optional[str], on: date) -> bool:
+        return ((self.models is None or model in self.models)
+                and (self.trims is None or trim in self.trims)
+                and self.effective_from <= on < self.effective_to)
 
-INCENTIVES = [federal_us, state_nj, state_ny]
+    def amount_for(self, price: float) -> float:
+        i = bisect_right(self.thresholds, price)
+        return self.amounts[i] if i < len(self.amounts) else 0.0
+
+
+class StepFunction:
+    # Sum of several rules' bands merged into one piecewise-constant function of price: one bisect per car
+
+    def __init__(self, rules: Sequence[IncentiveRule]):
+        self.rules = [rule.name for rule in rules]
+        self.breakpoints = sorted({t for rule in rules for t in rule.thresholds if t != math.inf})
+        representatives = [-math.inf] + self.breakpoints
+        self.values = [sum(rule.amount_for(p) for rule in rules) for p in representatives]
+
+    def __call__(self, price: float) -> float:
+        return self.values[bisect_right(self.breakpoints, price)]
+
+    def batch(self, prices: Sequence[float]) -> array:
+        # Sort once, then sweep the breakpoints: each price is visited exactly once
+        totals = array("d", bytes(8 * len(prices)))
+        order = sorted(range(len(prices)), key=prices.__getitem__)
+        k, breakpoints, values = 0, self.breakpoints, self.values
+        for i in order:
+            price = prices[i]
+            while k < len(breakpoints) and price >= breakpoints[k]:
+                k += 1
+            totals[i] = values[k]
+        return totals
+
+
+class LocalIncentives:
+    def __init__(self, rules: List[IncentiveRule]):
+        self.rules = rules
+        self._compiled: Dict[Tuple[Optional[str], Optional[str], date], StepFunction] = {}
+
+    def compiled(self, model: Optional[str], trim: Optional[str], on: date) -> StepFunction:
+        key = (model, trim, on)
+        step = self._compiled.get(key)
+        if step is None:
+            step = self._compiled[key] = StepFunction([r for r in self.rules if r.applies(model, trim, on)])
+        return step
+
+    def evaluate(self, price: float, model: Optional[str] = None, trim: Optional[str] = None,
+                 on: Optional[date] = None) -> float:
+        return self.compiled(model, trim, on or date.today())(float(price))
+
+    def evaluate_batch(self, prices: Sequence[float], models: Sequence[Optional[str]],
+                       trims: Sequence[Optional[str]], on: Optional[date] = None) -> array:
+        on = on or date.today()
+        groups: Dict[Tuple[Optional[str], Optional[str]], List[int]] = {}
+        for i, key in enumerate(zip(models, trims)):
+            groups.setdefault(key, []).append(i)
+        totals = array("d", bytes(8 * len(prices)))
+        for (model, trim), indices in groups.items():
+            for i, amount in zip(indices, self.compiled(model, trim, on).batch([float(prices[i]) for i in indices])):
+                totals[i] = amount
+        return totals
+
+
+class IncentiveTable:
+    def __init__(self, rules: Iterable[dict]):
+        self.index: Dict[Jurisdiction, List[IncentiveRule]] = {}
+        for spec in rules:
+            rule = IncentiveRule(**spec)
+            self.index.setdefault(rule.jurisdiction, []).append(rule)
+
+    def __len__(self):
+        return sum(map(len, self.index.values()))
+
+    @classmethod
+    def load(cls, path: str) -> "IncentiveTable":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    @lru_cache(maxsize=4096)
+    def for_location(self, country: str, state: Optional[str] = None, county: Optional[str] = None,
+                     city: Optional[str] = None) -> LocalIncentives:
+        country, state, county, city = map(normalize, (country, state, county, city))
+        levels = [(country, None, None, None), (country, state, None, None),
+                  (country, state, county, None), (country, state, county, city)]
+        rules = []
+        for level in dict.fromkeys(levels):
+            rules.extend(self.index.get(level, []))
+        return LocalIncentives(rules)
+
+
+INCENTIVES = IncentiveTable(RULES)
@@ -0,0 +1,146 @@
+import smtplib
+import threading
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from typing import Dict, List, Optional, Tuple
+
+
+class DeliveryReport:
+    def __init__(self, channel: str):
+        self.channel = channel
+        self.delivered: List[str] = []
+        self.failed: Dict[str, Tuple[int, str]] = {}
+        self.messages = 0
+        self.reconnects = 0
+
+    @property
+    def ok(self) -> bool:
+        return not self.failed
+
+    def __repr__(self):
+        return (f"DeliveryReport(channel={self.channel}, messages={self.messages}, delivered={len(self.delivered)}, "
+                f"failed={self.failed}, reconnects={self.reconnects})")
+
+
+class Mailer:
+    def __init__(
+            self,
+            host: str,
+            user: Optional[str],
+            password: Optional[str],
+            port: int = 587,
+            starttls: bool = True,
+            timeout_seconds: int = 60,
+            bcc_chunk_size: int = 50,
+            max_reconnects: int = 2
+    ):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout_seconds = timeout_seconds
+        self.bcc_chunk_size = max(1, bcc_chunk_size)
+        self.max_reconnects = max_reconnects
+        self.connections_opened = 0
+        self._server: Optional[smtplib.SMTP] = None
+        self._lock = threading.RLock()
+
+    def clone(self) -> "Mailer":
+        # Same server and account, its own session and lock: channels sending in parallel don't wait on each other
+        return Mailer(host=self.host, user=self.user, password=self.password, port=self.port, starttls=self.starttls,
+                      timeout_seconds=self.timeout_seconds, bcc_chunk_size=self.bcc_chunk_size,
+                      max_reconnects=self.max_reconnects)
+
+    def connection(self) -> smtplib.SMTP:
+        with self._lock:
+            if self._server is None:
+                server = smtplib.SMTP(host=self.host, port=self.port, timeout=self.timeout_seconds)
+                try:
+                    if self.starttls:
+                        server.starttls()
+                    if self.user and self.password:
+                        server.login(self.user, self.password)
+                except Exception:
+                    server.close()
+                    raise
+                self._server = server
+                self.connections_opened += 1
+            return self._server
+
+    def sendmail(self, recipients: List[str], message: str) -> dict:
+        with self._lock:
+            return self.connection().sendmail(self.user, recipients, message)
+
+    def compose(self, subject_line: str, html_body: str) -> str:
+        # Recipients only go on the envelope (BCC), so one rendered message serves every chunk
+        msg = MIMEMultipart()
+        msg['From'] = self.user
+        msg['To'] = self.user
+        msg['Subject'] = subject_line
+        msg.attach(MIMEText(html_body, 'html'))
+        return msg.as_string()
+
+    def send(self, channel: str, recipients: List[str], subject_line: str, html_body: str) -> DeliveryReport:
+        report = DeliveryReport(channel=channel)
+        message = self.compose(subject_line=subject_line, html_body=html_body)
+        unique = list(dict.fromkeys(recipients))
+        for i in range(0, len(unique), self.bcc_chunk_size):
+            self.send_chunk(unique[i:i + self.bcc_chunk_size], message, report)
+        return report
+
+    def send_chunk(self, chunk: List[str], message: str, report: DeliveryReport) -> None:
+        attempt = 0
+        with self._lock:
+            while True:
+                try:
+                    refused = self.connection().sendmail(self.user, chunk, message)
+                    break
+                except smtplib.SMTPRecipientsRefused as e:
+                    refused = e.recipients
+                    report.failed.update({r: (code, self.decode(reason)) for (r, (code, reason)) in refused.items()})
+                    return
+                except smtplib.SMTPResponseException as e:
+                    if not isinstance(e, smtplib.SMTPConnectError):
+                        # Sender or data rejected: this chunk is lost, start the next one on a fresh session
+                        report.failed.update({r: (e.smtp_code, self.decode(e.smtp_error)) for r in chunk})
+                        self.reset()
+                        return
+                    error = e
+                except OSError as e:  # disconnects, timeouts and other socket errors (SMTPServerDisconnected included)
+                    error = e
+                self.reset()
+                attempt += 1
+                if attempt > self.max_reconnects:
+                    report.failed.update({r: (-1, repr(error)) for r in chunk})
+                    return
+                report.reconnects += 1
+        report.messages += 1
+        report.failed.update({r: (code, self.decode(reason)) for (r, (code, reason)) in refused.items()})
+        report.delivered.extend(r for r in chunk if r not in refused)
+
+    @staticmethod
+    def decode(reason) -> str:
+        return reason.decode("utf-8", "replace") if isinstance(reason, bytes) else str(reason)
+
+    def reset(self) -> None:
+        with self._lock:
+            if self._server is not None:
+                self._server.close()
+                self._server = None
+
+    def close(self) -> None:
+        with self._lock:
+            if self._server is not None:
+                # noinspection PyBroadException
+                try:
+                    self._server.quit()
+                except Exception:
+                    self._server.close()
+                self._server = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,8 +1,34 @@
+import argparse
+import json
+import os
 import sys
-from typing import Dict
+import threading
+from typing import TYPE_CHECKING, Dict, Optional
 
 from src import WSGI_START_RESPONSE_TYPEDEF
-from src.tesla_watcher import backoff_random, TeslaWatcher
+from src.metrics import METRICS
+from src.service import ResultService
+from src.tesla_watcher import TeslaWatcher
+from src.utils import backoff_random
+from src.watch_set import WatchSet
+
+if TYPE_CHECKING:  # asyncio is only needed in scheduled mode
+    from src.scheduler import FixedRate
+
+DEFAULT_WATCH = dict(
+    street="1245 Main St",
+    city="Rahway",
+    county="Union",
+    state="NJ",
+    country="US",
+    zipcode="07065",
+    model="my",
+    trim="LRAWD"
+)
+APP = None
+SERVICE = None
+APP_LOCK = threading.Lock()
+NOTIFY_DRAIN_SECONDS = 30.0
 
 
 def repeat(run_count=-1, interval_seconds=(60 * 60 * 3)):
@@ -18,35 +44,132 @@ def repeat(run_count=-1, interval_seconds=(60 * 60 * 3)):
             backoff_random()
 
 
-def app(environ: Dict[str, str], start_response: WSGI_START_RESPONSE_TYPEDEF):
-    status = "200 OK"
-    data = f"Notifications Sent"
+def scheduled(schedule: "FixedRate", timeout_seconds: Optional[float] = None):
+    from src.scheduler import AsyncScheduler
+    scheduler = AsyncScheduler()
+    if isinstance(APP, WatchSet):
+        APP.schedule(scheduler, schedule, timeout_seconds=timeout_seconds)
+    else:
+        scheduler.add("watch", APP.run, schedule, timeout_seconds=timeout_seconds)
+    scheduler.run()
+    APP.storage.flush(timeout_seconds=scheduler.grace_seconds)
+    APP.notifier.close(timeout_seconds=scheduler.grace_seconds)
+    if scheduler.abandoned:
+        # the abandoned run's HTTP pool threads would be joined at interpreter exit: don't outlive the grace period
+        sys.stdout.flush()
+        os._exit(0)
+
+
+def run_pages():
+    app_instance = get_app()
+    try:
+        app_instance.run()
+    finally:
+        # serving: CPU may be throttled once the response is out, so don't leave uploads or notifications queued
+        # behind it (bounded: a retry may be scheduled minutes out, and close() dead-letters it at shutdown)
+        app_instance.storage.flush()
+        if not app_instance.notifier.drain(NOTIFY_DRAIN_SECONDS):
+            print(f"WARNING: Notifications still pending after the run: {app_instance.notifier.pending()}")
+    if isinstance(app_instance, WatchSet):
+        return {name: watcher.last_page for (name, watcher) in app_instance.watchers.items()}
+    return {"watch": app_instance.last_page}
+
+
+def get_app():
+    global APP
+    with APP_LOCK:
+        if APP is None:
+            config = os.environ.get("TESLA_WATCHER_CONFIG")
+            APP = WatchSet.from_config(config) if config else TeslaWatcher(**DEFAULT_WATCH)
+        return APP
+
+
+def get_service() -> ResultService:
+    # created on first request rather than on import, so importing the module doesn't touch the state directory
+    global SERVICE
+    with APP_LOCK:
+        if SERVICE is None:
+            state_dir = os.environ.get("TESLA_WATCHER_STATE_DIR", "/tmp/tesla_watcher")
+            SERVICE = ResultService(runner=run_pages, state_dir=state_dir)
+        return SERVICE
+
+
+def respond(start_response, status, body: bytes, content_type="text/plain", headers=()):
     response_headers = [
-        ("Content-type", "text/plain"),
-        ("Content-Length", str(len(data)))
+        ("Content-type", content_type),
+        ("Content-Length", str(len(body))),
+        *headers
     ]
     exc_info = sys.exc_info()
     if all(e is None for e in exc_info):
         exc_info = None
     start_response(status, response_headers, exc_info)
-    return iter([data.encode("utf-8")])
+    return iter([body])
+
+
+def app(environ: Dict[str, str], start_response: WSGI_START_RESPONSE_TYPEDEF):
+    method = environ.get("REQUEST_METHOD", "GET")
+    path = environ.get("PATH_INFO", "/").rstrip("/") or "/"
+    if path == "/run":
+        # POST only: crawlers and link prefetchers follow GETs, and each one would start a scrape
+        if method != "POST":
+            return respond(start_response, "405 Method Not Allowed", b"Use POST /run", headers=[("Allow", "POST")])
+        try:
+            status, published = get_service().trigger()
+        except Exception as e:
+            print(f"All attempts failed: Error={repr(e)}")
+            return respond(start_response, "502 Bad Gateway", f"Run failed: {repr(e)}".encode("utf-8"))
+        data = {"status": status, "etag": published.json_etag if published else None}
+        return respond(start_response, "200 OK", json.dumps(data).encode("utf-8"), "application/json")
+    if path in ("/", "/results", "/results.json") and method in ("GET", "HEAD"):
+        published = get_service().latest()
+        if published is None:
+            return respond(start_response, "404 Not Found", b"No results yet; POST /run first")
+        as_json = path == "/results.json"
+        body, etag = (published.json_body, published.json_etag) if as_json else \
+            (published.html_body, published.html_etag)
+        cache_headers = [("ETag", etag), ("Cache-Control", "no-cache")]
+        if etag in [tag.strip() for tag in environ.get("HTTP_IF_NONE_MATCH", "").split(",")]:
+            start_response("304 Not Modified", cache_headers, None)
+            return iter([])
+        content_type = "application/json" if as_json else "text/html; charset=utf-8"
+        return respond(start_response, "200 OK", b"" if method == "HEAD" else body, content_type, cache_headers)
+    if path == "/metrics" and method == "GET":
+        # per worker process: with several gunicorn workers, each scrape sees one worker's counters
+        body = METRICS.to_prometheus().encode("utf-8")
+        return respond(start_response, "200 OK", body, "text/plain; version=0.0.4; charset=utf-8")
+    if path == "/healthz":
+        return respond(start_response, "200 OK", b"ok")
+    return respond(start_response, "404 Not Found", b"Not Found")
 
 
 def simulate_wsgi_request():
-    response = app(dict(), lambda x, y, z: lambda w: print(w))
+    response = app(dict(REQUEST_METHOD="POST", PATH_INFO="/run"), lambda x, y, z: lambda w: print(w))
     for out_line in response:
         print(out_line.decode('utf-8'))
 
 
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog="python -m src.main")
+    parser.add_argument("config", nargs="?", help="watch set config (local path or GCS bucket/path)")
+    parser.add_argument("--every", type=float, metavar="SECONDS", help="run at a fixed rate instead of once")
+    parser.add_argument("--cron", metavar="EXPRESSION", help="run on a 5-field cron schedule (UTC) instead of once")
+    parser.add_argument("--jitter", type=float, default=0.0, metavar="SECONDS", help="random delay added to each run")
+    parser.add_argument("--timeout", type=float, metavar="SECONDS", help="abandon runs that take longer than this")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
-    APP = TeslaWatcher(
-        street="1245 Main St",
-        city="Rahway",
-        county="Union",
-        state="NJ",
-        country="US",
-        zipcode="07065",
-        model="my",
-        trim="LRAWD"
-    )
-    repeat(run_count=1)
+    ARGS = parse_args(sys.argv[1:])
+    if ARGS.config:
+        os.environ["TESLA_WATCHER_CONFIG"] = ARGS.config
+    APP = get_app()
+    if ARGS.cron:
+        from src.scheduler import Cron
+        scheduled(Cron(ARGS.cron, jitter_seconds=ARGS.jitter), timeout_seconds=ARGS.timeout)
+    elif ARGS.every:
+        from src.scheduler import FixedRate
+        scheduled(FixedRate(ARGS.every, jitter_seconds=ARGS.jitter), timeout_seconds=ARGS.timeout)
+    else:
+        repeat(run_count=1)
+        APP.notifier.close()  # a one-shot run exits only once its notifications are out (or dead-lettered)
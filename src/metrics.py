@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+MAX_RUN_SPANS = 2000  # per run report; the histograms still see every span
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def labels_of(**labels) -> Labels:
+    return tuple(sorted((k, str(v)) for (k, v) in labels.items()))
+
+
+def escape_label(value: str) -> str:
+    # the exposition format's escapes for label values: backslash, double quote and line feed
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{escape_label(v)}"' for (k, v) in pairs) + "}"
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        total, out = 0, []
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            total += count
+            out.append((bound, total))
+        return out
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(self, prefix: str = "tesla_watcher"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        key = (name, labels_of(**labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, labels_of(**labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def tracer(self, **labels) -> "Tracer":
+        return Tracer(self, **labels)
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        for name in sorted({n for ((n, _), _) in counters}):
+            lines.append(f"# TYPE {self.prefix}_{name} counter")
+            lines.extend(f"{self.prefix}_{name}{format_labels(labels)} {value}"
+                         for ((n, labels), value) in counters if n == name)
+        for name in sorted({n for ((n, _), _) in histograms}):
+            lines.append(f"# TYPE {self.prefix}_{name} histogram")
+            for (n, labels), histogram in histograms:
+                if n != name:
+                    continue
+                for bound, total in histogram.cumulative():
+                    lines.append(f"{self.prefix}_{name}_bucket{format_labels(labels, ('le', bound))} {total}")
+                lines.append(f"{self.prefix}_{name}_sum{format_labels(labels)} {histogram.sum}")
+                lines.append(f"{self.prefix}_{name}_count{format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    # Per-watcher view: spans of the current run for the JSON report, aggregates into the shared Metrics.
+    # Spans outside start_run()/end_run() (a crawl, deliveries on the notifier's workers) only go to the aggregates,
+    # so callers that never run don't accumulate them.
+
+    def __init__(self, metrics: Metrics, max_spans: int = MAX_RUN_SPANS, **labels):
+        self.metrics = metrics
+        self.labels = labels
+        self.max_spans = max_spans
+        self._lock = threading.Lock()
+        self.spans: List[dict] = []
+        self.spans_dropped = 0
+        self.run_started: Optional[float] = None
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        self.metrics.count(name, value, **self.labels, **labels)
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = type(e).__name__
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.metrics.observe("span_seconds", elapsed, span=name, **self.labels)
+            if error:
+                self.metrics.count("span_errors_total", span=name, error=error, **self.labels)
+            with self._lock:
+                if self.run_started is not None and len(self.spans) >= self.max_spans:
+                    self.spans_dropped += 1
+                elif self.run_started is not None:
+                    self.spans.append({
+                        "span": name,
+                        "start": round(started - self.run_started, 6),
+                        "seconds": round(elapsed, 6),
+                        "error": error,
+                        **labels
+                    })
+
+    def start_run(self) -> None:
+        with self._lock:
+            self.spans = []
+            self.spans_dropped = 0
+            self.run_started = time.perf_counter()
+
+    def end_run(self) -> None:
+        # the spans stay for report() until the next start_run()
+        with self._lock:
+            self.run_started = None
+
+    def report(self, **extra) -> dict:
+        with self._lock:
+            spans, dropped = list(self.spans), self.spans_dropped
+        by_span: Dict[str, List[float]] = {}
+        for span in spans:
+            by_span.setdefault(span["span"], []).append(span["seconds"])
+        return {
+            **self.labels,
+            **extra,
+            "stages": {name: {"count": len(times), "total_seconds": round(sum(times), 6),
+                              "max_seconds": round(max(times), 6)}
+                       for (name, times) in by_span.items()},
+            "spans": spans,
+            "spans_dropped": dropped
+        }
+
+    def report_json(self, **extra) -> str:
+        return json.dumps(self.report(**extra), separators=(",", ":"))
+
+
+class NullMetrics(Metrics):
+    enabled = False
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        pass
+
+    def tracer(self, **labels) -> "Tracer":
+        return NullTracer(self, **labels)
+
+
+class NullTracer(Tracer):
+    # Turned off: every hook is a constant-time no-op, and span() hands back one shared context manager
+    _NULL_SPAN = nullcontext()
+
+    def count(self, name: str, value: float = 1, **labels) -> None:
+        pass
+
+    def span(self, name: str, **labels):
+        return self._NULL_SPAN
+
+    def start_run(self) -> None:
+        pass
+
+    def end_run(self) -> None:
+        pass
+
+
+METRICS = Metrics() if os.environ.get("TESLA_WATCHER_METRICS", "1") != "0" else NullMetrics()
@@ -0,0 +1,358 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+import requests
+
+from src.mailer import Mailer
+from src.metrics import METRICS, Metrics
+from src.ratelimit import Backoff, retry_after_seconds
+from src.utils import SMS_GATEWAYS
+
+# Carrier email-to-SMS gateways silently drop or block bursts: (messages, per seconds) for each phone number
+SMS_RATE_LIMITS = {domain: (1, 5 * 60) for domain in SMS_GATEWAYS} | {"vtext.com": (1, 10 * 60)}
+DEFAULT_SMS_RATE_LIMIT = (1, 5 * 60)
+
+
+class Notification:
+    def __init__(
+            self,
+            channel: str,
+            recipients: List[str],
+            subject: str,
+            body: str,
+            created_at: Optional[float] = None
+    ):
+        self.channel = channel
+        self.recipients = list(dict.fromkeys(recipients))
+        self.subject = subject
+        self.body = body
+        self.created_at = created_at or time.time()
+        self.attempts = 0
+        self.errors: Dict[str, str] = {}
+
+    def for_recipients(self, recipients: List[str]) -> "Notification":
+        retry = Notification(self.channel, recipients, self.subject, self.body, self.created_at)
+        retry.attempts = self.attempts
+        retry.errors = {r: e for (r, e) in self.errors.items() if r in recipients}
+        return retry
+
+    def to_dict(self) -> dict:
+        return {"channel": self.channel, "recipients": self.recipients, "subject": self.subject,
+                "created_at": self.created_at, "attempts": self.attempts, "errors": self.errors, "body": self.body}
+
+
+class Delivery:
+    # What a sink did with a notification: failed recipients are retried, rejected ones dead-lettered at once and
+    # deferred ones retried no earlier than the given number of seconds
+    def __init__(self):
+        self.delivered: List[str] = []
+        self.failed: Dict[str, str] = {}
+        self.rejected: Dict[str, str] = {}
+        self.deferred: Dict[str, float] = {}
+
+
+class MailSink:
+    def __init__(self, mailer: Mailer, channel: str = "EMAIL", metrics: Metrics = METRICS):
+        self.mailer = mailer
+        self.channel = channel
+        self.tracer = metrics.tracer()
+
+    def deliver(self, notification: Notification, delivery: Delivery) -> None:
+        try:
+            with self.tracer.span("smtp_send", channel=self.channel):
+                report = self.mailer.send(
+                    self.channel, notification.recipients, notification.subject, notification.body)
+        except Exception as e:
+            self.mailer.reset()
+            delivery.failed.update({r: repr(e) for r in notification.recipients})
+            return
+        self.tracer.count("smtp_reconnects_total", report.reconnects, channel=self.channel)
+        delivery.delivered.extend(report.delivered)
+        for recipient, (code, reason) in report.failed.items():
+            # 5xx is the server's final word on a recipient; anything else (4xx, lost connection) may go through later
+            (delivery.rejected if 500 <= code < 600 else delivery.failed)[recipient] = f"{code} {reason}"
+
+    def idle(self) -> None:
+        # Runs are hours apart: don't keep an SMTP session open in between
+        self.mailer.close()
+
+
+class SMSSink(MailSink):
+    def __init__(self, mailer: Mailer, limits: Optional[Dict[str, Tuple[int, float]]] = None, clock=time.time,
+                 metrics: Metrics = METRICS):
+        super().__init__(mailer, channel="SMS", metrics=metrics)
+        self.limits = SMS_RATE_LIMITS | (limits or {})
+        self.clock = clock
+        self.sent: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def wait_for(self, recipient: str, now: float) -> float:
+        # sliding window per phone number; reserves the slot when the send is allowed (see release)
+        messages, per_seconds = self.limits.get(recipient.rsplit("@", 1)[-1], DEFAULT_SMS_RATE_LIMIT)
+        with self._lock:
+            sent = self.sent.setdefault(recipient, deque())
+            while sent and now - sent[0] >= per_seconds:
+                sent.popleft()
+            if len(sent) >= messages:
+                return sent[0] + per_seconds - now
+            sent.append(now)
+            return 0.0
+
+    def release(self, recipient: str, reserved_at: float) -> None:
+        # nothing reached the phone: the retry mustn't wait out a window the failed send never used
+        with self._lock:
+            sent = self.sent.get(recipient)
+            if sent and reserved_at in sent:
+                sent.remove(reserved_at)
+
+    def deliver(self, notification: Notification, delivery: Delivery) -> None:
+        now = self.clock()
+        allowed = []
+        for recipient in notification.recipients:
+            wait = self.wait_for(recipient, now)
+            if wait > 0:
+                delivery.deferred[recipient] = wait
+            else:
+                allowed.append(recipient)
+        if allowed:
+            super().deliver(notification.for_recipients(allowed), delivery)
+        for recipient in allowed:
+            if recipient in delivery.failed or recipient in delivery.rejected:
+                self.release(recipient, now)
+
+
+class WebhookSink:
+    # POSTs the notification as JSON to every recipient URL
+    def __init__(self, session: Optional[requests.Session] = None, timeout_seconds: float = 10.0):
+        self.session = session or requests.Session()
+        self.timeout_seconds = timeout_seconds
+
+    def payload(self, notification: Notification) -> Any:
+        return {"subject": notification.subject, "results": json.loads(notification.body)}
+
+    def deliver(self, notification: Notification, delivery: Delivery) -> None:
+        payload = self.payload(notification)
+        for url in notification.recipients:
+            try:
+                resp = self.session.post(url, json=payload, timeout=self.timeout_seconds)
+            except Exception as e:
+                delivery.failed[url] = repr(e)
+                continue
+            if resp.status_code < 300:
+                delivery.delivered.append(url)
+            elif resp.status_code == 429 or resp.status_code >= 500:
+                delivery.failed[url] = f"{resp.status_code} {resp.text[:200]}"
+                retry_after = retry_after_seconds(resp.headers.get("Retry-After"))
+                if retry_after is not None:
+                    delivery.deferred[url] = retry_after
+            else:
+                delivery.rejected[url] = f"{resp.status_code} {resp.text[:200]}"
+
+    def idle(self) -> None:
+        pass
+
+
+class SlackSink(WebhookSink):
+    # Slack (and Mattermost/Discord-compatible) incoming webhooks: a "text" field with mrkdwn
+    def payload(self, notification: Notification) -> Any:
+        return {"text": f"*{notification.subject}*\n```{notification.body}```"}
+
+
+class DelayQueue:
+    # Items come out in due-time order, and not before they're due
+    def __init__(self):
+        self._heap: List[Tuple[float, int, Notification]] = []
+        self._order = itertools.count()
+        self._changed = threading.Condition()
+        self.in_flight = 0
+        self.closed = False
+
+    def put(self, item: Notification, not_before: float = 0.0) -> bool:
+        # False once closed: the caller decides what happens to the item
+        with self._changed:
+            if self.closed:
+                return False
+            heapq.heappush(self._heap, (not_before, next(self._order), item))
+            self._changed.notify_all()
+            return True
+
+    def get(self, stopping: threading.Event) -> Optional[Notification]:
+        with self._changed:
+            while not stopping.is_set():
+                if self._heap:
+                    wait = self._heap[0][0] - time.time()
+                    if wait <= 0:
+                        self.in_flight += 1
+                        return heapq.heappop(self._heap)[2]
+                    self._changed.wait(wait)
+                else:
+                    self._changed.wait()
+            return None
+
+    def done(self) -> None:
+        with self._changed:
+            self.in_flight -= 1
+            self._changed.notify_all()
+
+    def pending(self) -> int:
+        with self._changed:
+            return len(self._heap) + self.in_flight
+
+    def wait_empty(self, timeout_seconds: Optional[float]) -> bool:
+        with self._changed:
+            return self._changed.wait_for(lambda: not (self._heap or self.in_flight), timeout=timeout_seconds)
+
+    def close(self) -> List[Notification]:
+        # Refuses further puts and hands back whatever was still waiting, due or not
+        with self._changed:
+            self.closed = True
+            items = [item for (_, _, item) in sorted(self._heap)]
+            self._heap = []
+            self._changed.notify_all()
+            return items
+
+
+class NotificationPipeline:
+    # One queue and one worker per channel: enqueue() never blocks, a slow or failing channel only delays itself
+    # (as long as the sinks don't share a connection). Failed recipients are retried with exponential backoff; after
+    # max_attempts, when rejected outright, or when still queued at close(), the notification is dead-lettered (kept
+    # in memory and appended to dead_letter_path as JSON lines).
+
+    def __init__(
+            self,
+            sinks: Dict[str, Any],
+            max_attempts: int = 5,
+            backoff: Optional[Backoff] = None,
+            dead_letter_path: Optional[str] = None,
+            metrics: Metrics = METRICS
+    ):
+        self.sinks = sinks
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff or Backoff(base_seconds=5.0, cap_seconds=10 * 60.0)
+        self.dead_letter_path = dead_letter_path
+        self.metrics = metrics
+        self.dead_letters: List[Notification] = []
+        self.queues = {channel: DelayQueue() for channel in sinks}
+        self._stopping = threading.Event()
+        self._workers: Dict[str, threading.Thread] = {}
+        self._lock = threading.Lock()
+
+    def enqueue(self, notification: Notification) -> None:
+        if notification.channel not in self.sinks:
+            raise ValueError(f"No sink for channel: {notification.channel}")
+        if not notification.recipients:
+            return
+        with self._lock:
+            if notification.channel not in self._workers:
+                worker = threading.Thread(target=self.work, args=(notification.channel,),
+                                          name=f"notify-{notification.channel.lower()}", daemon=True)
+                self._workers[notification.channel] = worker
+                worker.start()
+        self.metrics.count("notifications_enqueued_total", channel=notification.channel)
+        self.requeue(notification)
+
+    def work(self, channel: str) -> None:
+        queue, sink = self.queues[channel], self.sinks[channel]
+        while True:
+            notification = queue.get(self._stopping)
+            if notification is None:
+                return
+            try:
+                self.deliver(sink, notification)
+            except Exception as e:  # a broken sink must not kill the worker
+                print(f"WARNING: Notification sink crashed: Channel={channel} Error={repr(e)}")
+                self.dead_letter(notification, {r: repr(e) for r in notification.recipients})
+            finally:
+                queue.done()
+            if queue.pending() == 0:
+                # noinspection PyBroadException
+                try:
+                    sink.idle()
+                except Exception:
+                    pass
+
+    def deliver(self, sink, notification: Notification) -> None:
+        channel = notification.channel
+        notification.attempts += 1
+        delivery = Delivery()
+        started = time.perf_counter()
+        sink.deliver(notification, delivery)
+        self.metrics.observe("delivery_seconds", time.perf_counter() - started, channel=channel)
+        self.metrics.count("notifications_delivered_total", len(delivery.delivered), channel=channel)
+        notification.errors.update(delivery.failed)
+        notification.errors.update(delivery.rejected)
+        if delivery.rejected:
+            self.dead_letter(notification.for_recipients(list(delivery.rejected)), delivery.rejected)
+        if delivery.failed:
+            retry = notification.for_recipients([r for r in notification.recipients if r in delivery.failed])
+            if notification.attempts >= self.max_attempts:
+                self.dead_letter(retry, delivery.failed)
+            else:
+                delay = max(self.backoff.delay(notification.attempts),
+                            max((delivery.deferred.get(r, 0.0) for r in retry.recipients), default=0.0))
+                print(f"WARNING: Delivery failed, retrying in {delay:.0f}s: Channel={channel} "
+                      f"Recipients={len(retry.recipients)} Attempt={notification.attempts}")
+                self.metrics.count("notifications_retried_total", channel=channel)
+                self.requeue(retry, not_before=time.time() + delay)
+        deferred = [r for r in delivery.deferred if r not in delivery.failed]
+        if deferred:
+            # rate limited, not failed: doesn't use up an attempt
+            later = notification.for_recipients(deferred)
+            later.attempts -= 1
+            self.metrics.count("notifications_deferred_total", len(deferred), channel=channel)
+            self.requeue(later, not_before=time.time() + max(delivery.deferred[r] for r in deferred))
+
+    def requeue(self, notification: Notification, not_before: float = 0.0) -> None:
+        # after close() the queue refuses it, e.g. a retry scheduled by a delivery that was still running
+        if not self.queues[notification.channel].put(notification, not_before=not_before):
+            self.dead_letter(notification, self.shutdown_errors(notification))
+
+    @staticmethod
+    def shutdown_errors(notification: Notification) -> Dict[str, str]:
+        return {r: notification.errors.get(r, "Not delivered before shutdown") for r in notification.recipients}
+
+    def dead_letter(self, notification: Notification, errors: Dict[str, str]) -> None:
+        for recipient, error in errors.items():
+            print(f"WARNING: Delivery failed: Channel={notification.channel} Recipient={recipient} Error={error}")
+        self.metrics.count("notifications_dead_lettered_total", len(notification.recipients),
+                           channel=notification.channel)
+        with self._lock:
+            self.dead_letters.append(notification)
+            if not self.dead_letter_path:
+                return
+            # noinspection PyBroadException
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(self.dead_letter_path)), exist_ok=True)
+                with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(notification.to_dict(), separators=(",", ":")) + "\n")
+            except Exception as e:
+                print(f"Couldn't write dead letter: {e}")
+
+    def pending(self) -> Dict[str, int]:
+        return {channel: queue.pending() for (channel, queue) in self.queues.items()}
+
+    def drain(self, timeout_seconds: Optional[float] = None) -> bool:
+        # Waits for every queue to empty, retries included (scheduled ones too, so bound it with a timeout)
+        deadline = None if timeout_seconds is None else time.time() + timeout_seconds
+        for queue in self.queues.values():
+            remaining = None if deadline is None else max(0.0, deadline - time.time())
+            if not queue.wait_empty(remaining):
+                return False
+        return True
+
+    def close(self, timeout_seconds: Optional[float] = 60.0) -> None:
+        if not self.drain(timeout_seconds):
+            print(f"WARNING: Notifications still pending at shutdown: {self.pending()}")
+        self._stopping.set()
+        for queue in self.queues.values():
+            # retries and deferred SMS would be lost with the process: dead-letter them so they can be resent
+            for notification in queue.close():
+                self.dead_letter(notification, self.shutdown_errors(notification))
+        for sink in self.sinks.values():
+            sink.idle()
@@ -0,0 +1,213 @@
+import random
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional, Tuple
+
+# Per-endpoint (max requests/second, burst). Rates start at the max and adapt down on throttling, back up on success.
+LIMITS = {
+    "search": (2.0, 2),
+    "order": (4.0, 4),
+    "taxes": (4.0, 4),
+}
+# Responses that mean "slow down" rather than "broken": tesla.com answers a too-eager client with 429 or a bot-wall 403
+THROTTLED = (403, 429)
+
+
+class CircuitOpenError(IOError):
+    def __init__(self, endpoint: str, retry_in_seconds: float):
+        super().__init__(f"Circuit open: Endpoint={endpoint} RetryIn={retry_in_seconds:.1f}s")
+        self.endpoint = endpoint
+        self.retry_in_seconds = retry_in_seconds
+
+
+def retry_after_seconds(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    # Retry-After is either delta-seconds or an HTTP date
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        moment = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=dt_timezone.utc)
+    return max(0.0, moment.timestamp() - (now if now is not None else datetime.now(dt_timezone.utc).timestamp()))
+
+
+class Backoff:
+    # Exponential backoff with full jitter: attempt n waits uniform(0, min(cap, base * 2^n))
+    def __init__(self, base_seconds: float = 1.0, cap_seconds: float = 60.0, rng: Optional[random.Random] = None):
+        self.base_seconds = base_seconds
+        self.cap_seconds = cap_seconds
+        self.rng = rng or random.Random()
+
+    def delay(self, attempt: int) -> float:
+        return self.rng.uniform(0, min(self.cap_seconds, self.base_seconds * 2 ** attempt))
+
+
+class TokenBucket:
+    # Shared by every thread calling one endpoint. Adaptive (AIMD): throttling halves the rate and pauses the bucket
+    # for Retry-After; each success adds back a little, up to max_rate.
+
+    def __init__(
+            self,
+            max_rate: float,
+            burst: int = 1,
+            min_rate: float = 0.1,
+            increase: float = 0.05,
+            clock=time.monotonic,
+            sleep=time.sleep
+    ):
+        self.max_rate = max_rate
+        self.rate = max_rate
+        self.burst = max(1, burst)
+        self.min_rate = min(min_rate, max_rate)
+        self.increase = increase
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(self.burst)
+        self.updated = clock()
+        self.paused_until = 0.0
+        self.waited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        # Takes a token now (possibly going into debt) and returns how long the caller must wait for it: callers queue
+        # up in arrival order without holding the lock while they sleep
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(float(self.burst), self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            wait = max(0.0, -self.tokens / self.rate, self.paused_until - now)
+            self.waited_seconds += wait
+            return wait
+
+    def acquire(self) -> float:
+        wait = self.reserve()
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def throttled(self, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self.tokens = min(self.tokens, 0.0)
+            if retry_after:
+                self.paused_until = max(self.paused_until, self.clock() + retry_after)
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+
+class CircuitBreaker:
+    # closed -> open after failure_threshold consecutive failures; open -> half-open after reset_seconds, letting one
+    # probe through; the probe's outcome closes it again or re-opens it
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_seconds: float = 30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+        self.rejected = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> None:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            retry_in = self.opened_at + self.reset_seconds - self.clock()
+            if self.state == self.OPEN and retry_in <= 0:
+                self.state = self.HALF_OPEN
+                self._probing = False
+            if self.state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            raise CircuitOpenError(self.name, max(0.0, retry_in))
+
+    def succeeded(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def inconclusive(self) -> None:
+        # Neither outcome (e.g. a rejection the caller handles): a half-open breaker lets the next probe through
+        with self._lock:
+            self._probing = False
+
+    def failed(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened_at = self.clock()
+                self._probing = False
+
+    @property
+    def retry_in_seconds(self) -> float:
+        with self._lock:
+            return max(0.0, self.opened_at + self.reset_seconds - self.clock()) if self.state == self.OPEN else 0.0
+
+
+class EndpointLimiter:
+    # One bucket and one breaker per endpoint; share an instance between every watcher hitting the same host
+    def __init__(
+            self,
+            limits: Optional[Dict[str, Tuple[float, int]]] = None,
+            failure_threshold: int = 5,
+            reset_seconds: float = 30.0,
+            max_attempts: int = 3,
+            backoff: Optional[Backoff] = None
+    ):
+        self.limits = LIMITS | (limits or {})
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.max_attempts = max(1, max_attempts)
+        self.backoff = backoff or Backoff(base_seconds=1.0, cap_seconds=30.0)
+        self.buckets: Dict[str, TokenBucket] = {}
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    def bucket(self, endpoint: str) -> TokenBucket:
+        with self._lock:
+            bucket = self.buckets.get(endpoint)
+            if bucket is None:
+                rate, burst = self.limits.get(endpoint, (1.0, 1))
+                bucket = self.buckets[endpoint] = TokenBucket(max_rate=rate, burst=burst)
+            return bucket
+
+    def breaker(self, endpoint: str) -> CircuitBreaker:
+        with self._lock:
+            breaker = self.breakers.get(endpoint)
+            if breaker is None:
+                breaker = self.breakers[endpoint] = CircuitBreaker(
+                    endpoint, failure_threshold=self.failure_threshold, reset_seconds=self.reset_seconds)
+            return breaker
+
+    @property
+    def stats(self) -> Dict[str, dict]:
+        return {
+            endpoint: {
+                "rate": round(self.bucket(endpoint).rate, 3),
+                "waited_seconds": round(self.bucket(endpoint).waited_seconds, 3),
+                "breaker": self.breaker(endpoint).state,
+                "trips": self.breaker(endpoint).trips,
+                "rejected": self.breaker(endpoint).rejected
+            }
+            for endpoint in sorted(set(self.buckets) | set(self.breakers))
+        }
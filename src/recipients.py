@@ -0,0 +1,198 @@
+import hashlib
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple, Union
+
+from src.utils import REGEX_PHONE, SMS_GATEWAYS
+
+# Mailing list format, one recipient per line, optionally followed by the watches it's subscribed to:
+#     someone@example.com
+#     5551234567@vtext.com: rahway-my-lrawd, m3/LRAWD
+# No watches means every watch. Blank lines and lines starting with "#" are skipped.
+
+# REGEX_EMAIL's addresses plus the subscriptions, in one match per line. Possessive quantifiers never give back what
+# they matched, so a line that doesn't match fails in linear time instead of backtracking; the one rule left out (no
+# label starting or ending with "-") is a string check.
+REGEX_RECIPIENT = re.compile(
+    r"\s*+(?P<local>[a-zA-Z0-9!#$%&'*+/=?^_`{|}~-]++(?:\.[a-zA-Z0-9!#$%&'*+/=?^_`{|}~-]++)*+)"
+    r"@(?P<domain>[a-zA-Z0-9-]++(?:\.[a-zA-Z0-9-]++)++)(?:\s*+:(?P<watches>.*))?\s*+"
+)
+PHONE_FIRST_CHARS = frozenset("+-0123456789")
+MAX_WARNINGS = 20
+
+
+class Subscriber:
+    __slots__ = ("address", "key", "channel", "carrier", "watches")
+
+    def __init__(self, address: str, channel: str, carrier: Optional[str], watches: Optional[FrozenSet[str]]):
+        self.address = address
+        self.key = address.lower()  # duplicates differ only in case
+        self.channel = channel
+        self.carrier = carrier
+        self.watches = watches
+
+    def subscribed(self, keys: Iterable[str]) -> bool:
+        return self.watches is None or not self.watches.isdisjoint(keys)
+
+    def __repr__(self):
+        return f"Subscriber({self.address!r}, {self.channel}, {self.carrier!r}, {self.watches})"
+
+
+def parse_line(line: str) -> Union[Subscriber, str, None]:
+    # A Subscriber, a warning, or None for blank lines and comments. "#" is allowed in the local part of an address, so
+    # comments are ruled out before matching
+    stripped = line.strip()
+    if not stripped or stripped[0] == "#":
+        return None
+    matched = REGEX_RECIPIENT.fullmatch(line)
+    if matched is None:
+        return f"invalid email: {stripped.partition(':')[0].strip()}"
+    local, domain, watches = matched.groups()
+    if "-" in domain and (domain[0] == "-" or domain[-1] == "-" or "-." in domain or ".-" in domain):
+        return f"invalid email: {local}@{domain}"
+    domain = domain.lower()
+    carrier = SMS_GATEWAYS.get(domain)
+    cell_10_digit = None
+    if local[0] in PHONE_FIRST_CHARS:  # REGEX_PHONE only for what could be a phone number at all
+        phone = REGEX_PHONE.match(local)
+        if phone is not None:
+            cell_10_digit = phone.group(3).strip("()") + phone.group(5) + phone.group(7)
+    if watches is not None:
+        watches = frozenset(filter(None, map(str.strip, watches.split(",")))) or None
+    if carrier and cell_10_digit:
+        return Subscriber(f"{cell_10_digit}@{domain}", "SMS", carrier, watches)
+    if not carrier and not cell_10_digit:
+        return Subscriber(f"{local}@{domain}", "EMAIL", None, watches)
+    if cell_10_digit:
+        return f"RECIPIENT IGNORED: unknown SMS Gateway {domain} for phone number: {local}"
+    return f"RECIPIENT IGNORED: invalid phone number for {carrier} SMS Gateway: {local}"
+
+
+class RecipientIndex:
+    # A parsed, normalized and deduplicated mailing list. load() is a no-op when the content hash is unchanged; when it
+    # did change, only lines not seen in the previous version are parsed again.
+
+    def __init__(self):
+        self.digest: Optional[str] = None
+        self.subscribers: Dict[str, Subscriber] = {}
+        self.invalid: Dict[str, str] = {}  # warning by raw line: lines differing only in whitespace come and go apart
+        self.loads = 0
+        self.reloads = 0
+        self.lines_parsed = 0
+        self._lines: Dict[str, Union[Subscriber, str, None]] = {}
+        self._lines_by_key: Dict[str, Union[str, List[str]]] = {}
+        self._by_watch: Dict[FrozenSet[str], Tuple[List[str], List[str]]] = {}
+        self._lock = threading.Lock()
+
+    def load(self, text: str) -> bool:
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        with self._lock:
+            self.loads += 1
+            if digest == self.digest:
+                return False
+            lines = dict.fromkeys(text.split("\n"))
+            parsed_lines, by_key, subscribers = self._lines, self._lines_by_key, self.subscribers
+            # set differences run in C: only lines that came or went cost any Python work
+            added, removed = lines.keys() - parsed_lines.keys(), parsed_lines.keys() - lines.keys()
+            cold = self.digest is None  # nothing to remove, and every subscriber is new
+            affected: Dict[str, None] = {}
+            for line in removed:
+                parsed = parsed_lines.pop(line)
+                if parsed.__class__ is Subscriber:
+                    entry = by_key[parsed.key]
+                    if entry.__class__ is str:
+                        del by_key[parsed.key]
+                    else:
+                        entry.remove(line)
+                    affected[parsed.key] = None
+                elif parsed is not None:
+                    del self.invalid[line]
+            new_warnings = []
+            for line in lines if cold else sorted(added):
+                parsed = parsed_lines[line] = parse_line(line)
+                if parsed.__class__ is Subscriber:
+                    # the line itself for most subscribers; a list only for those listed more than once
+                    key = parsed.key
+                    entry = by_key.get(key)
+                    if entry is None:
+                        by_key[key] = line
+                    elif entry.__class__ is str:
+                        by_key[key] = [entry, line]
+                    else:
+                        entry.append(line)
+                    if not cold:
+                        affected[key] = None
+                elif parsed is not None:
+                    self.invalid[line] = parsed
+                    new_warnings.append(parsed)
+            self.lines_parsed += len(added)
+            for key in by_key if cold else affected:
+                entry = by_key.get(key)
+                if entry.__class__ is str:
+                    subscribers[key] = parsed_lines[entry]
+                else:
+                    self.merge(key, entry)
+            if self.digest is not None:
+                self.reloads += 1
+            self.digest = digest
+            self._by_watch = {}
+        for warning in new_warnings[:MAX_WARNINGS]:
+            print(f"WARNING: {warning}")
+        if len(new_warnings) > MAX_WARNINGS:
+            print(f"WARNING: ...and {len(new_warnings) - MAX_WARNINGS} more invalid recipients")
+        return True
+
+    def merge(self, key: str, entry: Optional[List[str]]) -> None:
+        # Lines for the same subscriber (differing only in case or phone format) merge their subscriptions, and one
+        # unrestricted line means every watch. The address kept is the smallest spelling rather than the first line's,
+        # which after incremental loads depends on the order lines were added, not where they are in the file.
+        if not entry:
+            self._lines_by_key.pop(key, None)
+            self.subscribers.pop(key, None)
+            return
+        first, *others = sorted((self._lines[line] for line in entry), key=lambda parsed: parsed.address)
+        watches = first.watches
+        for other in others:
+            watches = None if watches is None or other.watches is None else watches | other.watches
+        self.subscribers[key] = Subscriber(first.address, first.channel, first.carrier, watches)
+
+    def for_watch(self, *keys: str) -> Tuple[List[str], List[str]]:
+        # (email, sms) recipients subscribed to a watch known by any of the given keys, e.g. its name and model/trim
+        keys = frozenset(keys)
+        with self._lock:
+            recipients = self._by_watch.get(keys)
+            if recipients is None:
+                recipients = self._by_watch[keys] = ([], [])
+                emails, sms = recipients
+                for subscriber in self.subscribers.values():
+                    if keys and not subscriber.subscribed(keys):
+                        continue
+                    (emails if subscriber.channel == "EMAIL" else sms).append(subscriber.address)
+            return recipients
+
+    @property
+    def emails(self) -> List[str]:
+        return [s.address for s in self.subscribers.values() if s.channel == "EMAIL"]
+
+    @property
+    def sms(self) -> List[str]:
+        return [s.address for s in self.subscribers.values() if s.channel == "SMS"]
+
+    def carriers(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for subscriber in self.subscribers.values():
+            if subscriber.carrier:
+                counts[subscriber.carrier] = counts.get(subscriber.carrier, 0) + 1
+        return counts
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"subscribers": len(self.subscribers), "invalid": len(self.invalid), "loads": self.loads,
+                "reloads": self.reloads, "lines_parsed": self.lines_parsed}
+
+
+@lru_cache(maxsize=None)
+def recipient_index(path: str) -> RecipientIndex:
+    # One index per mailing list per process, shared by every watcher reading it
+    return RecipientIndex()
@@ -0,0 +1,229 @@
+import asyncio
+import calendar
+import random
+import signal
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone, tzinfo
+from typing import Callable, Dict, List, Optional, Set
+
+
+class FixedRate:
+    # Fixed-rate (not fixed-delay): due times stay on the interval grid no matter how long a run takes
+
+    def __init__(self, interval_seconds: float, jitter_seconds: float = 0.0, immediately: bool = True):
+        self.interval_seconds = interval_seconds
+        self.jitter_seconds = jitter_seconds
+        self.immediately = immediately
+
+    def first(self, now: float) -> float:
+        return now if self.immediately else now + self.interval_seconds
+
+    def next(self, previous_due: float, now: float) -> float:
+        due = previous_due + self.interval_seconds
+        if due <= now:
+            # missed slots (overrun or suspended process) are skipped, not run back to back
+            due += self.interval_seconds * ((now - due) // self.interval_seconds + 1)
+        return due
+
+    def jitter(self) -> float:
+        return random.uniform(0, self.jitter_seconds) if self.jitter_seconds else 0.0
+
+
+class Cron(FixedRate):
+    # Five fields (minute hour day-of-month month day-of-week) with "*", "a-b", "*/n", "a-b/n" and "a,b,c"
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 6)]
+
+    def __init__(self, expression: str, timezone: tzinfo = dt_timezone.utc, jitter_seconds: float = 0.0):
+        super().__init__(interval_seconds=60, jitter_seconds=jitter_seconds, immediately=False)
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression}")
+        self.expression = expression
+        self.timezone = timezone
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self.parse(field, low, high) for (field, (low, high)) in zip(fields, self.FIELD_RANGES))
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+        # with the weekday unrestricted, the days alone decide: e.g. "0 0 31 2 *" (February 31st) would never fire
+        if self.any_weekday and not any(day <= calendar.monthrange(2000, month)[1]
+                                        for month in self.months for day in self.days):
+            raise ValueError(f"Cron expression never fires: {expression}")
+
+    @staticmethod
+    def parse(field: str, low: int, high: int) -> Set[int]:
+        values = set()
+        for part in field.split(","):
+            span, _, step = part.partition("/")
+            if span == "*":
+                start, end = low, high
+            elif "-" in span:
+                start, end = map(int, span.split("-", 1))
+            else:
+                start = end = int(span)
+            if step and "-" not in span and span != "*":
+                end = high
+            step = int(step) if step else 1
+            if not (low <= start <= end <= high) or step < 1:
+                raise ValueError(f"Cron field out of range: {field}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, moment: datetime) -> bool:
+        day_ok = moment.day in self.days
+        weekday_ok = (moment.isoweekday() % 7) in self.weekdays
+        # classic cron: when both day fields are restricted, either one matching is enough
+        if self.any_day or self.any_weekday:
+            days_ok = day_ok and weekday_ok
+        else:
+            days_ok = day_ok or weekday_ok
+        return (moment.minute in self.minutes and moment.hour in self.hours
+                and moment.month in self.months and days_ok)
+
+    def first(self, now: float) -> float:
+        return self.next(now, now)
+
+    def next(self, previous_due: float, now: float) -> float:
+        # step through absolute minutes so DST transitions are handled the same with any tzinfo
+        minute = (int(max(previous_due, now)) // 60 + 1) * 60
+        for _ in range(60 * 24 * 366 * 4):
+            if self.matches(datetime.fromtimestamp(minute, self.timezone)):
+                return float(minute)
+            minute += 60
+        raise ValueError(f"Cron expression never fires: {self.expression}")
+
+
+class Job:
+    def __init__(self, name: str, fn: Callable[[], object], schedule: FixedRate, timeout_seconds: Optional[float]):
+        self.name = name
+        self.fn = fn
+        self.schedule = schedule
+        self.timeout_seconds = timeout_seconds
+        self.runs = 0
+        self.failures = 0
+        self.overruns = 0
+        self.skipped = 0
+        self.lags: List[float] = []
+        self.running: Optional[asyncio.Future] = None
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lags = sorted(self.lags)
+        return {
+            "runs": self.runs,
+            "failures": self.failures,
+            "overruns": self.overruns,
+            "skipped": self.skipped,
+            "lag_p50_seconds": round(lags[len(lags) // 2], 3) if lags else 0.0,
+            "lag_max_seconds": round(lags[-1], 3) if lags else 0.0
+        }
+
+
+def run_in_daemon_thread(fn: Callable[[], object], name: str) -> asyncio.Future:
+    # Like run_in_executor, but on a daemon thread: a run abandoned after its timeout can't be stopped, and it mustn't
+    # keep the process alive past the shutdown grace period either (executor threads are joined at exit)
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def settle(result, error):
+        if future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def target():
+        result, error = None, None
+        try:
+            result = fn()
+        except BaseException as e:
+            error = e
+        try:
+            loop.call_soon_threadsafe(settle, result, error)
+        except RuntimeError:  # the loop is gone: nobody is waiting for this run any more
+            pass
+
+    threading.Thread(target=target, name=name, daemon=True).start()
+    return future
+
+
+class AsyncScheduler:
+    def __init__(self, grace_seconds: float = 8.0):
+        # Cloud Run allows 10s by default between SIGTERM and SIGKILL
+        self.grace_seconds = grace_seconds
+        self.jobs: Dict[str, Job] = {}
+        self.stopping: Optional[asyncio.Event] = None
+
+    def add(self, name: str, fn: Callable[[], object], schedule: FixedRate,
+            timeout_seconds: Optional[float] = None) -> Job:
+        if name in self.jobs:
+            raise ValueError(f"Duplicate job: {name}")
+        job = self.jobs[name] = Job(name=name, fn=fn, schedule=schedule, timeout_seconds=timeout_seconds)
+        return job
+
+    @property
+    def abandoned(self) -> List[str]:
+        return [job.name for job in self.jobs.values() if job.running is not None and not job.running.done()]
+
+    def stop(self) -> None:
+        if self.stopping is not None:
+            self.stopping.set()
+
+    async def sleep_until(self, when: float) -> bool:
+        try:
+            await asyncio.wait_for(self.stopping.wait(), timeout=max(0.0, when - time.time()))
+            return False
+        except asyncio.TimeoutError:
+            return True
+
+    async def run_job(self, job: Job) -> None:
+        due = job.schedule.first(time.time())
+        while not self.stopping.is_set():
+            target = due + job.schedule.jitter()
+            if not await self.sleep_until(target):
+                return
+            started = time.time()
+            lag = started - target
+            job.lags.append(lag)
+            if job.running is not None and not job.running.done():
+                # an abandoned run's thread can't be killed; don't pile another one on top of it
+                job.skipped += 1
+                print(f"WARNING: Skipping run, previous run still going: Job={job.name}")
+            else:
+                job.runs += 1
+                print(f"INFO: Run started: Job={job.name} Lag={lag:.3f}s")
+                job.running = run_in_daemon_thread(job.fn, name=f"tesla-job-{job.name}")
+                try:
+                    await asyncio.wait_for(asyncio.shield(job.running), timeout=job.timeout_seconds)
+                    print(f"INFO: Run finished: Job={job.name} Elapsed={time.time() - started:.1f}s")
+                except asyncio.TimeoutError:
+                    job.overruns += 1
+                    # not cancelled: the thread keeps going in the background until the run returns on its own
+                    print(f"WARNING: Run abandoned after {job.timeout_seconds}s, still running: Job={job.name}")
+                except Exception as e:
+                    job.failures += 1
+                    print(f"WARNING: Run failed: Job={job.name} Error={repr(e)}")
+            due = job.schedule.next(due, time.time())
+
+    async def serve(self) -> None:
+        self.stopping = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, self.stop)
+            except (NotImplementedError, RuntimeError):  # not on the main thread, or not supported by the platform
+                pass
+        tasks = [asyncio.create_task(self.run_job(job), name=job.name) for job in self.jobs.values()]
+        await self.stopping.wait()
+        print(f"INFO: Shutting down, waiting up to {self.grace_seconds}s for running jobs")
+        done, pending = await asyncio.wait(tasks, timeout=self.grace_seconds)
+        for task in pending:
+            task.cancel()
+        if self.abandoned:
+            print(f"WARNING: Exiting with runs still in progress: Jobs={self.abandoned}")
+        for job in self.jobs.values():
+            print(f"INFO: Job stats: Job={job.name} {job.stats}")
+
+    def run(self) -> None:
+        asyncio.run(self.serve())
@@ -0,0 +1,101 @@
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Optional, Tuple
+
+from src.tesla_results import ResultPage
+
+
+class Published:
+    def __init__(self, generation: int, json_body: bytes, html_body: bytes):
+        self.generation = generation
+        self.json_body = json_body
+        self.html_body = html_body
+        self.json_etag = f'"{hashlib.sha1(json_body).hexdigest()}"'
+        self.html_etag = f'"{hashlib.sha1(html_body).hexdigest()}"'
+
+
+class ResultService:
+    # Coordinates runs between threads (one in-flight Future) and between gunicorn workers (an flock on a shared
+    # state directory); whichever worker runs publishes the pages to disk, and every worker serves that copy.
+
+    def __init__(self, runner: Callable[[], Dict[str, ResultPage]], state_dir: str):
+        self.runner = runner
+        self.state_dir = state_dir
+        self.lock_path = os.path.join(state_dir, "run.lock")
+        self.results_path = os.path.join(state_dir, "results.json")
+        self._lock = threading.Lock()
+        self._inflight: Optional[Future] = None
+        self._published: Optional[Published] = None
+        os.makedirs(state_dir, exist_ok=True)
+
+    def generation(self) -> int:
+        try:
+            return os.stat(self.results_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def trigger(self) -> Tuple[str, Optional[Published]]:
+        with self._lock:
+            owner = self._inflight is None
+            if owner:
+                self._inflight = Future()
+            inflight = self._inflight
+        if not owner:
+            inflight.result()
+            return "coalesced", self.latest()
+        try:
+            status = self.run_exclusive()
+            inflight.set_result(status)
+            return status, self.latest()
+        except BaseException as e:
+            inflight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight = None
+
+    def run_exclusive(self) -> str:
+        seen = self.generation()
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                if self.generation() != seen:
+                    # another worker finished a run while this one waited for the lock
+                    return "coalesced"
+                self.publish(self.runner())
+                return "ran"
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def publish(self, pages: Dict[str, ResultPage]) -> None:
+        document = {
+            "published_at": time.time(),
+            "watches": {name: page.to_dict() for (name, page) in pages.items() if page is not None},
+            "html": "".join(page.html_long_form for page in pages.values() if page is not None)
+        }
+        tmp_path = f"{self.results_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(document, f, separators=(",", ":"))
+        os.replace(tmp_path, self.results_path)
+
+    def latest(self) -> Optional[Published]:
+        generation = self.generation()
+        published = self._published
+        if published is not None and published.generation == generation:
+            return published
+        if not generation:
+            return None
+        with open(self.results_path, "r", encoding="utf-8") as f:
+            document = json.load(f)
+        published = Published(
+            generation=generation,
+            json_body=json.dumps({k: document[k] for k in ("published_at", "watches")}, indent=2).encode("utf-8"),
+            html_body=document["html"].encode("utf-8")
+        )
+        self._published = published
+        return published
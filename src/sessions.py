@@ -0,0 +1,102 @@
+import threading
+from typing import Dict, Iterable
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class CountingAdapter(HTTPAdapter):
+    def __init__(self, *args, **kwargs):
+        self.bytes_received = 0
+        self.bytes_sent = 0
+        self.requests_sent = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, stream=False, **kwargs):
+        response = super().send(request, stream=stream, **kwargs)
+        sent = len(request.body or b"") if not isinstance(request.body, str) else len(request.body.encode("utf-8"))
+        if stream:
+            # reading .content here would download the whole body: count only what the caller reads, once it's done
+            received = 0
+            self.count_on_close(response)
+        else:
+            received = len(response.content or b"")
+        # urllib3 retries happen below this adapter: one send() may have cost several round trips
+        retries = getattr(response.raw, "retries", None)
+        retried = len(retries.history) if retries is not None else 0
+        with self._lock:
+            self.requests_sent += 1
+            self.retries += retried
+            self.bytes_sent += sent
+            self.bytes_received += received
+        return response
+
+    def count_on_close(self, response) -> None:
+        close = response.close
+
+        def counted_close():
+            read = response.raw.tell() if response.raw is not None else 0
+            with self._lock:
+                self.bytes_received += read
+            close()
+            response.close = close  # count once
+
+        response.close = counted_close
+
+    def connections_opened(self) -> int:
+        # urllib3 tracks every new socket on the per-host pool; everything else was served from a kept-alive socket
+        return sum(pool.num_connections for pool in self._host_pools())
+
+    def pool_requests(self) -> int:
+        return sum(pool.num_requests for pool in self._host_pools())
+
+    def _host_pools(self) -> Iterable:
+        pools = self.poolmanager.pools
+        found = []
+        for key in pools.keys():
+            try:
+                found.append(pools[key])
+            except KeyError:  # evicted meanwhile
+                pass
+        return found
+
+
+class PooledSession(requests.Session):
+    def __init__(
+            self,
+            pool_connections: int = 4,
+            pool_maxsize: int = 10,
+            pool_block: bool = True,
+            retry_total: int = 3,
+            retry_backoff_factor: float = 0.5,
+            retry_statuses: Iterable[int] = (500, 502, 503, 504)
+    ):
+        super().__init__()
+        retries = Retry(
+            total=retry_total,
+            backoff_factor=retry_backoff_factor,
+            status_forcelist=tuple(retry_statuses),
+            allowed_methods=None,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        # pool_connections bounds the number of hosts kept alive, pool_maxsize the sockets per host
+        self.adapter = CountingAdapter(
+            pool_connections=pool_connections, pool_maxsize=pool_maxsize, pool_block=pool_block, max_retries=retries)
+        self.mount("https://", self.adapter)
+        self.mount("http://", self.adapter)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        opened = self.adapter.connections_opened()
+        return {
+            "requests": self.adapter.requests_sent,
+            "retries": self.adapter.retries,
+            "connections_opened": opened,
+            "connections_reused": max(0, self.adapter.pool_requests() - opened),
+            "bytes_sent": self.adapter.bytes_sent,
+            "bytes_received": self.adapter.bytes_received
+        }
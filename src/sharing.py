@@ -0,0 +1,58 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class SingleFlight:
+    def __init__(self, max_age_seconds: Optional[float] = None):
+        # max_age_seconds: None keeps results until reset(), for callers that reset once per run
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._calls: Dict[Hashable, Tuple[float, Future]] = {}
+        self.computed = 0
+        self.shared = 0
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        now = time.monotonic()
+        with self._lock:
+            started, future = self._calls.get(key, (now, None))
+            if future is not None and future.done() and self.max_age_seconds is not None \
+                    and now - started > self.max_age_seconds:
+                future = None
+            owner = future is None
+            if owner:
+                future = Future()
+                self._calls[key] = (now, future)
+                self.computed += 1
+            else:
+                self.shared += 1
+        if owner:
+            try:
+                future.set_result(fn())
+            except BaseException as e:
+                future.set_exception(e)
+                with self._lock:
+                    # failures are not memoized; the next caller gets a fresh attempt
+                    if self._calls.get(key, (None, None))[1] is future:
+                        del self._calls[key]
+        return future.result()
+
+    def expire(self) -> None:
+        if self.max_age_seconds is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            for key in [k for (k, (started, f)) in self._calls.items()
+                        if f.done() and now - started > self.max_age_seconds]:
+                del self._calls[key]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._calls.clear()
+            self.computed = 0
+            self.shared = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"computed": self.computed, "shared": self.shared}
@@ -0,0 +1,137 @@
+import json
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+# Compact on-disk record: VIN -> [price, taxes, fees, "OPT1,OPT2,...", first_seen, last_seen] (epoch seconds)
+PRICE, TAXES, FEES, OPTIONS, FIRST_SEEN, LAST_SEEN = range(6)
+SNAPSHOT_FORMAT = 1
+
+
+class Snapshot:
+    def __init__(self, taken_at: float = 0.0, records: Optional[Dict[str, list]] = None):
+        self.taken_at = taken_at
+        self.records = records or {}
+
+    def __len__(self):
+        return len(self.records)
+
+    @classmethod
+    def from_cars(cls, cars: Iterable, taken_at: float, previous: Optional["Snapshot"] = None,
+                  listed: Iterable[str] = ()) -> "Snapshot":
+        # listed: every VIN on the search page. One that couldn't be enriched this time keeps its previous record
+        # as is rather than dropping out, so a transient failure isn't reported as GONE and then NEW again.
+        seen = previous.records if previous else {}
+        records = {vin: seen[vin] for vin in listed if vin in seen}
+        for car in cars:
+            first_seen = seen[car.vin][FIRST_SEEN] if car.vin in seen else taken_at
+            records[car.vin] = [
+                round(float(car.purchase_price), 2),
+                round(float(car.taxes_amount), 2),
+                round(float(car.fees_amount), 2),
+                ",".join(sorted(car.option_codes)),
+                first_seen,
+                taken_at
+            ]
+        return cls(taken_at=taken_at, records=records)
+
+    def dumps(self) -> str:
+        return json.dumps({"format": SNAPSHOT_FORMAT, "taken_at": self.taken_at, "cars": self.records},
+                          separators=(",", ":"))
+
+    @classmethod
+    def loads(cls, text: str) -> "Snapshot":
+        data = json.loads(text)
+        if data.get("format") != SNAPSHOT_FORMAT:
+            raise ValueError(f"Unsupported snapshot format: {data.get('format')}")
+        return cls(taken_at=data["taken_at"], records=data["cars"])
+
+
+class Delta:
+    def __init__(
+            self,
+            since: float,
+            until: float,
+            added: Dict[str, list],
+            removed: Dict[str, list],
+            repriced: Dict[str, Tuple[float, float]],
+            updated: Dict[str, list]
+    ):
+        self.since = since
+        self.until = until
+        self.added = added
+        self.removed = removed
+        self.repriced = repriced
+        self.updated = updated
+
+    def __bool__(self):
+        # taxes/fees/options-only updates are recorded, but only these count as a change worth notifying about
+        return bool(self.added or self.removed or self.repriced)
+
+    def __repr__(self):
+        return (f"Delta(added={sorted(self.added)}, removed={sorted(self.removed)}, "
+                f"repriced={self.repriced}, updated={sorted(self.updated)})")
+
+    def dumps(self) -> str:
+        return json.dumps({
+            "format": SNAPSHOT_FORMAT,
+            "since": self.since,
+            "until": self.until,
+            "added": self.added,
+            "removed": self.removed,
+            "repriced": self.repriced,
+            "updated": self.updated
+        }, separators=(",", ":"))
+
+
+def diff(previous: Snapshot, current: Snapshot) -> Delta:
+    prev, curr = previous.records, current.records
+    added = {vin: record for (vin, record) in curr.items() if vin not in prev}
+    removed = {vin: record for (vin, record) in prev.items() if vin not in curr}
+    repriced = {}
+    updated = {}
+    for vin in curr.keys() & prev.keys():
+        old, new = prev[vin], curr[vin]
+        if old[PRICE] != new[PRICE]:
+            repriced[vin] = (old[PRICE], new[PRICE])
+        elif old[TAXES:OPTIONS + 1] != new[TAXES:OPTIONS + 1]:
+            updated[vin] = new
+    return Delta(since=previous.taken_at, until=current.taken_at,
+                 added=added, removed=removed, repriced=repriced, updated=updated)
+
+
+class SnapshotStore:
+    # Keeps the last snapshot in memory across runs; storage is only read on a cold start and only written on change
+
+    def __init__(self, path: str, download: Callable[[str], str], upload: Callable[[str, str], None]):
+        self.path = path
+        self.delta_path = path.rsplit(".", 1)[0] + ".delta.json"
+        self.download = download
+        self.upload = upload
+        self._last: Optional[Snapshot] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> Snapshot:
+        with self._lock:
+            if self._last is None:
+                # noinspection PyBroadException
+                try:
+                    self._last = Snapshot.loads(self.download(self.path))
+                except Exception as e:
+                    print(f"Couldn't read last snapshot: {e}")
+                    self._last = Snapshot()
+            return self._last
+
+    def save(self, snapshot: Snapshot, delta: Delta) -> None:
+        with self._lock:
+            self._last = snapshot
+            if not (delta or delta.updated):
+                return
+            self.upload(self.delta_path, delta.dumps())
+            self.upload(self.path, snapshot.dumps())
+
+
+def describe(delta: Delta) -> List[str]:
+    lines = [f"NEW {vin} ${record[PRICE]:,.2f}" for (vin, record) in delta.added.items()]
+    lines += [f"GONE {vin} ${record[PRICE]:,.2f}" for (vin, record) in delta.removed.items()]
+    lines += [f"PRICE {vin} ${old:,.2f} -> ${new:,.2f}" for (vin, (old, new)) in delta.repriced.items()]
+    return lines
@@ -0,0 +1,320 @@
+import atexit
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+# Text blobs are addressed as "bucket/path/to/blob" by every backend. Reads and writes report a generation (an opaque,
+# per-blob version), so a reader holding a copy can ask for the content only if it changed since.
+Generation = Optional[object]
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "tesla_watcher", "storage")
+
+
+class Storage:
+    def fetch(self, path: str, generation: Generation = None) -> Optional[Tuple[str, Generation]]:
+        # (content, generation), or None if the blob is still at the given generation; FileNotFoundError if missing
+        raise NotImplementedError
+
+    def store(self, path: str, content: str) -> Generation:
+        raise NotImplementedError
+
+    def download_text(self, path: str) -> str:
+        return self.fetch(path)[0]
+
+    def upload_text(self, path: str, content: str) -> None:
+        self.store(path, content)
+
+    def flush(self, timeout_seconds: Optional[float] = None) -> bool:
+        return True
+
+    def close(self) -> None:
+        self.flush()
+
+
+class GCSStorage(Storage):
+    def __init__(self, project: Optional[str] = None):
+        self.project = project
+        # google-cloud-storage clients wrap a requests session and aren't thread-safe: one per thread, made once
+        self._local = threading.local()
+
+    @property
+    def client(self):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            from google.cloud import storage  # only paid for when this backend is actually used
+            client = self._local.client = storage.Client(project=self.project)
+        return client
+
+    def blob(self, path: str):
+        bucket, name = path.split("/", 1)
+        return self.client.bucket(bucket).blob(name)
+
+    def fetch(self, path: str, generation: Generation = None) -> Optional[Tuple[str, Generation]]:
+        from google.api_core.exceptions import NotFound, NotModified
+        blob = self.blob(path)
+        try:
+            content = blob.download_as_text(if_generation_not_match=generation)
+        except NotModified:
+            return None
+        except NotFound as e:
+            raise FileNotFoundError(path) from e
+        return content, blob.generation
+
+    def store(self, path: str, content: str) -> Generation:
+        blob = self.blob(path)
+        blob.upload_from_string(content)
+        return blob.generation
+
+
+class LocalStorage(Storage):
+    # The same paths as files under a local root directory; the generation is the file's mtime
+    def __init__(self, root: str = "."):
+        self.root = root
+
+    def file(self, path: str) -> str:
+        return os.path.join(self.root, path)
+
+    def fetch(self, path: str, generation: Generation = None) -> Optional[Tuple[str, Generation]]:
+        file = self.file(path)
+        current = os.stat(file).st_mtime_ns
+        if current == generation:
+            return None
+        with open(file, "r", encoding="utf-8") as f:
+            return f.read(), current
+
+    def store(self, path: str, content: str) -> Generation:
+        file = self.file(path)
+        os.makedirs(os.path.dirname(os.path.abspath(file)), exist_ok=True)
+        tmp_file = f"{file}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_file, file)
+        return os.stat(file).st_mtime_ns
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS blobs ("
+                         "path TEXT PRIMARY KEY, content TEXT NOT NULL, generation INTEGER NOT NULL)")
+
+    def fetch(self, path: str, generation: Generation = None) -> Optional[Tuple[str, Generation]]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT generation, CASE WHEN generation IS ? THEN NULL ELSE content END FROM blobs WHERE path = ?",
+                (generation, path)).fetchone()
+        if row is None:
+            raise FileNotFoundError(path)
+        current, content = row
+        return None if content is None else (content, current)
+
+    def store(self, path: str, content: str) -> Generation:
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO blobs (path, content, generation) VALUES (?, ?, 1) ON CONFLICT (path) "
+                "DO UPDATE SET content = excluded.content, generation = blobs.generation + 1", (path, content))
+            return self._db.execute("SELECT generation FROM blobs WHERE path = ?", (path,)).fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class CachedStorage(Storage):
+    # Read-through disk cache in front of a (remote) backend. Reads revalidate with a conditional fetch, so an unchanged
+    # blob costs a metadata round trip instead of a download; within revalidate_seconds of the last check, not even
+    # that. Writes land in the cache at once and are uploaded by a background thread, newest content per path only.
+
+    def __init__(
+            self,
+            backend: Storage,
+            directory: str = DEFAULT_CACHE_DIR,
+            revalidate_seconds: float = 0.0,
+            write_back: bool = True,
+            max_upload_attempts: int = 3,
+            clock=time.time
+    ):
+        self.backend = backend
+        self.directory = directory
+        self.revalidate_seconds = revalidate_seconds
+        self.write_back = write_back
+        self.max_upload_attempts = max_upload_attempts
+        self.clock = clock
+        self.hits = 0
+        self.revalidated = 0
+        self.downloads = 0
+        self.uploads = 0
+        self._entries: Dict[str, dict] = {}
+        self._pending: Dict[str, str] = {}
+        self._uploading = 0
+        self._lock = threading.Lock()
+        self._changed = threading.Condition(self._lock)
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def cache_file(self, path: str) -> str:
+        return os.path.join(self.directory, hashlib.sha1(path.encode("utf-8")).hexdigest() + ".json")
+
+    def entry(self, path: str) -> Optional[dict]:
+        entry = self._entries.get(path)
+        if entry is None:
+            # noinspection PyBroadException
+            try:
+                with open(self.cache_file(path), "r", encoding="utf-8") as f:
+                    entry = json.load(f)
+                if entry.get("path") != path:
+                    return None
+            except FileNotFoundError:
+                return None
+            except Exception as e:
+                print(f"Couldn't read cached blob: Path={path} Error={e}")
+                return None
+            self._entries[path] = entry
+        return entry
+
+    def remember(self, path: str, content: str, generation: Generation, checked_at: float) -> None:
+        entry = {"path": path, "content": content, "generation": generation, "checked_at": checked_at}
+        self._entries[path] = entry
+        # noinspection PyBroadException
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            cache_file = self.cache_file(path)
+            tmp_file = f"{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(entry, f, separators=(",", ":"))
+            os.replace(tmp_file, cache_file)
+        except Exception as e:
+            print(f"Couldn't write cached blob: Path={path} Error={e}")
+
+    def fetch(self, path: str, generation: Generation = None) -> Optional[Tuple[str, Generation]]:
+        with self._lock:
+            if path in self._pending:  # read your own writes, even before they reach the backend
+                self.hits += 1
+                return self._pending[path], None
+            entry = self.entry(path)
+            now = self.clock()
+            if entry is not None and now - entry["checked_at"] < self.revalidate_seconds:
+                self.hits += 1
+                return self.unless_current(entry["content"], entry["generation"], generation)
+        fetched = self.backend.fetch(path, None if entry is None else entry["generation"])
+        with self._lock:
+            if fetched is None:
+                self.revalidated += 1
+                entry["checked_at"] = now
+                self.remember(path, entry["content"], entry["generation"], now)
+                content, current = entry["content"], entry["generation"]
+            else:
+                self.downloads += 1
+                content, current = fetched
+                self.remember(path, content, current, now)
+        return self.unless_current(content, current, generation)
+
+    @staticmethod
+    def unless_current(content: str, current: Generation, generation: Generation) -> Optional[Tuple[str, Generation]]:
+        return None if generation is not None and current == generation else (content, current)
+
+    def store(self, path: str, content: str) -> Generation:
+        if not self.write_back:
+            generation = self.backend.store(path, content)
+            with self._lock:
+                self.uploads += 1
+                self.remember(path, content, generation, self.clock())
+            return generation
+        with self._lock:
+            if self._closed:
+                raise IOError(f"Storage is closed: Path={path}")
+            # generation unknown until uploaded: if the upload never happens, the next reader re-downloads
+            self.remember(path, content, None, 0.0)
+            self._pending[path] = content
+            self._changed.notify_all()
+            if self._writer is None:
+                self._writer = threading.Thread(target=self.write_pending, name="storage-writer", daemon=True)
+                self._writer.start()
+        return None
+
+    def write_pending(self) -> None:
+        while True:
+            with self._lock:
+                while not self._pending:
+                    if self._closed:
+                        return
+                    self._changed.wait()
+                path, content = next(iter(self._pending.items()))
+                del self._pending[path]
+                self._uploading += 1
+            try:
+                self.upload(path, content)
+            finally:
+                with self._lock:
+                    self._uploading -= 1
+                    self._changed.notify_all()
+
+    def upload(self, path: str, content: str) -> None:
+        for attempt in range(1, self.max_upload_attempts + 1):
+            try:
+                generation = self.backend.store(path, content)
+            except Exception as e:
+                if attempt == self.max_upload_attempts:
+                    print(f"WARNING: Upload failed: Path={path} Attempts={attempt} Error={repr(e)}")
+                    return
+                time.sleep(0.5 * 2 ** attempt)
+                continue
+            with self._lock:
+                self.uploads += 1
+                entry = self._entries.get(path)
+                if path not in self._pending and entry is not None and entry["content"] == content:
+                    self.remember(path, content, generation, self.clock())
+            return
+
+    def flush(self, timeout_seconds: Optional[float] = None) -> bool:
+        with self._lock:
+            return self._changed.wait_for(lambda: not (self._pending or self._uploading), timeout=timeout_seconds)
+
+    def close(self) -> None:
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._changed.notify_all()
+        self.backend.close()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "revalidated": self.revalidated, "downloads": self.downloads,
+                "uploads": self.uploads, "pending": len(self._pending)}
+
+
+def open_storage(url: str) -> Storage:
+    # "gs://" (GCS behind the disk cache, the default), "gs://?nocache", "file:///some/root" or "sqlite:///some/file.db"
+    scheme, _, location = url.partition("://")
+    if scheme == "gs":
+        backend = GCSStorage()
+        if location == "?nocache":
+            return backend
+        return CachedStorage(backend, directory=os.environ.get("TESLA_WATCHER_STORAGE_CACHE", DEFAULT_CACHE_DIR))
+    if scheme == "file":
+        return LocalStorage(root=location or ".")
+    if scheme == "sqlite":
+        return SQLiteStorage(path=location)
+    raise ValueError(f"Unsupported storage: {url}")
+
+
+@lru_cache(maxsize=None)
+def default_storage() -> Storage:
+    # One per process: a single client (per thread) and a single write-back thread, shared by every watch
+    storage = open_storage(os.environ.get("TESLA_WATCHER_STORAGE", "gs://"))
+    atexit.register(storage.close)  # a one-shot run must not exit with uploads still queued
+    return storage
+
+
+@lru_cache(maxsize=None)
+def gcs_storage() -> GCSStorage:
+    return GCSStorage()
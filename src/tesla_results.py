@@ -1,91 +1,342 @@
-from typing import List
+from array import array
+from functools import cached_property
+from string import Formatter
+from sys import intern
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple, Union
+
+
+class Template:
+    # str.format re-parses its template on every call; this parses once into a %-pattern with positional fields
+
+    def __init__(self, text: str):
+        self.text = text
+        self.parts = [(literal, field) for (literal, field, _, _) in Formatter().parse(text)]
+        self.fields = tuple(field for (_, field) in self.parts if field is not None)
+        self.pattern = "".join(literal.replace("%", "%%") + ("" if field is None else "%s")
+                               for (literal, field) in self.parts)
+
+    def render(self, **fields) -> str:
+        return self.pattern % tuple([fields[field] for field in self.fields])
+
+    def stream(self, **fields) -> Iterator[str]:
+        for literal, field in self.parts:
+            if literal:
+                yield literal
+            if field is not None:
+                value = fields[field]
+                if isinstance(value, str):
+                    yield value
+                elif isinstance(value, Iterable):
+                    yield from value
+                else:
+                    yield str(value)
+
+
+HTML_PAGE = Template("""<html lang="en"><head></head><body><h3>
+        <a href="{link}">Top {count}/{total} @ {timestamp}</a></h3>{paras}</body></html>""".replace("\n", ""))
+HTML_BLOCK = Template("""<p><h4>{name}</h4><ol>{records}</ol>""")
+HTML_LONG_ROW = Template("""<li><b><a href="{link}">{summary}</a></b><br>{details}</li>""")
+HTML_SHORT_ROW = Template("""<li><a href="{link}">{summary}</a></li>""")
+PLAINTEXT_PAGE = Template("""Top {count}/{total} @ {timestamp}\nFrom: {link}\n\n{paras}""")
+PLAINTEXT_PARAGRAPH = Template("""{name}\n\n{records}""")
+PLAINTEXT_ROW = Template("""\t{summary}\n\t{details}\n\t{link}\n\n""")
 
 
 class TeslaSummary:
-    def __init__(self, year, demo, miles, options, price, taxes, fees, incentives, referral, order_url):
+    # Raw values only; every display string is formatted on demand when rendering
+    __slots__ = (
+        "vin", "year", "demo", "miles", "model", "trim", "paint", "wheels", "interior", "seating", "autopilot",
+        "range_value", "range_unit", "speed_value", "speed_unit",
+        "acceleration_value", "acceleration_unit", "acceleration_time", "acceleration_time_unit",
+        "purchase_price", "taxes_amount", "fees_amount", "incentives_amount", "referral_amount",
+        "option_codes", "link", "_summary", "_details"
+    )
+
+    def __init__(self, year, demo, miles, options, price, taxes, fees, incentives, referral, order_url, vin=None):
+        self.vin = vin
+        self.year = year
         self.demo = demo
         self.miles = miles
-        self.year = f"{year}"
-        self.make = "Tesla"
-        self.model = f'{options["MODEL"]["name"]}'
-        self.trim = f'{options["TRIM"]["name"]}'
-        self.paint = f'{options["PAINT"]["name"]}'
-        self.wheels = f'{options["WHEELS"]["name"]}'.replace("’’", "''")
-        self.range = f'{options["SPECS_RANGE"]["value"]} {options["SPECS_RANGE"]["unit_short"]}'
-        self.speed = f'{options["SPECS_TOP_SPEED"]["value"]} {options["SPECS_TOP_SPEED"]["unit_short"]}'
-        self.acceleration = f'{options["SPECS_ACCELERATION"]["acceleration_value"]} '\
-                            f'{options["SPECS_ACCELERATION"]["acceleration_unit_short"]} in '\
-                            f'{options["SPECS_ACCELERATION"]["value"]} '\
-                            f'{options["SPECS_ACCELERATION"]["unit_short"]}'
-        self.interior = f'{options["INTERIOR"]["name"]}'
-        self.seating = f'{options["REAR_SEATS"]["name"]}'
-        self.autopilot = f'{options["AUTOPILOT"]["name"]}'
-        self.price = f'${price:,.2f}'
-        self.payment = f'${price + taxes + fees:,.2f}'
-        self.cost = f'${price + taxes + fees - incentives - referral:,.2f}'
+        self.model = intern(f'{options["MODEL"]["name"]}')
+        self.trim = intern(f'{options["TRIM"]["name"]}')
+        self.paint = intern(f'{options["PAINT"]["name"]}')
+        self.wheels = intern(f'{options["WHEELS"]["name"]}'.replace("’’", "''"))
+        self.interior = intern(f'{options["INTERIOR"]["name"]}')
+        self.seating = intern(f'{options["REAR_SEATS"]["name"]}')
+        self.autopilot = intern(f'{options["AUTOPILOT"]["name"]}')
+        self.range_value = options["SPECS_RANGE"]["value"]
+        self.range_unit = intern(f'{options["SPECS_RANGE"]["unit_short"]}')
+        self.speed_value = options["SPECS_TOP_SPEED"]["value"]
+        self.speed_unit = intern(f'{options["SPECS_TOP_SPEED"]["unit_short"]}')
+        self.acceleration_value = intern(f'{options["SPECS_ACCELERATION"]["acceleration_value"]}')
+        self.acceleration_unit = intern(f'{options["SPECS_ACCELERATION"]["acceleration_unit_short"]}')
+        self.acceleration_time = options["SPECS_ACCELERATION"]["value"]
+        self.acceleration_time_unit = intern(f'{options["SPECS_ACCELERATION"]["unit_short"]}')
+        self.purchase_price = float(price)
+        self.taxes_amount = float(taxes)
+        self.fees_amount = float(fees)
+        self.incentives_amount = float(incentives)
+        self.referral_amount = float(referral)
+        self.option_codes = tuple(intern(f'{option["code"]}') for option in options.values())
         self.link = f'{order_url}'
+        self._summary = None
+        self._details = None
+
+    @classmethod
+    def of(cls, **fields) -> "TeslaSummary":
+        car = cls.__new__(cls)
+        for slot in cls.__slots__:
+            setattr(car, slot, fields.get(slot))
+        return car
+
+    @property
+    def make(self):
+        return "Tesla"
 
     @property
     def name(self):
-        return " ".join([self.year, self.make, self.model, self.trim])
+        return f"{self.year} Tesla {self.model} {self.trim}"
+
+    @property
+    def payment_amount(self):
+        return self.purchase_price + self.taxes_amount + self.fees_amount
+
+    @property
+    def cost_amount(self):
+        return self.payment_amount - self.incentives_amount - self.referral_amount
+
+    @property
+    def price(self):
+        return f'${self.purchase_price:,.2f}'
+
+    @property
+    def payment(self):
+        return f'${self.payment_amount:,.2f}'
+
+    @property
+    def cost(self):
+        return f'${self.cost_amount:,.2f}'
+
+    @property
+    def range(self):
+        return f'{self.range_value} {self.range_unit}'
+
+    @property
+    def speed(self):
+        return f'{self.speed_value} {self.speed_unit}'
+
+    @property
+    def acceleration(self):
+        return f'{self.acceleration_value} {self.acceleration_unit} in {self.acceleration_time} ' \
+               f'{self.acceleration_time_unit}'
+
+    @property
+    def summary(self):
+        # Rendered into every output form, so joined once and kept
+        if self._summary is None:
+            self._summary = " | ".join(filter(bool, map(str.strip, [
+                self.demo, self.miles, self.paint, self.interior, self.cost, self.payment])))
+        return self._summary
+
+    @property
+    def details(self):
+        if self._details is None:
+            self._details = " | ".join(filter(bool, map(str.strip, [
+                self.wheels, self.seating, self.range, self.speed, self.acceleration, self.autopilot])))
+        return self._details
+
+
+class TeslaBatch:
+    # Columnar container for many cars: numbers in float arrays, repeated strings dictionary-encoded
+    NUMERIC = ("purchase_price", "taxes_amount", "fees_amount", "incentives_amount", "referral_amount")
+    CATEGORICAL = ("year", "demo", "model", "trim", "paint", "wheels", "interior", "seating", "autopilot",
+                   "range_value", "range_unit", "speed_value", "speed_unit", "acceleration_value",
+                   "acceleration_unit", "acceleration_time", "acceleration_time_unit", "option_codes")
+    UNIQUE = ("vin", "miles", "link")
+
+    def __init__(self, cars: Iterable[TeslaSummary] = ()):
+        self.numeric = {column: array("d") for column in self.NUMERIC}
+        self.codes = {column: array("I") for column in self.CATEGORICAL}
+        self.categories: Dict[str, List] = {column: [] for column in self.CATEGORICAL}
+        self._lookup: Dict[str, Dict] = {column: {} for column in self.CATEGORICAL}
+        self.unique: Dict[str, List] = {column: [] for column in self.UNIQUE}
+        self.extend(cars)
+
+    def __len__(self):
+        return len(self.unique["vin"])
+
+    def append(self, car: TeslaSummary) -> None:
+        for column in self.NUMERIC:
+            self.numeric[column].append(getattr(car, column))
+        for column in self.CATEGORICAL:
+            value = getattr(car, column)
+            code = self._lookup[column].get(value)
+            if code is None:
+                code = self._lookup[column][value] = len(self.categories[column])
+                self.categories[column].append(value)
+            self.codes[column].append(code)
+        for column in self.UNIQUE:
+            self.unique[column].append(getattr(car, column))
+
+    def extend(self, cars: Iterable[TeslaSummary]) -> None:
+        for car in cars:
+            self.append(car)
+
+    def column(self, name: str) -> Sequence:
+        if name in self.numeric:
+            return self.numeric[name]
+        if name in self.unique:
+            return self.unique[name]
+        categories = self.categories[name]
+        return [categories[code] for code in self.codes[name]]
+
+    def __getitem__(self, i: int) -> TeslaSummary:
+        fields = {column: values[i] for (column, values) in self.numeric.items()}
+        fields.update({column: self.categories[column][codes[i]] for (column, codes) in self.codes.items()})
+        fields.update({column: values[i] for (column, values) in self.unique.items()})
+        return TeslaSummary.of(**fields)
+
+    def __iter__(self) -> Iterator[TeslaSummary]:
+        return (self[i] for i in range(len(self)))
+
+    def group_by_name(self) -> Dict[str, "BatchRows"]:
+        # Groups on the (year, model, trim) codes without materializing any rows
+        groups: Dict[Tuple[int, int, int], array] = {}
+        year, model, trim = self.codes["year"], self.codes["model"], self.codes["trim"]
+        for i in range(len(self)):
+            key = (year[i], model[i], trim[i])
+            indices = groups.get(key)
+            if indices is None:
+                indices = groups[key] = array("I")
+            indices.append(i)
+        years, models, trims = self.categories["year"], self.categories["model"], self.categories["trim"]
+        return {f"{years[y]} Tesla {models[m]} {trims[t]}": BatchRows(self, indices)
+                for ((y, m, t), indices) in groups.items()}
+
+
+class BatchRows:
+    def __init__(self, batch: TeslaBatch, indices: Sequence[int]):
+        self.batch = batch
+        self.indices = indices
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __iter__(self) -> Iterator[TeslaSummary]:
+        return (self.batch[i] for i in self.indices)
 
 
 class ResultPage:
-    def __init__(self, timestamp: str, total: int, link: str, cars: List[TeslaSummary]):
+    def __init__(self, timestamp: str, total: int, link: str, cars: Union[List[TeslaSummary], TeslaBatch]):
         self.timestamp = timestamp
         self.count = len(cars)
         self.total = total
         self.link = link
-        self.paras = {}
-        for car in cars:
-            if car.name not in self.paras:
-                self.paras[car.name] = []
-            self.paras[car.name].append(car)
-        self.html_page = """<html lang="en"><head></head><body><h3>
-        <a href="{link}">Top {count}/{total} @ {timestamp}</a></h3>{paras}</body></html>""".replace("\n", "")
-        self.html_block = """<p><h4>{name}</h4><ol>{records}</ol>"""
-        self.html_long_row = """<li><b><a href="{link}">{summary}</a></b><br>{details}</li>"""
-        self.html_short_row = """<li><a href="{link}">{summary}</a></li>"""
-        self.plaintext_page = """Top {count}/{total} @ {timestamp}\nFrom: {link}\n\n{paras}"""
-        self.plaintext_paragraph = """{name}\n\n{records}"""
-        self.plaintext_row = """\t{summary}\n\t{details}\n\t{link}\n\n"""
-
-    def format_page(self, page, block, row):
-        return page.format(
+        if isinstance(cars, TeslaBatch):
+            self.paras = cars.group_by_name()
+        else:
+            self.paras = {}
+            for car in cars:
+                if car.name not in self.paras:
+                    self.paras[car.name] = []
+                self.paras[car.name].append(car)
+        self.html_page = HTML_PAGE
+        self.html_block = HTML_BLOCK
+        self.html_long_row = HTML_LONG_ROW
+        self.html_short_row = HTML_SHORT_ROW
+        self.plaintext_page = PLAINTEXT_PAGE
+        self.plaintext_paragraph = PLAINTEXT_PARAGRAPH
+        self.plaintext_row = PLAINTEXT_ROW
+
+    def iter_page(self, page: Template, block: Template, row: Template) -> Iterator[str]:
+        return page.stream(
             link=self.link,
             count=self.count,
             total=self.total,
             timestamp=self.timestamp,
-            paras="".join([
-                block.format(
+            paras=(
+                chunk
+                for (name, cars) in self.paras.items()
+                for chunk in block.stream(
                     name=name,
-                    records="".join([
-                        row.format(
-                            link=car.link,
-                            summary=" | ".join(filter(bool, map(str.strip, [
-                                car.demo, car.miles, car.paint, car.interior, car.cost, car.payment]))),
-                            details=" | ".join(filter(bool, map(str.strip, [
-                                car.wheels, car.seating, car.range, car.speed, car.acceleration, car.autopilot])))
-                        )
+                    records=(
+                        chunk
                         for car in cars
-                    ])
+                        for chunk in row.stream(link=car.link, summary=car.summary, details=car.details)
+                    )
+                )
+            )
+        )
+
+    def format_page(self, page: Union[Template, str], block: Union[Template, str], row: Union[Template, str]) -> str:
+        page, block, row = (t if isinstance(t, Template) else Template(t) for t in (page, block, row))
+        return page.render(
+            link=self.link,
+            count=self.count,
+            total=self.total,
+            timestamp=self.timestamp,
+            paras="".join([
+                block.render(
+                    name=name,
+                    records="".join([row.render(link=car.link, summary=car.summary, details=car.details)
+                                     for car in cars])
                 )
                 for (name, cars) in self.paras.items()
             ])
         )
 
+    def stream(self, form: str = "plain_text", chunk_size: int = 64 * 1024) -> Iterator[str]:
+        # Renders incrementally, yielding chunks of roughly chunk_size characters instead of one big string
+        templates = {
+            "html_long_form": (self.html_page, self.html_block, self.html_long_row),
+            "html_short_form": (self.html_page, self.html_block, self.html_short_row),
+            "plain_text": (self.plaintext_page, self.plaintext_paragraph, self.plaintext_row),
+        }[form]
+        buffer, size = [], 0
+        for piece in self.iter_page(*templates):
+            buffer.append(piece)
+            size += len(piece)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
+
+    def to_dict(self) -> dict:
+        return {
+            "timestamp": self.timestamp,
+            "count": self.count,
+            "total": self.total,
+            "link": self.link,
+            "groups": {
+                name: [{
+                    "vin": car.vin,
+                    "price": car.purchase_price,
+                    "taxes": car.taxes_amount,
+                    "fees": car.fees_amount,
+                    "incentives": car.incentives_amount,
+                    "payment": car.payment_amount,
+                    "cost": car.cost_amount,
+                    "summary": car.summary,
+                    "details": car.details,
+                    "link": car.link
+                } for car in cars]
+                for (name, cars) in self.paras.items()
+            }
+        }
+
     @property
     def subject(self):
         return f"Tesla ({self.timestamp})\n"
 
-    @property
+    @cached_property
     def html_long_form(self):
         return self.format_page(page=self.html_page, block=self.html_block, row=self.html_long_row)
 
-    @property
+    @cached_property
     def html_short_form(self):
         return self.format_page(page=self.html_page, block=self.html_block, row=self.html_short_row)
 
-    @property
+    @cached_property
     def plain_text(self):
         return self.format_page(page=self.plaintext_page, block=self.plaintext_paragraph, row=self.plaintext_row)
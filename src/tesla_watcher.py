@@ -1,23 +1,39 @@
 import json
 import os
 import re
-import smtplib
-from datetime import datetime
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from typing import List, Any, Tuple
+import threading
+import time
+import math
+from concurrent.futures import Executor, ThreadPoolExecutor, wait
+from datetime import datetime, timezone as dt_timezone
+from typing import List, Any, Tuple, Optional, Callable, Hashable
+from zoneinfo import ZoneInfo
 
-import pytz
 import requests
 
-from src.incentives import INCENTIVES
+from src.cache import TaxQuoteCache
+from src.history import HistoryStore, open_history
+from src.incentives import INCENTIVES, IncentiveTable
+from src.mailer import Mailer
+from src.metrics import METRICS, Metrics
+from src.notifications import MailSink, Notification, NotificationPipeline, SMSSink, SlackSink, WebhookSink
+from src.ratelimit import THROTTLED, CircuitOpenError, EndpointLimiter, retry_after_seconds
+from src.recipients import recipient_index
+from src.sessions import PooledSession
+from src.sharing import SingleFlight
+from src.storage import Storage, default_storage
+from src.snapshots import Snapshot, SnapshotStore, diff, describe
 from src.tesla_results import TeslaSummary, ResultPage
-from src.utils import enrich_address, COMMON_HEADERS, REGEX_CSRF, backoff_random, \
-    parse_recipients, gcp_download_text, gcp_upload_text
+from src.tokens import OrderTokens, TokenCache, TokenRejectedError, extract_csrf, session_tokens
+from src.utils import enrich_address, timezone_at, COMMON_HEADERS
 
 GCP_BUCKET = "develop_pguruji_static_resources"
 GCP_PATH_MAILING_LIST = "tesla_watcher/mailing_list.txt"
-GCP_PATH_SEARCH_RESULT = "tesla_watcher/last_results.txt"
+GCP_PATH_SNAPSHOTS = "tesla_watcher/snapshots"
+GCP_PATH_TAX_QUOTES = "tesla_watcher/tax_quotes.json"
+
+ORDER_PAGE_CHUNK_BYTES = 16 * 1024
+HTTP_COUNTERS = ("requests", "retries", "bytes_sent", "bytes_received")
 
 
 class TeslaWatcher:
@@ -31,16 +47,50 @@ class TeslaWatcher:
             zipcode: str,
             model: str,
             trim: str,
+            latitude: Optional[float] = None,
+            longitude: Optional[float] = None,
+            timezone: Optional[str] = None,
+            lazy_geocode: bool = False,
             referral_discount: float = 500.0,
+            incentives: IncentiveTable = INCENTIVES,
+            tesla_base_url: str = "https://www.tesla.com",
             top_results_count: int = 10,
-            max_retry_attempts: int = 5,
+            max_retry_attempts: int = 2,
             timeout_seconds: int = 60,
+            max_in_flight: int = 4,
+            executor: Optional[Executor] = None,
+            shared: Optional[SingleFlight] = None,
+            session: Optional[requests.Session] = None,
+            limiter: Optional[EndpointLimiter] = None,
+            token_cache: Optional[TokenCache] = None,
+            pool_maxsize: Optional[int] = None,
+            http_retries: int = 3,
+            http_backoff_factor: float = 0.5,
+            tax_quote_cache: Optional[TaxQuoteCache] = None,
+            tax_quotes_path: Optional[str] = f"{GCP_BUCKET}/{GCP_PATH_TAX_QUOTES}",
+            tax_quote_ttl_seconds: int = 60 * 60 * 24 * 7,
+            tax_rules_version: str = "1",
+            storage: Optional[Storage] = None,
             mailing_list_path: str = f"{GCP_BUCKET}/{GCP_PATH_MAILING_LIST}",
-            last_results_path: str = f"{GCP_BUCKET}/{GCP_PATH_SEARCH_RESULT}",
+            snapshot_path: Optional[str] = None,
+            history: Optional[HistoryStore] = None,
             smtp_host: str = "smtp.gmail.com",
             smtp_user_email: str = os.environ.get("SMTP_USER_EMAIL", None),
-            smtp_user_password: str = os.environ.get("SMTP_USER_PASSWORD", None)
+            smtp_user_password: str = os.environ.get("SMTP_USER_PASSWORD", None),
+            mailer: Optional[Mailer] = None,
+            recipients: Optional[Tuple[List[str], List[str]]] = None,
+            webhook_urls: Optional[List[str]] = None,
+            slack_webhook_urls: Optional[List[str]] = None,
+            notifier: Optional[NotificationPipeline] = None,
+            metrics: Metrics = METRICS
     ):
+        # Observability: spans of the current run for the JSON run report, aggregates for Prometheus
+        self.metrics = metrics
+        self.tracer = metrics.tracer(watch=f"{model}/{trim}/{zipcode}")
+        self.last_report: Optional[dict] = None
+        self.run_http = dict.fromkeys(HTTP_COUNTERS, 0)
+        self._http_lock = threading.Lock()
+
         # Address
         self.street = street
         self.city = city
@@ -51,35 +101,118 @@ class TeslaWatcher:
         self.address_text = ", ".join([line for line in [
             street, city, (county if county.lower().endswith("county") else county.strip() + " County"),
             state, country, zipcode] if line])
-        self.latitude, self.longitude, self.timezone = enrich_address(address_text=self.address_text)
+        self._location = None
+        if latitude is not None and longitude is not None:
+            tz = ZoneInfo(timezone) if timezone else timezone_at(latitude=latitude, longitude=longitude)
+            self._location = (latitude, longitude, tz)
+        elif not lazy_geocode:
+            with self.tracer.span("geocode"):
+                self._location = enrich_address(address_text=self.address_text)
 
         # Tesla
         self.model = model
         self.trim = trim
         self.referral_discount = referral_discount
+        self.tesla_base_url = tesla_base_url.rstrip("/")
+        self.incentives = incentives.for_location(country, state, county, city)
 
         # Operational
         self.top_results_count = top_results_count
         self.max_retry_attempts = max_retry_attempts
         self.timeout_seconds = timeout_seconds
+        self.max_in_flight = max(1, max_in_flight)
+        # one pool for the watcher's lifetime (unless shared): a request stuck past its deadline keeps a worker busy
+        # until the HTTP timeout frees it, instead of stranding a thread of a pool that's thrown away every run
+        self.executor = executor or ThreadPoolExecutor(
+            max_workers=self.max_in_flight, thread_name_prefix="tesla-enrich")
+        self.shared = shared
+        self.storage = storage or default_storage()
+        self.limiter = limiter or EndpointLimiter()
+        self.session = session or PooledSession(
+            pool_maxsize=(pool_maxsize or self.max_in_flight + 1),
+            retry_total=http_retries,
+            retry_backoff_factor=http_backoff_factor
+        )
+        self.tokens = token_cache or session_tokens(self.session)
+        if tax_quote_cache is None:
+            tax_quote_cache = TaxQuoteCache(
+                path=tax_quotes_path,
+                download=self.download_text,
+                upload=self.upload_text,
+                rules_version=tax_rules_version,
+                ttl_seconds=tax_quote_ttl_seconds
+            )
+            tax_quote_cache.load()
+            self.owns_tax_quotes = True
+        else:
+            self.owns_tax_quotes = False
+        self.tax_quotes = tax_quote_cache
 
         # Notification
         self.smtp_host = smtp_host
         self.smtp_user = smtp_user_email
         self.smtp_password = smtp_user_password
-        self.email_recipients, self.sms_recipients = parse_recipients(gcp_download_text(mailing_list_path).split("\n"))
-        self.need_email = all(map(bool, [self.smtp_user, self.smtp_password, self.email_recipients]))
-        self.need_sms = all(map(bool, [self.smtp_user, self.smtp_password, self.sms_recipients]))
-        self.last_results_path = last_results_path
+        self.mailer = mailer or Mailer(host=smtp_host, user=smtp_user_email, password=smtp_user_password)
+        self.notifier = notifier or NotificationPipeline(sinks={
+            "EMAIL": MailSink(self.mailer, metrics=metrics),
+            # a slow SMTP session for one channel mustn't hold up the other
+            "SMS": SMSSink(self.mailer.clone(), metrics=metrics),
+            "WEBHOOK": WebhookSink(),
+            "SLACK": SlackSink()
+        }, metrics=metrics)
+        self.webhook_urls = list(webhook_urls or [])
+        self.slack_webhook_urls = list(slack_webhook_urls or [])
+        if recipients is None:
+            index = recipient_index(mailing_list_path)
+            index.load(self.download_text(mailing_list_path))
+            recipients = index.for_watch(f"{model}/{trim}")
+        self.set_recipients(recipients)
+        self.last_page: Optional[ResultPage] = None
+        self.history = history or open_history(os.environ.get("TESLA_WATCHER_HISTORY"))
+        self.snapshots = SnapshotStore(
+            path=(snapshot_path or f"{GCP_BUCKET}/{GCP_PATH_SNAPSHOTS}/{country}_{zipcode}_{model}_{trim}.json"),
+            download=self.download_text,
+            upload=self.upload_text
+        )
+
+    def download_text(self, path: str) -> str:
+        with self.tracer.span("storage_download", path=path):
+            text = self.storage.download_text(path)
+        self.tracer.count("storage_bytes_total", len(text), direction="download")
+        return text
+
+    def upload_text(self, path: str, content: str) -> None:
+        with self.tracer.span("storage_upload", path=path):
+            self.storage.upload_text(path, content)
+        self.tracer.count("storage_bytes_total", len(content), direction="upload")
+
+    @property
+    def location(self):
+        if self._location is None:
+            with self.tracer.span("geocode"):
+                self._location = enrich_address(address_text=self.address_text)
+        return self._location
+
+    @property
+    def latitude(self):
+        return self.location[0]
+
+    @property
+    def longitude(self):
+        return self.location[1]
+
+    @property
+    def timezone(self):
+        return self.location[2]
 
     @property
     def tesla_browser_url(self):
-        return (f"https://www.tesla.com/inventory/new/{self.model}?"
+        return (f"{self.tesla_base_url}/inventory/new/{self.model}?"
                 f"TRIM={self.trim}&arrangeby=plh&zip={self.zipcode}&range=0")
 
     @property
     def tesla_search_url(self):
-        return "https://www.tesla.com/inventory/api/v1/inventory-results"
+        return f"{self.tesla_base_url}/inventory/api/v1/inventory-results"
 
     @property
     def tesla_search_headers(self):
@@ -87,6 +220,9 @@ class TeslaWatcher:
 
     @property
     def tesla_search_params(self):
+        return self.tesla_search_page_params(offset=0, count=self.top_results_count)
+
+    def tesla_search_page_params(self, offset, count):
         return {
             "query": json.dumps(
                 {
@@ -108,8 +244,8 @@ class TeslaWatcher:
                         "range": 0,
                         "region": self.state
                     },
-                    "offset": 0,
-                    "count": self.top_results_count,
+                    "offset": offset,
+                    "count": count,
                     "outsideOffset": 0,
                     "outsideSearch": False
                 },
@@ -119,7 +255,7 @@ class TeslaWatcher:
         }
 
     def tesla_order_url(self, vin):
-        return (f"https://www.tesla.com/{self.model}/order/{vin}?"
+        return (f"{self.tesla_base_url}/{self.model}/order/{vin}?"
                 f"postal={self.zipcode}&region={self.state}&coord={self.latitude},{self.longitude}")
 
     @property
@@ -136,7 +272,7 @@ class TeslaWatcher:
 
     @property
     def tesla_taxes_url(self):
-        return "https://www.tesla.com/configurator/api/v3/fees-taxes-calculator"
+        return f"{self.tesla_base_url}/configurator/api/v3/fees-taxes-calculator"
 
     # noinspection PyMethodMayBeStatic
     def tesla_taxes_headers(self, referrer, coin_auth):
@@ -163,132 +299,322 @@ class TeslaWatcher:
             "csrf_value": f"{csrf_value}"
         }
 
-    def smtp_send(self, channel, recipients, subject_line, html_body):
-        try:
-            for recipient in recipients:
-                msg = MIMEMultipart()
-                msg['From'] = self.smtp_user
-                msg['To'] = recipient
-                msg['Subject'] = subject_line
-                msg.attach(MIMEText(html_body, 'html'))
-                with smtplib.SMTP(host=self.smtp_host, port=587) as server:
-                    server.starttls()
-                    server.login(self.smtp_user, self.smtp_password)
-                    server.sendmail(self.smtp_user, recipients, msg.as_string())
-        except Exception as e:
-            raise IOError(f"Error notifying results: Channel={channel}") from e
+    def set_recipients(self, recipients: Tuple[List[str], List[str]]) -> None:
+        self.email_recipients, self.sms_recipients = recipients
+        self.need_email = all(map(bool, [self.smtp_user, self.smtp_password, self.email_recipients]))
+        self.need_sms = all(map(bool, [self.smtp_user, self.smtp_password, self.sms_recipients]))
 
-    def notify(self, top_results: List[TeslaSummary], results: int) -> None:
-        timestamp = datetime.now(pytz.utc).astimezone(self.timezone).strftime("%b %d, %I %p").replace(" 0", " ")
+    def local_timestamp(self, epoch_seconds: float) -> str:
+        moment = datetime.fromtimestamp(epoch_seconds, dt_timezone.utc).astimezone(self.timezone)
+        return moment.strftime("%b %d, %I %p").replace(" 0", " ")
+
+    def notify(self, top_results: List[TeslaSummary], results: int, listed: List[str]) -> ResultPage:
+        with self.tracer.span("notify"):
+            return self.notify_results(top_results, results, listed)
+
+    def notify_results(self, top_results: List[TeslaSummary], results: int, listed: List[str]) -> ResultPage:
+        now = time.time()
+        timestamp = self.local_timestamp(now)
         results_page = ResultPage(timestamp=timestamp, total=results, link=self.tesla_browser_url, cars=top_results)
-        curr = results_page.plain_text.split("\n")
         print(f"Search Results:\n{results_page.plain_text}")
-        # noinspection PyBroadException
-        try:
-            prev = gcp_download_text(self.last_results_path).split("\n")
-        except Exception as e:
-            print(f"Couldn't read last results: {e}")
-            prev = []
-        no_change = len(curr) == len(prev) and all([curr[i] == prev[i] for i in range(1, len(prev))])
+        previous = self.snapshots.load()
+        snapshot = Snapshot.from_cars(top_results, taken_at=now, previous=previous, listed=listed)
+        delta = diff(previous, snapshot)
+        no_change = not delta
+        since = self.local_timestamp(previous.taken_at) if previous.taken_at else "first run"
         if no_change:
-            print(f'INFO: No change as of {curr[0].split("@")[1].strip()} since {prev[0].split("@")[1].strip()}')
-        if not (self.need_email or self.need_sms):
+            print(f"INFO: No change as of {timestamp} since {since}")
+        else:
+            print("INFO: Changes:\n\t" + "\n\t".join(describe(delta)))
+        if not (self.need_email or self.need_sms or self.webhook_urls or self.slack_webhook_urls):
             print("WARNING: missing email user, password, or recipients - Will not notify results")
+        # Delivery happens on the notifier's per-channel workers: this only enqueues
         if self.need_email:
-            subject = results_page.subject + (f' - No Change ({prev[0].split("@")[1]})' if no_change else "")
-            self.smtp_send("EMAIL", self.email_recipients, subject, results_page.html_long_form)
-        if self.need_sms and not no_change:
-            self.smtp_send("SMS", self.sms_recipients, results_page.subject, results_page.html_short_form)
-        gcp_upload_text(path=self.last_results_path, content=results_page.plain_text)
+            subject = results_page.subject + (f" - No Change ({since})" if no_change else "")
+            self.notifier.enqueue(Notification("EMAIL", self.email_recipients, subject, results_page.html_long_form))
+        if not no_change:
+            if self.need_sms:
+                self.notifier.enqueue(
+                    Notification("SMS", self.sms_recipients, results_page.subject, results_page.html_short_form))
+            if self.webhook_urls:
+                self.notifier.enqueue(Notification(
+                    "WEBHOOK", self.webhook_urls, results_page.subject, json.dumps(results_page.to_dict())))
+            if self.slack_webhook_urls:
+                self.notifier.enqueue(
+                    Notification("SLACK", self.slack_webhook_urls, results_page.subject, results_page.plain_text))
+        self.snapshots.save(snapshot, delta)
+        return results_page
 
-    def order_identifiers(self, vin):
+    def order_identifiers(self, vin) -> OrderTokens:
         url = self.tesla_order_url(vin=vin)
         headers = self.tesla_order_headers
         timeout = self.timeout_seconds
         params = self.tesla_order_params
 
-        resp = requests.get(url=url, params=params, headers=headers, timeout=timeout)
-        order_url = resp.url
+        with self.tracer.span("order_identifiers", vin=vin):
+            resp = self.request("order", "GET", url=url, params=params, headers=headers, timeout=timeout, stream=True)
+            try:
+                if resp.status_code != 200:
+                    raise IOError(f"Order page failed: ResponseCode={resp.status_code}")
+                # the tokens sit in an inline script: stop reading (and drop the connection) as soon as they've passed
+                csrf, bytes_read = extract_csrf(resp.iter_content(chunk_size=ORDER_PAGE_CHUNK_BYTES))
+            finally:
+                resp.close()
+        self.count_http({"bytes_received": bytes_read})
+        self.tracer.count("order_page_bytes_total", bytes_read)
+        if csrf is None:
+            raise IOError(f"CSRF token not found on order page: BytesRead={bytes_read}")
         coin_auth = resp.cookies["coin_auth"]
-        csrf_name, csrf_value = REGEX_CSRF.match(resp.text).groups()
-        return order_url, coin_auth, csrf_name, csrf_value
+        expires = next((c.expires for c in resp.cookies if c.name == "coin_auth" and c.expires), None)
+        now = time.time()
+        return OrderTokens(resp.url, coin_auth, *csrf, issued_at=now, expires_at=expires or float("inf"))
 
-    def taxes_and_fees(self, model, trim, price, order_url, coin_auth, csrf_name, csrf_value) -> Tuple[float, float]:
+    def taxes_and_fees(
+            self, model, trim, price, order_url, coin_auth, csrf_name, csrf_value, cached_tokens: bool = False
+    ) -> Tuple[float, float]:
         url = self.tesla_taxes_url
         headers = self.tesla_taxes_headers(referrer=order_url, coin_auth=coin_auth)
         timeout = self.timeout_seconds
         params = self.tesla_taxes_body(
             model=model, trim=trim, price_before_discounts=price, csrf_name=csrf_name, csrf_value=csrf_value)
+        # with reused tokens a 403 most likely means they've gone stale rather than that tesla.com wants us to slow down
+        throttled = (429,) if cached_tokens else THROTTLED
 
-        resp = requests.post(url=url, headers=headers, timeout=timeout, json=params)
+        with self.tracer.span("taxes_and_fees", model=model, trim=trim):
+            resp = self.request("taxes", "POST", url=url, headers=headers, timeout=timeout, json=params,
+                                throttled=throttled)
         if resp.status_code == 200:
             costs = json.loads(resp.content)
             return (sum(float(d["amount"]) for d in costs["AUTO_CASH"]["taxes"]),
                     sum(float(d["amount"]) for d in costs["AUTO_CASH"]["fees"]))
+        elif resp.status_code == 403 and cached_tokens:
+            raise TokenRejectedError(f"Order tokens rejected: ResponseCode={resp.status_code}")
         else:
             raise IOError(f"Taxes and Fees calculator API failed: ResponseCode={resp.status_code}")
 
-    def total_incentives(self, car):
-        return sum((v if v else 0.0)
-                   for v in [inc(car, self.country, self.state, self.county, self.city) for inc in INCENTIVES])
+    def total_incentives(self, car, options=None):
+        options = options or {code["group"]: code for code in car["OptionCodeData"]}
+        return self.incentives.evaluate(
+            price=car["PurchasePrice"], model=options["MODEL"]["code"], trim=options["TRIM"]["code"])
+
+    def share(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        return fn() if self.shared is None else self.shared.do(key, fn)
+
+    def quote_taxes_and_fees(self, vin, model, trim, price) -> Tuple[str, float, float]:
+        key = TaxQuoteCache.key(self.country, self.state, self.city, self.zipcode, model, trim, price)
+        quote = self.tax_quotes.get(key)
+        if quote is not None:
+            taxes, fees = quote
+            return self.tesla_order_url(vin=vin), taxes, fees
+        order_url, taxes, fees = self.share(("quote",) + key, lambda: self.request_quote(vin, model, trim, price))
+        self.tax_quotes.put(key, (taxes, fees))
+        return order_url, taxes, fees
+
+    def request_quote(self, vin, model, trim, price) -> Tuple[str, float, float]:
+        # One order page's tokens serve every VIN of this model on this session; a rejected set is replaced up to twice
+        key = (self.tesla_base_url, self.model)
+        for attempt in range(3):
+            tokens, cached = self.tokens.get(key, lambda: self.order_identifiers(vin))
+            self.tracer.count("order_tokens_total", source="cache" if cached else "order_page")
+            order_url = self.tesla_order_url(vin=vin) if cached else tokens.order_url
+            try:
+                taxes, fees = self.taxes_and_fees(
+                    model=model,
+                    trim=trim,
+                    price=price,
+                    order_url=order_url,
+                    coin_auth=tokens.coin_auth,
+                    csrf_name=tokens.csrf_name,
+                    csrf_value=tokens.csrf_value,
+                    cached_tokens=cached
+                )
+            except TokenRejectedError:
+                self.tokens.reject(key, tokens)
+                self.tracer.count("order_tokens_rejected_total")
+                if attempt == 2:
+                    raise
+                continue
+            return order_url, taxes, fees
+
+    def invalidate_tax_quotes(self, rules_version: Optional[str] = None) -> int:
+        if rules_version is not None:
+            self.tax_quotes.rules_version = rules_version
+        return self.tax_quotes.invalidate()
+
+    def enrich(self, car: dict[str, Any]) -> TeslaSummary:
+        price = car["PurchasePrice"]
+        options = {code["group"]: code for code in car["OptionCodeData"]}
+        order_url, taxes, fees = self.quote_taxes_and_fees(
+            vin=car["VIN"], model=options["MODEL"]["code"], trim=options["TRIM"]["code"], price=price)
+        incentives = self.total_incentives(car, options)
+        return TeslaSummary(
+            year=car["Year"],
+            demo=("[DEMO]" if car["IsDemo"] else ""),
+            miles=(f'[{car["Odometer"]} {car["OdometerType"]}]' if car["Odometer"] else ""),
+            options=options,
+            price=price,
+            taxes=taxes,
+            fees=fees,
+            incentives=incentives,
+            referral=self.referral_discount,
+            order_url=order_url,
+            vin=car["VIN"]
+        )
+
+    def enrich_all(self, cars: List[dict[str, Any]]) -> List[TeslaSummary]:
+        # Each VIN costs two sequential round trips (order page, then tax quote), so a VIN gets a budget of two
+        # timeouts, and the batch one such budget per wave of max_in_flight VINs, counted from submission. VINs that
+        # fail or are still pending at the deadline are dropped without affecting the rest, and order is preserved.
+        vin_timeout = 2 * self.timeout_seconds
+        batch_timeout = vin_timeout * math.ceil(len(cars) / self.max_in_flight)
+        deadline = time.monotonic() + batch_timeout
+        futures = [self.executor.submit(self.enrich, car) for car in cars]
+        wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        enriched = []
+        for car, future in zip(cars, futures):
+            if not future.done():
+                future.cancel()  # not started yet; one that's running finishes on its own, bounded by the HTTP timeout
+                print(f"WARNING: VIN skipped: VIN={car['VIN']} Error=Timed out after {batch_timeout}s")
+                continue
+            try:
+                enriched.append(future.result())
+            except Exception as e:
+                print(f"WARNING: VIN skipped: VIN={car['VIN']} Error={repr(e)}")
+        return enriched
 
-    def extract(self, page: dict[str, Any]) -> Tuple[List[TeslaSummary], int]:
+    def extract(self, page: dict[str, Any]) -> Tuple[List[TeslaSummary], int, List[str]]:
         total = page["total_matches_found"]
-        top_cars = []
-        for car in page["results"]:
-            vin = car["VIN"]
-            order_url, coin_auth, csrf_name, csrf_value = self.order_identifiers(vin=vin)
-            price = car["PurchasePrice"]
-            options = {code["group"]: code for code in car["OptionCodeData"]}
-            taxes, fees = self.taxes_and_fees(
-                model=options["MODEL"]["code"],
-                trim=options["TRIM"]["code"],
-                price=price,
-                order_url=order_url,
-                coin_auth=coin_auth,
-                csrf_name=csrf_name,
-                csrf_value=csrf_value
-            )
-            incentives = self.total_incentives(car)
-            top_cars.append(TeslaSummary(
-                year=car["Year"],
-                demo=("[DEMO]" if car["IsDemo"] else ""),
-                miles=(f'[{car["Odometer"]} {car["OdometerType"]}]' if car["Odometer"] else ""),
-                options=options,
-                price=price,
-                taxes=taxes,
-                fees=fees,
-                incentives=incentives,
-                referral=self.referral_discount,
-                order_url=order_url
-            ))
-        return top_cars, total
-
-    def fetch(self):
+        top_cars = self.enrich_all(page["results"])
+        if self.owns_tax_quotes:
+            print(f"INFO: Tax quotes {self.tax_quotes.stats}")
+            self.tax_quotes.save()
+        if page["results"] and not top_cars:
+            raise IOError(f"Failed to enrich any of {len(page['results'])} results")
+        return top_cars, total, [car["VIN"] for car in page["results"]]
+
+    def fetch(self, offset=0, count=None):
+        params = self.tesla_search_page_params(offset=offset, count=(count or self.top_results_count))
+        return self.share(("search", params["query"]), lambda: self.fetch_page(params))
+
+    def fetch_page(self, params):
         url = self.tesla_search_url
-        params = self.tesla_search_params
         headers = self.tesla_search_headers
         timeout_seconds = self.timeout_seconds
         try:
-            resp = requests.get(url=url, params=params, headers=headers, timeout=timeout_seconds)
+            with self.tracer.span("fetch"):
+                resp = self.request("search", "GET", url=url, params=params, headers=headers, timeout=timeout_seconds)
             if resp.status_code == 200:
                 return json.loads(resp.content)
             raise IOError(f"ResponseCode={resp.status_code}")
+        except CircuitOpenError:
+            raise
         except Exception as e:
             pr = requests.Request(method="GET", url=url, params=params, headers=headers).prepare()
             raise IOError(f"Failed to fetch: URL={pr.url} headers={pr.headers}") from e
 
-    def run(self):
+    def request(self, endpoint: str, method: str, url: str, throttled=THROTTLED, **kwargs) -> requests.Response:
+        # Every tesla.com call passes the endpoint's circuit breaker and token bucket (both shared by all threads and
+        # watches using this limiter). Throttling slows the bucket down for everyone and is retried here; throttling,
+        # server errors and connection failures all count towards opening the breaker.
+        bucket, breaker = self.limiter.bucket(endpoint), self.limiter.breaker(endpoint)
         attempt = 0
-        max_retry_attempts = 1  # self.max_retry_attempts
         while True:
             attempt += 1
+            breaker.allow()
+            bucket.acquire()
             try:
-                self.notify(*self.extract(self.fetch()))
-                break
-            except Exception as e:
-                if attempt < max_retry_attempts:
-                    print(f"Failed Attempt #{attempt}: Error={repr(e)}")
-                    backoff_random()
-                else:
-                    raise e
+                resp = self.session.request(method, url, **kwargs)
+            except Exception:
+                breaker.failed()
+                raise
+            self.count_response(resp, streamed=kwargs.get("stream", False))
+            if resp.status_code in throttled:
+                retry_after = retry_after_seconds(resp.headers.get("Retry-After"))
+                bucket.throttled(retry_after)
+                breaker.failed()
+                self.tracer.count("http_throttled_total", endpoint=endpoint, status=resp.status_code)
+                if attempt < self.limiter.max_attempts:
+                    resp.close()
+                    if retry_after is None:  # otherwise the paused bucket already holds the next attempt back
+                        time.sleep(self.limiter.backoff.delay(attempt))
+                    continue
+            elif resp.status_code >= 500:
+                breaker.failed()
+            elif resp.status_code in THROTTLED:
+                # a status the caller handles itself (403 for cached order tokens): no evidence either way
+                breaker.inconclusive()
+            else:
+                bucket.succeeded()
+                breaker.succeeded()
+            return resp
+
+    def count_response(self, resp: requests.Response, streamed: bool = False) -> None:
+        # Counted per call rather than as a delta of the session's totals: the session may be shared with watches
+        # running at the same time. A streamed body is counted by whoever reads it.
+        body = resp.request.body if resp.request is not None else None
+        retries = getattr(resp.raw, "retries", None)
+        self.count_http({
+            "requests": 1,
+            # urllib3 retries happen inside the session: one call may have cost several round trips
+            "retries": len(retries.history) if retries is not None else 0,
+            "bytes_sent": len(body.encode("utf-8") if isinstance(body, str) else body or b""),
+            "bytes_received": 0 if streamed else len(resp.content or b"")
+        })
+
+    def count_http(self, counts: dict) -> None:
+        with self._http_lock:
+            for key, value in counts.items():
+                self.run_http[key] += value
+        for key, value in counts.items():
+            if value:
+                self.tracer.count(f"http_{key}_total", value)
+
+    @property
+    def http_stats(self):
+        return getattr(self.session, "stats", {})
+
+    def run(self) -> ResultPage:
+        attempt = 0
+        self.tracer.start_run()
+        with self._http_lock:
+            self.run_http = dict.fromkeys(HTTP_COUNTERS, 0)
+        outcome = "failed"
+        try:
+            # Only fetch and extract are retried: they have no side effects. Notifying and saving the snapshot happen
+            # once, so a failure there can't re-send what went out on an earlier attempt.
+            while True:
+                attempt += 1
+                self.tracer.count("run_attempts_total")
+                try:
+                    top_cars, total, listed = self.extract(self.fetch())
+                    break
+                except Exception as e:
+                    if attempt >= self.max_retry_attempts:
+                        raise e
+                    delay = self.limiter.backoff.delay(attempt + 1)
+                    if isinstance(e, CircuitOpenError):  # no point retrying before the breaker lets a probe through
+                        delay = max(delay, e.retry_in_seconds)
+                    print(f"Failed Attempt #{attempt}: Error={repr(e)} RetryIn={delay:.1f}s")
+                    time.sleep(delay)
+            self.last_page = self.notify(top_cars, total, listed)
+            if self.history is not None:  # once per successful run, however many attempts it took
+                self.history.record(top_cars, seen_at=time.time(), model=self.model, trim=self.trim,
+                                    zipcode=self.zipcode, total=total)
+            outcome = "ok"
+            return self.last_page
+        finally:
+            if self.history is not None:
+                self.history.flush()
+            self.report_run(outcome=outcome, attempts=attempt)
+            self.tracer.end_run()
+
+    def report_run(self, outcome: str, attempts: int) -> None:
+        with self._http_lock:
+            http = dict(self.run_http)
+        self.tracer.count("runs_total", outcome=outcome)
+        if not self.metrics.enabled:
+            print(f"INFO: HTTP {http}")
+            return
+        self.last_report = self.tracer.report(outcome=outcome, attempts=attempts, http=http,
+                                              limiter=self.limiter.stats, tokens=self.tokens.stats)
+        print(f"INFO: Run report {json.dumps(self.last_report, separators=(',', ':'))}")
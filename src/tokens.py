@@ -0,0 +1,159 @@
+import threading
+import time
+import weakref
+from typing import Callable, Dict, Hashable, Iterable, Optional, Tuple
+
+CSRF_KEY_MARKER = b'"csrf_key":"'
+CSRF_TOKEN_MARKER = b'","csrf_token":"'
+MAX_VALUE_BYTES = 4096
+
+
+class TokenRejectedError(IOError):
+    pass
+
+
+class CsrfScanner:
+    # Finds the first csrf_key/csrf_token pair, fed the raw page a chunk at a time: no decoding, no backtracking, and
+    # the caller stops reading as soon as it's found. REGEX_CSRF's greedy prefix takes the last pair instead; the two
+    # agree on order pages, which carry one. Until the key marker shows up only a marker's length of overlap is kept
+    # between chunks; after it, at most MAX_VALUE_BYTES before giving up on that candidate.
+
+    def __init__(self):
+        self.bytes_read = 0
+        self._buffer = b""
+        self._start = -1  # where the key's value starts in _buffer, once the key marker is found
+
+    def feed(self, chunk: bytes) -> Optional[Tuple[str, str]]:
+        self.bytes_read += len(chunk)
+        if self._start < 0:
+            # search the chunk in place; only a marker straddling the previous chunk needs a (small) copy
+            overlap = len(CSRF_KEY_MARKER) - 1
+            straddling = self._buffer + chunk[:overlap]
+            at = straddling.find(CSRF_KEY_MARKER)
+            if at >= 0:
+                buffer = straddling[at:] + chunk[overlap:]
+            else:
+                at = chunk.find(CSRF_KEY_MARKER)
+                if at < 0:
+                    self._buffer = chunk[-overlap:] if len(chunk) >= overlap else straddling[-overlap:]
+                    return None
+                buffer = chunk[at:]
+            self._start = len(CSRF_KEY_MARKER)
+        else:
+            buffer = self._buffer + chunk
+        while True:
+            if self._start < 0:
+                at = buffer.find(CSRF_KEY_MARKER)
+                if at < 0:
+                    self._buffer = buffer[-(len(CSRF_KEY_MARKER) - 1):]
+                    return None
+                buffer = buffer[at:]
+                self._start = len(CSRF_KEY_MARKER)
+            separator = buffer.find(CSRF_TOKEN_MARKER, self._start)
+            end = -1 if separator < 0 else buffer.find(b'"', separator + len(CSRF_TOKEN_MARKER))
+            if end >= 0:
+                # the key is the one right before the token, as REGEX_CSRF pairs them
+                start = buffer.rfind(CSRF_KEY_MARKER, 0, separator) + len(CSRF_KEY_MARKER)
+                return (buffer[start:separator].decode("utf-8"),
+                        buffer[separator + len(CSRF_TOKEN_MARKER):end].decode("utf-8"))
+            if len(buffer) - self._start <= MAX_VALUE_BYTES:
+                self._buffer = buffer
+                return None
+            # a csrf_key that isn't followed by a token: look for the next one
+            buffer = buffer[1:]
+            self._start = -1
+
+
+def extract_csrf(chunks: Iterable[bytes]) -> Tuple[Optional[Tuple[str, str]], int]:
+    # ((csrf_key, csrf_token) or None, bytes read); stops pulling chunks at the first match
+    scanner = CsrfScanner()
+    for chunk in chunks:
+        found = scanner.feed(chunk)
+        if found is not None:
+            return found, scanner.bytes_read
+    return None, scanner.bytes_read
+
+
+class OrderTokens:
+    # What a taxes-and-fees call needs from an order page: the coin_auth session cookie and the CSRF pair
+    __slots__ = ("order_url", "coin_auth", "csrf_name", "csrf_value", "issued_at", "expires_at", "uses")
+
+    def __init__(self, order_url: str, coin_auth: str, csrf_name: str, csrf_value: str, issued_at: float,
+                 expires_at: float):
+        self.order_url = order_url
+        self.coin_auth = coin_auth
+        self.csrf_name = csrf_name
+        self.csrf_value = csrf_value
+        self.issued_at = issued_at
+        self.expires_at = expires_at
+        self.uses = 0
+
+
+class TokenCache:
+    # One set of order tokens per key (e.g. host and model), reused across VINs until it expires, is used max_uses
+    # times, or a taxes call rejects it. Concurrent misses on one key fetch a single order page between them.
+
+    def __init__(self, ttl_seconds: float = 15 * 60, max_uses: int = 500, clock: Callable[[], float] = time.time):
+        self.ttl_seconds = ttl_seconds
+        self.max_uses = max_uses
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.rejections = 0
+        self._tokens: Dict[Hashable, OrderTokens] = {}
+        self._fetching: Dict[Hashable, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def valid(self, tokens: Optional[OrderTokens]) -> bool:
+        return tokens is not None and tokens.uses < self.max_uses and self.clock() < tokens.expires_at
+
+    def take(self, key: Hashable) -> Optional[OrderTokens]:
+        with self._lock:
+            tokens = self._tokens.get(key)
+            if not self.valid(tokens):
+                return None
+            tokens.uses += 1
+            self.hits += 1
+            return tokens
+
+    def get(self, key: Hashable, fetch: Callable[[], OrderTokens]) -> Tuple[OrderTokens, bool]:
+        # (tokens, whether they came from the cache)
+        tokens = self.take(key)
+        if tokens is not None:
+            return tokens, True
+        with self._lock:
+            fetching = self._fetching.setdefault(key, threading.Lock())
+        with fetching:
+            tokens = self.take(key)  # fetched by another thread while this one waited
+            if tokens is not None:
+                return tokens, True
+            tokens = fetch()
+            tokens.expires_at = min(tokens.expires_at, tokens.issued_at + self.ttl_seconds)
+            tokens.uses = 1
+            with self._lock:
+                self.misses += 1
+                self._tokens[key] = tokens
+            return tokens, False
+
+    def reject(self, key: Hashable, tokens: OrderTokens) -> None:
+        with self._lock:
+            self.rejections += 1
+            if self._tokens.get(key) is tokens:
+                del self._tokens[key]
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {"tokens": len(self._tokens), "hits": self.hits, "misses": self.misses, "rejections": self.rejections}
+
+
+_SESSION_TOKENS: "weakref.WeakKeyDictionary" = weakref.WeakKeyDictionary()
+_SESSION_TOKENS_LOCK = threading.Lock()
+
+
+def session_tokens(session) -> TokenCache:
+    # Tokens belong to the HTTP session that fetched them: every watcher sharing a session shares its cache
+    with _SESSION_TOKENS_LOCK:
+        cache = _SESSION_TOKENS.get(session)
+        if cache is None:
+            cache = _SESSION_TOKENS[session] = TokenCache()
+        return cache
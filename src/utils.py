@@ -1,12 +1,13 @@
+import os
 import re
 import time
+from functools import lru_cache
 from random import randint
+from typing import Optional, Tuple
+from zoneinfo import ZoneInfo
 
-import pytz
-from geopy.extra.rate_limiter import RateLimiter
-from geopy.geocoders import Nominatim
-from google.cloud import storage
-from timezonefinder import TimezoneFinder
+from src.cache import GeocodeCache
+from src.storage import gcs_storage
 
 COMMON_HEADERS = {
     "accept": "*/*",
@@ -22,6 +23,9 @@ COMMON_HEADERS = {
                   "Chrome/116.0.0.0 Safari/537.36"
 }
 
+GEOCODE_CACHE = GeocodeCache(path=os.environ.get(
+    "TESLA_WATCHER_GEOCODE_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "tesla_watcher", "geocode.json")))
+
 REGEX_EMAIL = re.compile(
     r"^([a-z0-9!#$%&'*+/=?^_`{|}~-]+(?:\.[a-z0-9!#$%&'*+/=?^_`{|}~-]+)*)"
     r"@((?:[a-z0-9](?:[a-z0-9-]*[a-z0-9])?\.)+[a-z0-9](?:[a-z0-9-]*[a-z0-9])?)$",
@@ -49,23 +53,56 @@ SMS_GATEWAYS = {
 
 
 def gcp_upload_text(path: str, content: str) -> None:
-    bucket, blob = path.split("/", 1)
-    storage.Client().bucket(bucket).blob(blob).upload_from_string(content)
+    gcs_storage().upload_text(path, content)
 
 
 def gcp_download_text(path: str) -> str:
-    bucket, blob = path.split("/", 1)
-    return storage.Client().bucket(bucket).blob(blob).download_as_text()
+    return gcs_storage().download_text(path)
+
+
+def local_upload_text(path: str, content: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def local_download_text(path: str) -> str:
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
 
+@lru_cache(maxsize=None)
+def timezone_finder():
+    # loading the timezone polygons is the expensive part; one instance serves the whole process, and runs with a
+    # cached geocode or pre-seeded coordinates and timezone never import timezonefinder at all
+    from timezonefinder import TimezoneFinder
+    return TimezoneFinder()
 
-def enrich_address(address_text):
+
+def timezone_at(latitude: float, longitude: float) -> ZoneInfo:
+    return ZoneInfo(timezone_finder().timezone_at(lng=longitude, lat=latitude))
+
+
+def geocode_address(address_text: str) -> Tuple[float, float]:
+    from geopy.extra.rate_limiter import RateLimiter
+    from geopy.geocoders import Nominatim
     geolocator = Nominatim(user_agent="tesla_watcher", timeout=20)
     geocode = RateLimiter(
         geolocator.geocode, min_delay_seconds=3.0, error_wait_seconds=3.0, swallow_exceptions=False, max_retries=10)
     geolocation = geocode(address_text)
-    tf = TimezoneFinder()
-    timezone = pytz.timezone(tf.timezone_at(lng=geolocation.longitude, lat=geolocation.latitude))
-    return round(geolocation.latitude, 5), round(geolocation.longitude, 5), timezone
+    return round(geolocation.latitude, 5), round(geolocation.longitude, 5)
+
+
+def enrich_address(address_text, cache: Optional[GeocodeCache] = GEOCODE_CACHE):
+    cached = None if cache is None else cache.get(address_text)
+    if cached is not None:
+        latitude, longitude, timezone_name = cached
+        return latitude, longitude, ZoneInfo(timezone_name)
+    latitude, longitude = geocode_address(address_text)
+    timezone = timezone_at(latitude=latitude, longitude=longitude)
+    if cache is not None:
+        cache.put(address_text, latitude, longitude, timezone.key)
+    return latitude, longitude, timezone
 
 
 def backoff_random(_min=3, _max=9):
@@ -73,24 +110,8 @@ def backoff_random(_min=3, _max=9):
 
 
 def parse_recipients(recipients):
-    email_list = []
-    sms_list = []
-    for recipient in recipients:
-        recipient = recipient.strip()
-        matched = REGEX_EMAIL.match(recipient)
-        if matched is None:
-            print(f"WARNING: invalid email: {recipient}")
-            continue
-        local, domain = matched.groups()
-        known_sms_gateway = domain in SMS_GATEWAYS
-        matched = REGEX_PHONE.match(local)
-        cell_10_digit = None if matched is None else matched.group(3).strip("()") + matched.group(5) + matched.group(7)
-        if known_sms_gateway and cell_10_digit:
-            sms_list.append(f"{cell_10_digit}@{domain}")
-        elif not known_sms_gateway and not cell_10_digit:
-            email_list.append(recipient)
-        elif not known_sms_gateway and cell_10_digit:
-            print(f"WARNING: RECIPIENT IGNORED: unknown SMS Gateway {domain} for phone number: {local}")
-        elif known_sms_gateway and not cell_10_digit:
-            print(f"WARNING: RECIPIENT IGNORED: invalid phone number for {SMS_GATEWAYS[domain]} SMS Gateway: {local}")
-    return email_list, sms_list
+    # (email, sms) lists from mailing list lines; see src.recipients for the format and the cached RecipientIndex
+    from src.recipients import RecipientIndex
+    index = RecipientIndex()
+    index.load("\n".join(recipients))
+    return index.emails, index.sms
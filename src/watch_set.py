@@ -0,0 +1,170 @@
+import functools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
+
+from src.cache import TaxQuoteCache
+from src.history import open_history
+from src.mailer import Mailer
+from src.notifications import MailSink, NotificationPipeline, SMSSink, SlackSink, WebhookSink
+from src.ratelimit import EndpointLimiter
+from src.recipients import recipient_index
+from src.sessions import PooledSession
+from src.sharing import SingleFlight
+from src.storage import Storage, default_storage
+from src.tesla_watcher import TeslaWatcher, GCP_BUCKET, GCP_PATH_MAILING_LIST, GCP_PATH_TAX_QUOTES
+from src.utils import gcp_download_text, local_download_text
+
+if TYPE_CHECKING:  # asyncio is only needed in scheduled mode
+    from src.scheduler import AsyncScheduler, FixedRate
+
+# Settings that belong to the set as a whole; everything else in "defaults" is passed on to each TeslaWatcher
+SET_SETTINGS = {
+    "max_concurrent_watches": 4,
+    "max_in_flight": 8,
+    "pool_maxsize": 16,
+    "http_retries": 3,
+    "http_backoff_factor": 0.5,
+    "mailing_list_path": f"{GCP_BUCKET}/{GCP_PATH_MAILING_LIST}",
+    "tax_quotes_path": f"{GCP_BUCKET}/{GCP_PATH_TAX_QUOTES}",
+    "tax_quote_ttl_seconds": 60 * 60 * 24 * 7,
+    "tax_rules_version": "1",
+    "smtp_host": "smtp.gmail.com",
+    "shared_max_age_seconds": 15 * 60,
+    "rate_limits": {},
+    "history_path": None,
+    "dead_letter_path": None
+}
+
+
+class WatchSet:
+    def __init__(self, watches: List[Dict[str, Any]], defaults: Optional[Dict[str, Any]] = None,
+                 storage: Optional[Storage] = None, **settings):
+        unknown = set(settings) - set(SET_SETTINGS)
+        if unknown:
+            raise ValueError(f"Unknown watch set settings: {sorted(unknown)}")
+        self.settings = SET_SETTINGS | settings
+        self.defaults = dict(defaults or {})
+        self.smtp_user = self.defaults.pop("smtp_user_email", os.environ.get("SMTP_USER_EMAIL", None))
+        self.smtp_password = self.defaults.pop("smtp_user_password", os.environ.get("SMTP_USER_PASSWORD", None))
+
+        self.storage = storage or default_storage()
+        # one limiter for the whole set: the watches all hit the same tesla.com endpoints
+        self.limiter = EndpointLimiter(
+            limits={endpoint: tuple(limit) for (endpoint, limit) in self.settings["rate_limits"].items()})
+        self.session = PooledSession(
+            pool_maxsize=self.settings["pool_maxsize"],
+            retry_total=self.settings["http_retries"],
+            retry_backoff_factor=self.settings["http_backoff_factor"]
+        )
+        self.tax_quotes = TaxQuoteCache(
+            path=self.settings["tax_quotes_path"],
+            download=self.storage.download_text,
+            upload=self.storage.upload_text,
+            rules_version=self.settings["tax_rules_version"],
+            ttl_seconds=self.settings["tax_quote_ttl_seconds"]
+        )
+        self.tax_quotes.load()
+        # Scheduled watches run independently rather than as one batch, so shared results age out instead of
+        # being reset per run
+        self.shared = SingleFlight(max_age_seconds=self.settings["shared_max_age_seconds"])
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.settings["max_in_flight"], thread_name_prefix="tesla-enrich")
+        self.mailer = Mailer(host=self.settings["smtp_host"], user=self.smtp_user, password=self.smtp_password)
+        self.notifier = NotificationPipeline(sinks={
+            "EMAIL": MailSink(self.mailer),
+            "SMS": SMSSink(self.mailer.clone()),  # a slow SMTP session for one channel mustn't hold up the other
+            "WEBHOOK": WebhookSink(),
+            "SLACK": SlackSink()
+        }, dead_letter_path=self.settings["dead_letter_path"])
+        # parsed once for every watch, and re-read (cheaply: unchanged content is a no-op) at the start of each run
+        self.recipients = recipient_index(self.settings["mailing_list_path"])
+        self.recipients.load(self.storage.download_text(self.settings["mailing_list_path"]))
+        self.history = open_history(self.settings["history_path"] or os.environ.get("TESLA_WATCHER_HISTORY"))
+        self.watchers = {}
+        for i, watch in enumerate(watches):
+            watch = dict(watch)
+            name = watch.pop("name", None) or f"watch-{i + 1}"
+            if name in self.watchers:
+                raise ValueError(f"Duplicate watch name: {name}")
+            self.watchers[name] = self.build_watcher(name, self.defaults | watch)
+
+    @classmethod
+    def from_config(cls, path: str) -> "WatchSet":
+        text = local_download_text(path) if os.path.exists(path) else gcp_download_text(path)
+        config = json.loads(text)
+        return cls(watches=config["watches"], defaults=config.get("defaults"), **config.get("settings", {}))
+
+    def build_watcher(self, name: str, watch: Dict[str, Any]) -> TeslaWatcher:
+        return TeslaWatcher(
+            **watch,
+            max_in_flight=self.settings["max_in_flight"],
+            executor=self.executor,
+            shared=self.shared,
+            session=self.session,
+            limiter=self.limiter,
+            history=self.history,
+            storage=self.storage,
+            tax_quote_cache=self.tax_quotes,
+            smtp_host=self.settings["smtp_host"],
+            smtp_user_email=self.smtp_user,
+            smtp_user_password=self.smtp_password,
+            mailer=self.mailer,
+            notifier=self.notifier,
+            recipients=self.recipients.for_watch(name, f"{watch.get('model')}/{watch.get('trim')}")
+        )
+
+    def refresh_recipients(self) -> None:
+        # noinspection PyBroadException
+        try:
+            changed = self.recipients.load(self.storage.download_text(self.settings["mailing_list_path"]))
+        except Exception as e:
+            print(f"WARNING: Couldn't reload mailing list, keeping the previous one: {repr(e)}")
+            return
+        if changed:
+            for name, watcher in self.watchers.items():
+                watcher.set_recipients(self.recipients.for_watch(name, f"{watcher.model}/{watcher.trim}"))
+            print(f"INFO: Mailing list reloaded: {self.recipients.stats}")
+
+    def run(self) -> Dict[str, Optional[Exception]]:
+        self.shared.reset()
+        self.refresh_recipients()
+        outcomes = {}
+        try:
+            with ThreadPoolExecutor(
+                    max_workers=self.settings["max_concurrent_watches"], thread_name_prefix="tesla-watch") as pool:
+                futures = {name: pool.submit(watcher.run) for (name, watcher) in self.watchers.items()}
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                        outcomes[name] = None
+                    except Exception as e:
+                        print(f"WARNING: Watch failed: Watch={name} Error={repr(e)}")
+                        outcomes[name] = e
+        finally:
+            self.tax_quotes.save()
+        print(f"INFO: Watch set: Watches={len(self.watchers)} Shared={self.shared.stats} "
+              f"TaxQuotes={self.tax_quotes.stats} HTTP={self.session.stats} Limiter={self.limiter.stats}")
+        if outcomes and all(outcomes.values()):
+            raise IOError(f"All {len(outcomes)} watches failed")
+        return outcomes
+
+    def run_watch(self, name: str) -> None:
+        self.shared.expire()
+        self.refresh_recipients()
+        try:
+            self.watchers[name].run()
+        finally:
+            self.tax_quotes.save()
+
+    def schedule(self, scheduler: "AsyncScheduler", schedule: "FixedRate",
+                 timeout_seconds: Optional[float] = None) -> None:
+        for name in self.watchers:
+            scheduler.add(name, functools.partial(self.run_watch, name), schedule, timeout_seconds=timeout_seconds)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.notifier.close()
+        self.mailer.close()
+        self.session.close()
@@ -0,0 +1,91 @@
+import random
+
+from src.mailer import Mailer
+from src.metrics import NullMetrics
+from src.ratelimit import EndpointLimiter, LIMITS
+from src.tesla_results import TeslaSummary
+from src.tesla_watcher import TeslaWatcher
+from testing.standins import LocalSMTPServer, LocalTeslaServer, MemoryStorage
+
+PAINTS = ["Pearl White Multi-Coat", "Solid Black", "Deep Blue Metallic", "Stealth Grey", "Ultra Red"]
+TRIMS = [("LRAWD", "Long Range All-Wheel Drive"), ("PAWD", "Performance All-Wheel Drive"), ("RWD", "Rear-Wheel Drive")]
+
+
+def synthetic_options(rng):
+    trim_code, trim_name = rng.choice(TRIMS)
+    return {
+        "MODEL": {"group": "MODEL", "code": "MDLY", "name": "Model Y"},
+        "TRIM": {"group": "TRIM", "code": trim_code, "name": trim_name},
+        "PAINT": {"group": "PAINT", "code": "PAINT", "name": rng.choice(PAINTS)},
+        "WHEELS": {"group": "WHEELS", "code": "WY19B", "name": "19’’ Gemini Wheels"},
+        "SPECS_RANGE": {"group": "SPECS_RANGE", "code": "RANGE", "value": "310", "unit_short": "mi"},
+        "SPECS_TOP_SPEED": {"group": "SPECS_TOP_SPEED", "code": "SPEED", "value": "135", "unit_short": "mph"},
+        "SPECS_ACCELERATION": {"group": "SPECS_ACCELERATION", "code": "ACCEL", "value": "4.8", "unit_short": "sec",
+                               "acceleration_value": "0-60", "acceleration_unit_short": "mph"},
+        "INTERIOR": {"group": "INTERIOR", "code": "IN", "name": "All Black Premium Interior"},
+        "REAR_SEATS": {"group": "REAR_SEATS", "code": "SEAT", "name": "Five Seat Interior"},
+        "AUTOPILOT": {"group": "AUTOPILOT", "code": "AP", "name": "Autopilot"},
+    }
+
+
+def synthetic_cars(n, seed=11):
+    rng = random.Random(seed)
+    return [
+        TeslaSummary(
+            year=rng.choice([2023, 2024]),
+            demo=rng.choice(["", "[DEMO]"]),
+            miles=rng.choice(["", f"[{rng.randrange(10, 5000)} mi]"]),
+            options=synthetic_options(rng),
+            price=float(rng.randrange(45000, 65000)),
+            taxes=float(rng.randrange(2000, 4000)),
+            fees=float(rng.randrange(1000, 2000)),
+            incentives=float(rng.choice([0, 7500])),
+            referral=500.0,
+            order_url=f"https://www.tesla.com/my/order/7SAYGDEE{i:09d}",
+            vin=f"7SAYGDEE{i:09d}"
+        )
+        for i in range(n)
+    ]
+
+
+CHUNK_BYTES = 16 * 1024
+
+
+def order_page(size: int, token_at: float) -> bytes:
+    # size bytes of page with the token blob at the given fraction of it
+    blob = b'window.tesla = {"App":{"csrf_key":"a1b2c3d4","csrf_token":"Zm9vYmFyYmF6cXV4cXV1eHF1dXg"}};'
+    before = int((size - len(blob)) * token_at)
+    return b"<html><script>/*" + b"x" * before + b"*/" + blob + b"/*" + b"x" * (size - len(blob) - before) + b"*/"
+
+
+def chunked(page: bytes):
+    # what iter_content would hand over; split up front so the timing is the scan, not the slicing
+    return [page[i:i + CHUNK_BYTES] for i in range(0, len(page), CHUNK_BYTES)]
+
+
+SENDER = "watcher@example.com"
+WATCH = dict(
+    street="1245 Main St", city="Rahway", county="Union", state="NJ", country="US", zipcode="07065",
+    model="my", trim="LRAWD", latitude=40.60782, longitude=-74.27815, timezone="America/New_York"
+)
+
+
+def offline_watcher(tesla: LocalTeslaServer, smtp: LocalSMTPServer, count: int) -> TeslaWatcher:
+    # Everything the watcher would reach over the network is local: no tesla.com, Nominatim, GCS or Gmail
+    mailer = Mailer(host="127.0.0.1", port=smtp.port, user=SENDER, password="stand-in", starttls=False)
+    return TeslaWatcher(
+        **WATCH,
+        tesla_base_url=tesla.url,
+        top_results_count=count,
+        max_in_flight=16,
+        timeout_seconds=10,
+        http_backoff_factor=0.0,
+        # measure the code, not the politeness towards tesla.com
+        limiter=EndpointLimiter(limits={endpoint: (1e6, 1000) for endpoint in LIMITS}),
+        storage=MemoryStorage(),
+        smtp_user_email=SENDER,
+        smtp_user_password="stand-in",
+        mailer=mailer,
+        recipients=([SENDER], []),
+        metrics=NullMetrics()
+    )
@@ -0,0 +1,32 @@
+# The templates exactly as the str.format renderer had them, so the comparison doesn't depend on the new ones
+LEGACY_HTML_PAGE = """<html lang="en"><head></head><body><h3>
+        <a href="{link}">Top {count}/{total} @ {timestamp}</a></h3>{paras}</body></html>""".replace("\n", "")
+LEGACY_HTML_BLOCK = """<p><h4>{name}</h4><ol>{records}</ol>"""
+LEGACY_HTML_LONG_ROW = """<li><b><a href="{link}">{summary}</a></b><br>{details}</li>"""
+LEGACY_HTML_SHORT_ROW = """<li><a href="{link}">{summary}</a></li>"""
+LEGACY_PLAINTEXT_PAGE = """Top {count}/{total} @ {timestamp}\nFrom: {link}\n\n{paras}"""
+LEGACY_PLAINTEXT_PARAGRAPH = """{name}\n\n{records}"""
+LEGACY_PLAINTEXT_ROW = """\t{summary}\n\t{details}\n\t{link}\n\n"""
+LEGACY_FORMS = [(LEGACY_HTML_PAGE, LEGACY_HTML_BLOCK, LEGACY_HTML_LONG_ROW),
+                (LEGACY_HTML_PAGE, LEGACY_HTML_BLOCK, LEGACY_HTML_SHORT_ROW),
+                (LEGACY_PLAINTEXT_PAGE, LEGACY_PLAINTEXT_PARAGRAPH, LEGACY_PLAINTEXT_ROW)]
+
+
+def legacy_format_page(result_page, page, block, row):
+    # The str.format renderer this replaced, kept for comparison
+    return page.format(
+        link=result_page.link, count=result_page.count, total=result_page.total, timestamp=result_page.timestamp,
+        paras="".join([
+            block.format(name=name, records="".join([
+                row.format(
+                    link=car.link,
+                    summary=" | ".join(filter(bool, map(str.strip, [
+                        car.demo, car.miles, car.paint, car.interior, car.cost, car.payment]))),
+                    details=" | ".join(filter(bool, map(str.strip, [
+                        car.wheels, car.seating, car.range, car.speed, car.acceleration, car.autopilot])))
+                )
+                for car in cars
+            ]))
+            for (name, cars) in result_page.paras.items()
+        ])
+    )
@@ -0,0 +1,385 @@
+import json
+import random
+import secrets
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from src.storage import Storage
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    def reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode("ascii"))
+
+    def handle(self) -> None:
+        server: "LocalSMTPServer" = self.server  # type: ignore[assignment]
+        with server.lock:
+            server.connections += 1
+        self.reply("220 localhost ESMTP stand-in")
+        sender, recipients, delivered = None, [], 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode("utf-8", "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("EHLO", "HELO"):
+                self.wfile.write(b"250-localhost\r\n250-AUTH PLAIN\r\n250 8BITMIME\r\n" if verb == "EHLO"
+                                 else b"250 localhost\r\n")
+            elif verb == "AUTH":
+                # any credentials are accepted, so a Mailer configured like the real one (user and password) works
+                self.reply("235 Authentication successful")
+            elif verb == "MAIL":
+                sender, recipients = command.split(":", 1)[1].strip().strip("<>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipient = command.split(":", 1)[1].strip().strip("<>")
+                if recipient in server.reject:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(recipient)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                body = []
+                for data in self.rfile:
+                    if data in (b".\r\n", b".\n"):
+                        break
+                    body.append(data)
+                with server.lock:
+                    server.messages.append((sender, list(recipients), b"".join(body)))
+                self.reply("250 OK")
+                delivered += 1
+                if delivered == server.messages_per_connection:
+                    return  # hangs up without a QUIT, as servers limiting messages per session (or idling out) do
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class LocalSMTPServer(socketserver.ThreadingTCPServer):
+    # Plain (no TLS) SMTP stand-in for exercising Mailer offline; use Mailer(starttls=False)
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, reject: Optional[Set[str]] = None,
+                 messages_per_connection: Optional[int] = None):
+        super().__init__((host, port), _SMTPHandler)
+        self.lock = threading.Lock()
+        self.reject = set(reject or [])
+        self.messages_per_connection = messages_per_connection
+        self.connections = 0
+        self.messages: List[Tuple[str, List[str], bytes]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="local-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+
+class MemoryStorage(Storage):
+    # In-process stand-in for the storage bucket; generations count writes per blob
+    def __init__(self, blobs: Optional[Dict[str, str]] = None):
+        self.blobs = {path: (content, 1) for (path, content) in (blobs or {}).items()}
+        self.lock = threading.Lock()
+        self.downloads = 0
+        self.uploads = 0
+
+    def fetch(self, path: str, generation=None) -> Optional[Tuple[str, int]]:
+        with self.lock:
+            if path not in self.blobs:
+                raise FileNotFoundError(path)
+            content, current = self.blobs[path]
+            if current == generation:
+                return None
+            self.downloads += 1
+            return content, current
+
+    def store(self, path: str, content: str) -> int:
+        with self.lock:
+            self.uploads += 1
+            current = self.blobs[path][1] + 1 if path in self.blobs else 1
+            self.blobs[path] = (content, current)
+            return current
+
+
+PAINTS = ["Pearl White Multi-Coat", "Solid Black", "Deep Blue Metallic", "Stealth Grey", "Ultra Red"]
+INTERIORS = ["All Black Premium Interior", "Black and White Premium Interior"]
+
+
+def synthetic_inventory(count: int, model: str = "my", trim: str = "LRAWD", seed: int = 7) -> List[dict]:
+    # Records in the shape of inventory-results, cheapest first (the watcher searches with arrangeby=Price asc)
+    rng = random.Random(seed)
+    cars = []
+    for i in range(count):
+        options = [
+            {"group": "MODEL", "code": f"MDL{model[-1].upper()}", "name": f"Model {model[-1].upper()}"},
+            {"group": "TRIM", "code": trim, "name": "Long Range All-Wheel Drive"},
+            {"group": "PAINT", "code": f"PAINT{i % len(PAINTS)}", "name": rng.choice(PAINTS)},
+            {"group": "WHEELS", "code": "WY19B", "name": "19\u2019\u2019 Gemini Wheels"},
+            {"group": "SPECS_RANGE", "code": "SPECS_RANGE", "name": "Range", "value": "310", "unit_short": "mi"},
+            {"group": "SPECS_TOP_SPEED", "code": "SPECS_TOP_SPEED", "name": "Top Speed", "value": "135",
+             "unit_short": "mph"},
+            {"group": "SPECS_ACCELERATION", "code": "SPECS_ACCELERATION", "name": "Acceleration", "value": "4.8",
+             "unit_short": "sec", "acceleration_value": "0-60", "acceleration_unit_short": "mph"},
+            {"group": "INTERIOR", "code": "IN", "name": rng.choice(INTERIORS)},
+            {"group": "REAR_SEATS", "code": "SEAT05", "name": "Five Seat Interior"},
+            {"group": "AUTOPILOT", "code": "APBS", "name": "Autopilot"},
+        ]
+        odometer = rng.choice([0, 0, 0, rng.randrange(10, 5000)])
+        cars.append({
+            "VIN": f"7SAYGDEE{i:09d}",
+            "Year": rng.choice([2023, 2024]),
+            "IsDemo": odometer > 0,
+            "Odometer": odometer,
+            "OdometerType": "Mi",
+            "PurchasePrice": rng.randrange(45000, 65000),
+            "OptionCodeData": options
+        })
+    cars.sort(key=lambda car: car["PurchasePrice"])
+    return cars
+
+
+class TeslaFixture:
+    # What the stand-in serves: inventory records, plus tax/fee line items either recorded per price or computed
+    def __init__(self, cars: List[dict], quotes: Optional[Dict[str, dict]] = None, tax_rate: float = 0.06625,
+                 fees: Optional[List[float]] = None):
+        self.cars = cars
+        self.quotes = quotes or {}
+        self.tax_rate = tax_rate
+        self.fees = fees if fees is not None else [1390.0, 358.0]
+
+    @classmethod
+    def synthetic(cls, count: int, **kwargs) -> "TeslaFixture":
+        return cls(cars=synthetic_inventory(count, **kwargs))
+
+    @classmethod
+    def record(cls, watcher, count: Optional[int] = None) -> "TeslaFixture":
+        # Captures live responses once (one inventory page and the quotes for its VINs) for offline replay
+        cars = watcher.fetch(count=count)["results"]
+        quotes = {}
+        for car in cars:
+            options = {code["group"]: code for code in car["OptionCodeData"]}
+            _, taxes, fees = watcher.quote_taxes_and_fees(
+                vin=car["VIN"], model=options["MODEL"]["code"], trim=options["TRIM"]["code"],
+                price=car["PurchasePrice"])
+            quotes[str(int(car["PurchasePrice"]))] = {"taxes": [{"amount": taxes}], "fees": [{"amount": fees}]}
+        return cls(cars=cars, quotes=quotes)
+
+    @classmethod
+    def load(cls, path: str) -> "TeslaFixture":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+    def dump(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"cars": self.cars, "quotes": self.quotes, "tax_rate": self.tax_rate, "fees": self.fees}, f)
+
+    def quote(self, price: float) -> dict:
+        recorded = self.quotes.get(str(int(price)))
+        if recorded is not None:
+            return recorded
+        return {"taxes": [{"amount": round(price * self.tax_rate, 2)}],
+                "fees": [{"amount": amount} for amount in self.fees]}
+
+
+class _TeslaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse behaves as it does against tesla.com
+
+    def log_message(self, format, *args):
+        pass
+
+    def send(self, code: int, body: bytes, content_type: str = "application/json", headers=()) -> None:
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server: "LocalTeslaServer" = self.server  # type: ignore[assignment]
+        url = urlsplit(self.path)
+        if url.path == "/inventory/api/v1/inventory-results":
+            if server.admit(self, "inventory"):
+                query = json.loads(parse_qs(url.query)["query"][0])
+                offset, count = query.get("offset", 0), query.get("count", 50)
+                body = {"results": server.fixture.cars[offset:offset + count],
+                        "total_matches_found": len(server.fixture.cars)}
+                self.send(200, json.dumps(body).encode("utf-8"))
+        elif "/order/" in url.path:
+            if server.admit(self, "order"):
+                coin_auth, csrf_key, csrf_token = server.issue()
+                self.send(200, server.order_page(csrf_key, csrf_token), "text/html; charset=utf-8",
+                          [("Set-Cookie", f"coin_auth={coin_auth}; Path=/")])
+        else:
+            self.send(404, b"Not Found", "text/plain")
+
+    def do_POST(self):
+        server: "LocalTeslaServer" = self.server  # type: ignore[assignment]
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if urlsplit(self.path).path != "/configurator/api/v3/fees-taxes-calculator":
+            self.send(404, b"Not Found", "text/plain")
+        elif server.admit(self, "taxes"):
+            cookie = self.headers.get("Cookie", "")
+            coin_auth = cookie.split("coin_auth=", 1)[1].split(";", 1)[0] if "coin_auth=" in cookie else None
+            if not server.valid(coin_auth, body.get("csrf_name"), body.get("csrf_value")):
+                self.send(403, b'{"error":"invalid csrf token"}')
+            else:
+                quote = server.fixture.quote(float(body["vehiclePrice"]))
+                self.send(200, json.dumps({"AUTO_CASH": quote}).encode("utf-8"))
+
+
+class LocalTeslaServer(ThreadingHTTPServer):
+    # Stand-in for the three tesla.com endpoints the watcher calls, with tunable latency and error injection;
+    # point a TeslaWatcher at it with tesla_base_url=server.url
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(
+            self,
+            fixture: TeslaFixture,
+            host: str = "127.0.0.1",
+            port: int = 0,
+            latency_seconds: float = 0.0,
+            latency_jitter_seconds: float = 0.0,
+            error_rate: float = 0.0,
+            error_status: int = 503,
+            order_page_bytes: int = 32 * 1024,
+            seed: int = 13
+    ):
+        super().__init__((host, port), _TeslaHandler)
+        self.fixture = fixture
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.order_page_bytes = order_page_bytes
+        self.lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.issued: Dict[str, Tuple[str, str]] = {}
+        self._rng = random.Random(seed)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.server_address[0]}:{self.port}"
+
+    def admit(self, handler: _TeslaHandler, route: str) -> bool:
+        with self.lock:
+            self.requests[route] += 1
+            delay = self.latency_seconds + self._rng.uniform(0, self.latency_jitter_seconds)
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors[route] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            retry_after = [("Retry-After", "1")] if self.error_status == 429 else []
+            handler.send(self.error_status, b'{"error":"injected"}', headers=retry_after)
+        return not failed
+
+    def issue(self) -> Tuple[str, str, str]:
+        coin_auth, csrf_key, csrf_token = secrets.token_hex(16), secrets.token_hex(4), secrets.token_urlsafe(24)
+        with self.lock:
+            self.issued[coin_auth] = (csrf_key, csrf_token)
+        return coin_auth, csrf_key, csrf_token
+
+    def valid(self, coin_auth: Optional[str], csrf_key: Optional[str], csrf_token: Optional[str]) -> bool:
+        with self.lock:
+            return coin_auth is not None and self.issued.get(coin_auth) == (csrf_key, csrf_token)
+
+    def order_page(self, csrf_key: str, csrf_token: str) -> bytes:
+        # The token blob sits behind the bulk of the page, as on the real order page
+        head = b"<!DOCTYPE html><html><head><title>Order</title></head><body><div id=\"root\"></div><script>"
+        blob = f'window.tesla = {{"App":{{"csrf_key":"{csrf_key}","csrf_token":"{csrf_token}"}}}};'.encode("ascii")
+        tail = b"</script></body></html>"
+        padding = max(0, self.order_page_bytes - len(head) - len(blob) - len(tail))
+        return head + b"/*" + b"x" * max(0, padding - 4) + b"*/" + blob + tail
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="local-tesla", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server: "LocalWebhookServer" = self.server  # type: ignore[assignment]
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with server.lock:
+            server.attempts += 1
+            failing = server.fail_first > 0
+            if failing:
+                server.fail_first -= 1
+            else:
+                server.received.append((self.path, json.loads(body or b"null")))
+        status, reply = (server.fail_status, b"unavailable") if failing else (200, b"ok")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(reply)))
+        self.end_headers()
+        self.wfile.write(reply)
+
+
+class LocalWebhookServer(ThreadingHTTPServer):
+    # Webhook/Slack stand-in: records JSON POSTs to any path; the first fail_first of them get fail_status instead
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, fail_first: int = 0, fail_status: int = 503):
+        super().__init__((host, port), _WebhookHandler)
+        self.lock = threading.Lock()
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.attempts = 0
+        self.received: List[Tuple[str, Any]] = []
+        self._thread: Optional[threading.Thread] = None
+
+    def url(self, path: str = "/hook") -> str:
+        return f"http://{self.server_address[0]}:{self.server_address[1]}{path}"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, name="local-webhook", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,122 @@
+import json
+import os
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from src import utils
+from src.cache import GeocodeCache, TaxQuoteCache, TTLCache
+from src.sharing import SingleFlight
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_ttl_cache_expires_entries():
+    clock = Clock()
+    cache = TTLCache(ttl_seconds=10, clock=clock)
+    cache.put("a", 1)
+    clock.now += 10
+    assert cache.get("a") == 1
+    clock.now += 1
+    assert cache.get("a", "gone") == "gone" and len(cache) == 0
+    assert cache.stats == {"entries": 0, "hits": 1, "misses": 1, "evictions": 0, "expirations": 1}
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(max_entries=2, clock=Clock())
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert cache.get("b") is None and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.evictions == 1
+
+
+def test_ttl_cache_invalidate():
+    cache = TTLCache(clock=Clock())
+    for key in ("x1", "x2", "y1"):
+        cache.put(key, key)
+    assert cache.invalidate(lambda key: key.startswith("x")) == 2
+    assert [key for (key, _, _) in cache.items()] == ["y1"]
+
+
+def test_tax_quotes_round_trip_and_drop_expired_or_other_versions():
+    clock = Clock()
+    blobs = {}
+    cache = TaxQuoteCache(path="bucket/quotes.json", download=blobs.__getitem__, upload=blobs.__setitem__,
+                          ttl_seconds=100, clock=clock)
+    key = TaxQuoteCache.key("US", "NJ", "Rahway", "07065", "MDLY", "LRAWD", 49990.0)
+    cache.put(key, (3311.84, 1748.0))
+    cache.put(TaxQuoteCache.key("US", "NJ", "Rahway", "07065", "MDLY", "LRAWD", 1), (1, 2), stored_at=clock.now - 101)
+    cache.save()
+    assert not cache.dirty and len(json.loads(blobs["bucket/quotes.json"])["quotes"]) == 1
+
+    reloaded = TaxQuoteCache(path="bucket/quotes.json", download=blobs.__getitem__, ttl_seconds=100, clock=clock)
+    assert reloaded.load() == 1 and reloaded.get(key) == (3311.84, 1748.0)
+    other_rules = TaxQuoteCache(path="bucket/quotes.json", download=blobs.__getitem__, rules_version="2", clock=clock)
+    assert other_rules.load() == 0
+    assert TaxQuoteCache(path="bucket/missing.json", download=blobs.__getitem__).load() == 0
+
+
+def test_single_flight_shares_results_and_forgets_failures():
+    flight = SingleFlight()
+    calls = []
+    assert flight.do("k", lambda: calls.append(1) or "v") == "v"
+    assert flight.do("k", lambda: calls.append(1) or "other") == "v"
+    assert len(calls) == 1 and flight.stats == {"computed": 1, "shared": 1}
+
+    def failing():
+        raise IOError("boom")
+
+    for _ in range(2):
+        try:
+            flight.do("bad", failing)
+        except IOError:
+            pass
+    assert flight.stats["computed"] == 3  # the failure wasn't memoized
+
+
+def test_geocode_cache_loads_lazily_and_saves_atomically(tmp_path):
+    path = tmp_path / "cache" / "geocode.json"
+    cache = GeocodeCache(str(path))  # nothing read yet: the file may appear before first use
+    path.parent.mkdir()
+    path.write_text(json.dumps({"1 Main St": [40.1, -74.2, "America/New_York"]}))
+    assert cache.get("1 Main St") == (40.1, -74.2, "America/New_York")
+    cache.put("2 Elm St", 34.05, -118.24, "America/Los_Angeles")
+    assert os.listdir(path.parent) == ["geocode.json"]  # written to a temporary file, then renamed over it
+    assert GeocodeCache(str(path)).get("2 Elm St") == (34.05, -118.24, "America/Los_Angeles")
+
+
+def test_geocode_cache_survives_a_corrupt_file(tmp_path, capsys):
+    path = tmp_path / "geocode.json"
+    path.write_text("{not json")
+    cache = GeocodeCache(str(path))
+    assert cache.get("1 Main St") is None and "Couldn't read geocode cache" in capsys.readouterr().out
+    cache.put("1 Main St", 40.1, -74.2, "America/New_York")
+    assert json.loads(path.read_text()) == {"1 Main St": [40.1, -74.2, "America/New_York"]}
+
+
+def test_enrich_address_geocodes_once_per_address(monkeypatch):
+    lookups = []
+    monkeypatch.setattr(utils, "geocode_address", lambda address: lookups.append(address) or (40.1, -74.2))
+    monkeypatch.setattr(utils, "timezone_at", lambda latitude, longitude: ZoneInfo("America/New_York"))
+    cache = GeocodeCache()
+    for _ in range(3):
+        assert utils.enrich_address("1 Main St", cache=cache) == (40.1, -74.2, ZoneInfo("America/New_York"))
+    assert lookups == ["1 Main St"]
+
+
+def test_enrich_address_errors_are_not_cached(monkeypatch):
+    def unavailable(address):
+        raise IOError("geocoder unavailable")
+    monkeypatch.setattr(utils, "geocode_address", unavailable)
+    cache = GeocodeCache()
+    with pytest.raises(IOError):
+        utils.enrich_address("1 Main St", cache=cache)
+    assert cache.get("1 Main St") is None
@@ -0,0 +1,87 @@
+import json
+import time
+
+import pytest
+
+from src.crawler import InventoryCrawler
+from testing.fixtures import offline_watcher
+from testing.standins import LocalSMTPServer, LocalTeslaServer, TeslaFixture
+
+
+@pytest.fixture
+def smtp():
+    with LocalSMTPServer() as server:
+        yield server
+
+
+@pytest.fixture
+def fixture():
+    return TeslaFixture.synthetic(23)
+
+
+def vins(cars):
+    return [car.vin for car in cars]
+
+
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_crawl_stops_at_the_end_of_the_inventory(fixture, smtp, prefetch):
+    crawled = []
+    with LocalTeslaServer(fixture) as tesla:
+        crawler = InventoryCrawler(offline_watcher(tesla, smtp, 10), page_size=10, prefetch=prefetch)
+        assert crawler.crawl(crawled.append) == 23
+    assert [len(batch) for batch in crawled] == [10, 10, 3]
+    assert [vin for batch in crawled for vin in vins(batch)] == [car["VIN"] for car in fixture.cars]
+    # once the total is known, nothing is requested past it, prefetched or not
+    assert tesla.requests["inventory"] == 3 and (crawler.offset, crawler.total) == (23, 23)
+
+
+def test_crawl_stops_at_max_results(fixture, smtp):
+    with LocalTeslaServer(fixture) as tesla:
+        crawler = InventoryCrawler(offline_watcher(tesla, smtp, 10), page_size=10, max_results=15)
+        pages = [page["results"] for page in crawler.pages()]
+    assert [len(results) for results in pages] == [10, 5] and tesla.requests["inventory"] == 2
+
+
+def test_the_next_page_is_fetched_while_the_current_one_is_enriched(fixture, smtp):
+    requested = []
+    with LocalTeslaServer(fixture) as tesla:
+        crawler = InventoryCrawler(offline_watcher(tesla, smtp, 10), page_size=10)
+
+        def sink(batch):
+            deadline = time.monotonic() + 5
+            while tesla.requests["inventory"] < min(3, len(requested) + 2) and time.monotonic() < deadline:
+                time.sleep(0.01)
+            requested.append(tesla.requests["inventory"])
+        crawler.crawl(sink)
+    assert requested == [2, 3, 3]
+
+
+def test_an_interrupted_crawl_resumes_from_its_checkpoint(fixture, smtp, tmp_path):
+    checkpoint = str(tmp_path / "crawl.json")
+    with LocalTeslaServer(fixture) as tesla:
+        watcher = offline_watcher(tesla, smtp, 10)
+        crawled = []
+
+        def failing_sink(batch):
+            if crawled:
+                raise IOError("sink down")
+            crawled.append(batch)
+        with pytest.raises(IOError):
+            InventoryCrawler(watcher, page_size=10, checkpoint_path=checkpoint).crawl(failing_sink)
+        # only the page the sink finished with counts as done
+        assert json.loads(open(checkpoint).read())["offset"] == 10
+
+        resumed = InventoryCrawler(watcher, page_size=10, checkpoint_path=checkpoint)
+        assert resumed.offset == 10
+        rest = []
+        assert resumed.crawl(rest.append) == 13
+    assert vins(crawled[0]) + [vin for batch in rest for vin in vins(batch)] == [car["VIN"] for car in fixture.cars]
+    assert not (tmp_path / "crawl.json").exists()  # a finished crawl leaves no checkpoint behind
+
+
+def test_a_checkpoint_of_another_query_is_ignored(fixture, smtp, tmp_path):
+    checkpoint = tmp_path / "crawl.json"
+    checkpoint.write_text(json.dumps({"query": "{}", "offset": 20}))
+    with LocalTeslaServer(fixture) as tesla:
+        crawler = InventoryCrawler(offline_watcher(tesla, smtp, 10), page_size=10, checkpoint_path=str(checkpoint))
+    assert crawler.offset == 0
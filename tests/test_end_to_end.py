@@ -0,0 +1,136 @@
+import pytest
+
+from src.history import HistoryStore
+from src.snapshots import FIRST_SEEN
+from testing.fixtures import SENDER, offline_watcher
+from testing.standins import LocalSMTPServer, LocalTeslaServer, TeslaFixture
+
+
+@pytest.fixture
+def smtp():
+    with LocalSMTPServer() as server:
+        yield server
+
+
+def test_offline_run_enriches_notifies_and_snapshots(smtp):
+    fixture = TeslaFixture.synthetic(20)
+    with LocalTeslaServer(fixture) as tesla:
+        watcher = offline_watcher(tesla, smtp, 20)
+        page = watcher.run()
+        assert watcher.notifier.drain(timeout_seconds=10)
+    assert page.count == 20 and page.total == 20
+    # one order page for every VIN of the model, then a quote per distinct price
+    assert tesla.requests["inventory"] == 1 and tesla.requests["order"] == 1
+    assert tesla.requests["taxes"] == len({car["PurchasePrice"] for car in fixture.cars})
+    assert watcher.run_http["requests"] == sum(tesla.requests.values())
+    cheapest = min(fixture.cars, key=lambda car: car["PurchasePrice"])
+    assert page.to_dict()["groups"] and cheapest["VIN"] in page.html_long_form
+    [(sender, recipients, message)] = smtp.messages
+    assert sender == SENDER and recipients == [SENDER] and b"No Change" not in message
+    assert any(path.endswith("_my_LRAWD.json") for path in watcher.storage.blobs)
+
+
+def test_unchanged_inventory_reuses_quotes_and_reports_no_change(smtp):
+    fixture = TeslaFixture.synthetic(5)
+    with LocalTeslaServer(fixture) as tesla:
+        watcher = offline_watcher(tesla, smtp, 5)
+        watcher.run()
+        taxes = tesla.requests["taxes"]
+        watcher.run()
+        assert watcher.notifier.drain(timeout_seconds=10)
+    assert tesla.requests["taxes"] == taxes  # served from the tax quote cache
+    assert len(smtp.messages) == 2 and b"No Change" in smtp.messages[1][2]
+
+
+def test_server_errors_are_retried(smtp):
+    fixture = TeslaFixture.synthetic(10)
+    with LocalTeslaServer(fixture, error_rate=0.2, error_status=503, seed=3) as tesla:
+        watcher = offline_watcher(tesla, smtp, 10)
+        page = watcher.run()
+    assert sum(tesla.errors.values()) > 0
+    assert page.count == 10
+
+
+def test_fixture_replay(tmp_path, smtp):
+    fixture = TeslaFixture.synthetic(3)
+    price = fixture.cars[0]["PurchasePrice"]
+    fixture.quotes = {str(price): {"taxes": [{"amount": 1000.0}], "fees": [{"amount": 250.0}]}}
+    fixture.dump(str(tmp_path / "fixture.json"))
+    replayed = TeslaFixture.load(str(tmp_path / "fixture.json"))
+    assert replayed.cars == fixture.cars
+    with LocalTeslaServer(replayed) as tesla:
+        page = offline_watcher(tesla, smtp, 3).run()
+    [car] = [car for cars in page.paras.values() for car in cars if car.purchase_price == price]
+    assert (car.taxes_amount, car.fees_amount) == (1000.0, 250.0)
+
+
+def test_only_fetch_and_extract_are_retried(smtp, monkeypatch):
+    fixture = TeslaFixture.synthetic(5)
+    with LocalTeslaServer(fixture) as tesla:
+        watcher = offline_watcher(tesla, smtp, 5)
+        monkeypatch.setattr(watcher.limiter.backoff, "delay", lambda attempt: 0.0)
+        fetch, calls = watcher.fetch, []
+
+        def flaky_fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                raise IOError("search down")
+            return fetch()
+        monkeypatch.setattr(watcher, "fetch", flaky_fetch)
+        assert watcher.run().count == 5
+        assert tesla.requests["inventory"] == 1
+
+        def failed_save(snapshot, delta):
+            raise IOError("upload failed")
+        monkeypatch.setattr(watcher.snapshots, "save", failed_save)
+        with pytest.raises(IOError, match="upload failed"):
+            watcher.run()
+        assert watcher.notifier.drain(timeout_seconds=10)
+    # the failed save isn't retried, so the second run's notification went out once
+    assert tesla.requests["inventory"] == 2 and len(smtp.messages) == 2
+
+
+def test_history_records_each_successful_run_once(smtp, monkeypatch):
+    fixture = TeslaFixture.synthetic(5)
+    with LocalTeslaServer(fixture) as tesla:
+        watcher = offline_watcher(tesla, smtp, 5)
+        watcher.history = HistoryStore(":memory:")
+        monkeypatch.setattr(watcher.limiter.backoff, "delay", lambda attempt: 0.0)
+        enrich_all, calls = watcher.enrich_all, []
+
+        def flaky_enrich_all(cars):
+            calls.append(1)
+            return enrich_all(cars) if len(calls) > 1 else []
+        monkeypatch.setattr(watcher, "enrich_all", flaky_enrich_all)
+        watcher.run()
+
+        def failed_notify(top_cars, total, listed):
+            raise IOError("notify failed")
+        monkeypatch.setattr(watcher, "notify", failed_notify)
+        with pytest.raises(IOError):
+            watcher.run()
+    assert len(calls) == 3
+    assert watcher.history.query("SELECT COUNT(*) FROM runs") == [(1,)]
+    assert watcher.history.query("SELECT COUNT(*) FROM observations") == [(5,)]
+
+
+def test_a_car_skipped_for_one_run_is_neither_gone_nor_new(smtp, monkeypatch):
+    fixture = TeslaFixture.synthetic(5)
+    flaky = fixture.cars[2]["VIN"]
+    with LocalTeslaServer(fixture) as tesla:
+        watcher = offline_watcher(tesla, smtp, 5)
+        watcher.run()
+        first_seen = watcher.snapshots.load().records[flaky][FIRST_SEEN]
+        enrich = watcher.enrich
+
+        def failing_enrich(car):
+            if car["VIN"] == flaky:
+                raise IOError("quote timed out")
+            return enrich(car)
+        monkeypatch.setattr(watcher, "enrich", failing_enrich)
+        assert watcher.run().count == 4
+        monkeypatch.setattr(watcher, "enrich", enrich)
+        watcher.run()
+        assert watcher.notifier.drain(timeout_seconds=10)
+    assert watcher.snapshots.load().records[flaky][FIRST_SEEN] == first_seen
+    assert [b"No Change" in message for (_, _, message) in smtp.messages] == [False, True, True]
@@ -0,0 +1,74 @@
+import importlib
+import subprocess
+import sys
+from datetime import date
+
+import pytest
+
+from src.incentives import INCENTIVES, IncentiveTable, StepFunction
+
+
+def legacy_total(price, country, state):
+    # The callbacks the table replaced (federal_us, state_nj, state_ny), summed the way the watcher summed them
+    total = 0
+    if country == "US" and int(price) < 55000:
+        total += 7500
+    if country == "US" and state == "NJ":
+        total += 4000 if int(price) < 45000 else 1500 if int(price) < 55000 else 0
+    if country == "US" and state == "NY":
+        total += 2000 if int(price) < 42000 else 500 if int(price) < 80000 else 0
+    return total
+
+
+def test_package_imports_without_loading_submodules():
+    # `import src` must keep working on its own, and stay cheap: the watcher is only loaded when asked for
+    code = "import sys, src; assert 'src.tesla_watcher' not in sys.modules; print(src.INCENTIVES.__class__.__name__)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == "IncentiveTable"
+
+
+def test_lazy_exports_resolve():
+    src = importlib.import_module("src")
+    assert src.INCENTIVES is INCENTIVES
+    assert src.IncentiveTable is IncentiveTable
+    with pytest.raises(AttributeError):
+        getattr(src, "federal_us")
+
+
+@pytest.mark.parametrize("state", ["NJ", "NY", "CA"])
+def test_table_matches_legacy_callbacks(state):
+    local = INCENTIVES.for_location("US", state, "Union County", "Rahway")
+    for price in [0, 41999, 42000, 44999, 45000, 54999, 55000, 55001, 79999, 80000, 120000]:
+        assert local.evaluate(price) == legacy_total(price, "US", state), price
+
+
+def test_no_incentives_outside_the_us():
+    assert INCENTIVES.for_location("CA", "ON").evaluate(30000) == 0
+
+
+def test_rules_filter_by_model_trim_and_date():
+    table = IncentiveTable([
+        {"name": "base", "country": "US", "bands": [[None, 100]]},
+        {"name": "my_only", "country": "US", "state": "NJ", "models": ["MDLY"], "bands": [[50000, 1000]]},
+        {"name": "expired", "country": "US", "bands": [[None, 5]], "effective_to": "2020-01-01"},
+    ])
+    local = table.for_location("US", "nj")
+    on = date(2024, 1, 1)
+    assert local.evaluate(40000, model="MDLY", on=on) == 1100
+    assert local.evaluate(40000, model="MDL3", on=on) == 100
+    assert local.evaluate(40000, model="MDLY", on=date(2019, 6, 1)) == 1105
+
+
+def test_bands_must_ascend():
+    with pytest.raises(ValueError):
+        IncentiveTable([{"name": "bad", "country": "US", "bands": [[50000, 1], [40000, 2]]}])
+
+
+def test_step_function_batch_matches_scalar():
+    local = INCENTIVES.for_location("US", "NJ")
+    step = local.compiled(None, None, date(2024, 1, 1))
+    assert isinstance(step, StepFunction)
+    prices = [90000.0, 41000.0, 55000.0, 44999.99, 45000.0, 0.0, 54999.0]
+    assert list(step.batch(prices)) == [step(p) for p in prices]
+    assert list(local.evaluate_batch(prices, [None] * len(prices), [None] * len(prices), on=date(2024, 1, 1))) == \
+        [legacy_total(p, "US", "NJ") for p in prices]
@@ -0,0 +1,75 @@
+import pytest
+
+from src.mailer import Mailer
+from testing.standins import LocalSMTPServer
+
+SENDER = "watcher@example.com"
+
+
+@pytest.fixture
+def smtp():
+    with LocalSMTPServer() as server:
+        yield server
+
+
+def mailer(server, **options):
+    return Mailer(host="127.0.0.1", port=server.port, user=SENDER, password="stand-in", starttls=False, **options)
+
+
+def recipients(count):
+    return [f"user{i}@example.com" for i in range(count)]
+
+
+def test_recipients_go_in_bcc_chunks_over_one_session(smtp):
+    with mailer(smtp, bcc_chunk_size=4) as m:
+        report = m.send("EMAIL", recipients(10) + ["user0@example.com"], "Top 3/3", "<p>body</p>")
+    assert report.ok and report.delivered == recipients(10)
+    assert (report.messages, report.reconnects, smtp.connections, m.connections_opened) == (3, 0, 1, 1)
+    assert [rcpts for (_, rcpts, _) in smtp.messages] == [recipients(10)[:4], recipients(10)[4:8], recipients(10)[8:]]
+    for sender, _, message in smtp.messages:
+        # the list only travels on the envelope: every chunk gets the same message, addressed to the sender
+        assert sender == SENDER and b"To: watcher@example.com" in message and b"user" not in message
+        assert b"Subject: Top 3/3" in message
+
+
+def test_a_dropped_session_is_reopened_and_the_chunk_resent():
+    with LocalSMTPServer(messages_per_connection=1) as smtp, mailer(smtp, bcc_chunk_size=2) as m:
+        report = m.send("EMAIL", recipients(5), "subject", "body")
+    assert report.ok and report.delivered == recipients(5)
+    assert (report.messages, report.reconnects, smtp.connections) == (3, 2, 3)
+    assert sorted(r for (_, rcpts, _) in smtp.messages for r in rcpts) == sorted(recipients(5))
+
+
+def test_reconnects_are_bounded():
+    with LocalSMTPServer() as smtp:
+        pass
+    # nothing listens on the port any more: the first connect and each reconnect are refused
+    m = mailer(smtp, max_reconnects=2, timeout_seconds=1)
+    report = m.send("EMAIL", recipients(2), "subject", "body")
+    assert report.delivered == [] and set(report.failed) == set(recipients(2))
+    assert report.reconnects == 2 and all(code == -1 for (code, _) in report.failed.values())
+
+
+def test_refused_recipients_are_reported_one_by_one():
+    refused = {"user1@example.com", "user3@example.com"}
+    with LocalSMTPServer(reject=refused) as smtp, mailer(smtp, bcc_chunk_size=3) as m:
+        report = m.send("EMAIL", recipients(5), "subject", "body")
+        # a chunk whose every recipient is refused is not sent at all, and the session stays usable
+        everyone_refused = m.send("EMAIL", sorted(refused), "subject", "body")
+        after = m.send("EMAIL", ["user4@example.com"], "subject", "body")
+    assert report.delivered == ["user0@example.com", "user2@example.com", "user4@example.com"]
+    assert report.failed == {r: (550, "No such user") for r in refused} and not report.ok
+    assert everyone_refused.delivered == [] and set(everyone_refused.failed) == refused
+    assert after.ok and smtp.connections == 1
+    assert [rcpts for (_, rcpts, _) in smtp.messages] == [["user0@example.com", "user2@example.com"],
+                                                          ["user4@example.com"], ["user4@example.com"]]
+
+
+def test_clones_have_their_own_session(smtp):
+    m = mailer(smtp)
+    clone = m.clone()
+    m.send("EMAIL", ["a@example.com"], "subject", "body")
+    clone.send("SMS", ["5551234567@vtext.com"], "subject", "body")
+    m.close()
+    clone.close()
+    assert (m.connections_opened, clone.connections_opened, smtp.connections) == (1, 1, 2)
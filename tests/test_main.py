@@ -0,0 +1,65 @@
+import pytest
+
+pytest.importorskip("requests")
+
+from src import main  # noqa: E402
+from src.service import ResultService  # noqa: E402
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    runs = []
+    service = ResultService(runner=lambda: runs.append(1) or {}, state_dir=str(tmp_path))
+    service.runs = runs
+    monkeypatch.setattr(main, "SERVICE", service)
+    return service
+
+
+def call(environ):
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        response["status"], response["headers"] = status, dict(headers)
+
+    body = b"".join(main.app(environ, start_response))
+    return response["status"], response["headers"], body
+
+
+def test_importing_does_not_create_the_state_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "SERVICE", None)
+    monkeypatch.setenv("TESLA_WATCHER_STATE_DIR", str(tmp_path / "state"))
+    assert not (tmp_path / "state").exists()
+    call({"REQUEST_METHOD": "GET", "PATH_INFO": "/results"})
+    assert (tmp_path / "state").is_dir()
+
+
+@pytest.mark.parametrize("environ", [{}, {"REQUEST_METHOD": "GET", "PATH_INFO": "/run"},
+                                     {"REQUEST_METHOD": "HEAD", "PATH_INFO": "/run/"}])
+def test_only_post_starts_a_run(service, environ):
+    status, headers, _ = call(environ)
+    assert not service.runs
+    if environ:
+        assert status.startswith("405") and headers["Allow"] == "POST"
+
+
+def test_post_runs(service):
+    status, _, body = call({"REQUEST_METHOD": "POST", "PATH_INFO": "/run"})
+    assert status == "200 OK" and service.runs == [1]
+    assert b'"ran"' in body
+
+
+def test_run_pages_waits_for_uploads_and_notifications(monkeypatch):
+    calls = []
+
+    class App:
+        last_page = "page"
+
+        def run(self):
+            calls.append("run")
+
+    app = App()
+    app.storage = type("Storage", (), {"flush": lambda self: calls.append("flush")})()
+    app.notifier = type("Notifier", (), {"drain": lambda self, timeout: calls.append(("drain", timeout)) or True})()
+    monkeypatch.setattr(main, "APP", app)
+    assert main.run_pages() == {"watch": "page"}
+    assert calls == ["run", "flush", ("drain", main.NOTIFY_DRAIN_SECONDS)]
@@ -0,0 +1,70 @@
+from src.metrics import Metrics, NullMetrics
+
+
+def test_prometheus_exposition():
+    metrics = Metrics(prefix="t")
+    metrics.count("runs_total", outcome="ok")
+    metrics.count("runs_total", 2, outcome="ok")
+    metrics.observe("span_seconds", 0.02, span="fetch")
+    metrics.observe("span_seconds", 3.0, span="fetch")
+    lines = metrics.to_prometheus().splitlines()
+    assert "# TYPE t_runs_total counter" in lines
+    assert 't_runs_total{outcome="ok"} 3' in lines
+    assert 't_span_seconds_bucket{span="fetch",le="0.025"} 1' in lines
+    assert 't_span_seconds_bucket{span="fetch",le="+Inf"} 2' in lines
+    assert 't_span_seconds_count{span="fetch"} 2' in lines
+
+
+def test_label_values_are_escaped():
+    metrics = Metrics(prefix="t")
+    metrics.count("errors_total", error='say "hi"\\\nbye')
+    assert 't_errors_total{error="say \\"hi\\"\\\\\\nbye"} 1' in metrics.to_prometheus().splitlines()
+
+
+def test_tracer_report_groups_spans():
+    tracer = Metrics().tracer(watch="my/LRAWD/07065")
+    tracer.start_run()
+    for _ in range(2):
+        with tracer.span("fetch"):
+            pass
+    try:
+        with tracer.span("notify"):
+            raise IOError("boom")
+    except IOError:
+        pass
+    report = tracer.report(outcome="ok")
+    assert report["watch"] == "my/LRAWD/07065" and report["outcome"] == "ok"
+    assert report["stages"]["fetch"]["count"] == 2
+    assert [span["error"] for span in report["spans"]] == [None, None, "OSError"]
+    assert tracer.metrics.counters[("span_errors_total",
+                                    (("error", "OSError"), ("span", "notify"), ("watch", "my/LRAWD/07065")))] == 1
+
+
+def test_null_metrics_record_nothing():
+    metrics = NullMetrics()
+    tracer = metrics.tracer(watch="w")
+    with tracer.span("fetch"):
+        tracer.count("runs_total")
+    assert metrics.to_prometheus() == "\n" and tracer.report()["spans"] == []
+
+
+def test_spans_are_only_kept_within_a_run():
+    tracer = Metrics().tracer(max_spans=3, watch="w")
+    for _ in range(5):
+        with tracer.span("fetch"):  # e.g. a crawl: never started a run
+            pass
+    assert tracer.spans == [] and tracer.report()["spans_dropped"] == 0
+    tracer.start_run()
+    for _ in range(5):
+        with tracer.span("fetch"):
+            pass
+    tracer.end_run()
+    with tracer.span("smtp_send"):
+        pass
+    report = tracer.report()
+    assert report["stages"]["fetch"]["count"] == 3 and report["spans_dropped"] == 2
+    assert "smtp_send" not in report["stages"]
+    # the aggregates still see every span
+    assert tracer.metrics.histograms[("span_seconds", (("span", "fetch"), ("watch", "w")))].count == 10
+    tracer.start_run()
+    assert tracer.report()["spans"] == [] and tracer.report()["spans_dropped"] == 0
@@ -0,0 +1,166 @@
+import json
+import time
+
+import pytest
+
+from src.mailer import DeliveryReport, Mailer
+from src.metrics import Metrics, NullMetrics
+from src.notifications import (Delivery, DelayQueue, MailSink, Notification, NotificationPipeline, SMSSink,
+                               WebhookSink)
+from src.ratelimit import Backoff
+from testing.standins import LocalWebhookServer
+
+
+def pipeline(sinks, **options):
+    return NotificationPipeline(sinks=sinks, backoff=Backoff(base_seconds=0.01, cap_seconds=0.05),
+                                metrics=NullMetrics(), **options)
+
+
+def webhook(url, subject="Top 1/1"):
+    return Notification("WEBHOOK", [url], subject, json.dumps({"count": 1}))
+
+
+def test_webhook_is_retried_until_it_succeeds():
+    with LocalWebhookServer(fail_first=2, fail_status=503) as server:
+        notifier = pipeline({"WEBHOOK": WebhookSink()})
+        notifier.enqueue(webhook(server.url()))
+        assert notifier.drain(timeout_seconds=10)
+        notifier.close()
+    assert server.attempts == 3 and not notifier.dead_letters
+    [(path, payload)] = server.received
+    assert path == "/hook" and payload == {"subject": "Top 1/1", "results": {"count": 1}}
+
+
+def test_rejected_webhook_is_dead_lettered_without_retrying(tmp_path):
+    dead_letter_path = tmp_path / "dead" / "letters.jsonl"
+    with LocalWebhookServer(fail_first=1, fail_status=404) as server:
+        notifier = pipeline({"WEBHOOK": WebhookSink()}, dead_letter_path=str(dead_letter_path))
+        notifier.enqueue(webhook(server.url()))
+        assert notifier.drain(timeout_seconds=10)
+        notifier.close()
+    assert server.attempts == 1 and not server.received
+    [dead] = notifier.dead_letters
+    assert dead.recipients == [server.url()] and dead.errors[server.url()].startswith("404")
+    [line] = dead_letter_path.read_text().splitlines()
+    assert json.loads(line)["attempts"] == 1
+
+
+def test_webhook_dead_lettered_after_max_attempts():
+    with LocalWebhookServer(fail_first=10, fail_status=500) as server:
+        notifier = pipeline({"WEBHOOK": WebhookSink()}, max_attempts=3)
+        notifier.enqueue(webhook(server.url()))
+        assert notifier.drain(timeout_seconds=10)
+    assert server.attempts == 3 and notifier.dead_letters[0].attempts == 3
+
+
+class RecordingMailer:
+    def __init__(self):
+        self.sent = []
+
+    def send(self, channel, recipients, subject, body):
+        self.sent.append(list(recipients))
+        report = DeliveryReport(channel)
+        report.delivered.extend(recipients)
+        return report
+
+    def reset(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def test_sms_rate_limit_defers_without_using_an_attempt():
+    clock = [1000.0]
+    sink = SMSSink(RecordingMailer(), limits={"vtext.com": (1, 60)}, clock=lambda: clock[0])
+    notifier = pipeline({"SMS": sink}, max_attempts=1)
+    notifier.enqueue(Notification("SMS", ["5550001@vtext.com"], "first", "body"))
+    assert notifier.drain(timeout_seconds=5)
+    clock[0] += 0.5
+    notifier.enqueue(Notification("SMS", ["5550001@vtext.com"], "second", "body"))
+    time.sleep(0.2)  # delivered once, then held back for the rest of the minute
+    assert sink.mailer.sent == [["5550001@vtext.com"]]
+    [queue] = notifier.queues.values()
+    [(not_before, _, later)] = queue._heap
+    assert later.attempts == 0 and not_before > time.time() + 50
+    assert not notifier.dead_letters  # max_attempts=1, yet deferral isn't a failure
+
+
+class FlakyMailer(RecordingMailer):
+    # the first send fails the given way, later ones go through
+    def __init__(self, failure):
+        super().__init__()
+        self.failure = failure
+
+    def send(self, channel, recipients, subject, body):
+        failure, self.failure = self.failure, None
+        if failure == "disconnect":
+            raise OSError("connection reset")
+        if failure == "refused":
+            report = DeliveryReport(channel)
+            report.failed.update({r: (451, "try again later") for r in recipients})
+            return report
+        return super().send(channel, recipients, subject, body)
+
+
+@pytest.mark.parametrize("failure", ["disconnect", "refused"])
+def test_failed_sms_send_does_not_use_up_the_rate_limit(failure):
+    # vtext.com allows one message per 10 minutes: had the failed attempt taken the slot, the retry would be deferred
+    # past any drain window and end up dead-lettered
+    sink = SMSSink(FlakyMailer(failure))
+    notifier = pipeline({"SMS": sink})
+    notifier.enqueue(Notification("SMS", ["5550001@vtext.com"], "subject", "body"))
+    assert notifier.drain(timeout_seconds=5)
+    notifier.close()
+    assert sink.mailer.sent == [["5550001@vtext.com"]] and not notifier.dead_letters
+    assert len(sink.sent["5550001@vtext.com"]) == 1  # the delivered message still holds its slot
+
+
+def test_mail_sink_traces_smtp_sends():
+    metrics = Metrics()
+    sink = MailSink(RecordingMailer(), metrics=metrics)
+    sink.deliver(Notification("EMAIL", ["a@example.com"], "subject", "body"), Delivery())
+    assert metrics.histograms[("span_seconds", (("span", "smtp_send"),))].count == 1
+    assert metrics.counters[("smtp_reconnects_total", (("channel", "EMAIL"),))] == 0
+    assert sink.tracer.spans == []  # delivery happens outside any run: aggregates only
+
+
+def test_close_dead_letters_what_is_still_queued():
+    with LocalWebhookServer(fail_first=1, fail_status=503) as server:
+        notifier = pipeline({"WEBHOOK": WebhookSink()})
+        notifier.backoff.delay = lambda attempt: 60.0
+        notifier.enqueue(webhook(server.url()))
+        deadline = time.time() + 5
+        while server.attempts < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        notifier.close(timeout_seconds=0.2)
+    [dead] = notifier.dead_letters
+    assert dead.attempts == 1 and dead.errors[server.url()].startswith("503")
+    assert notifier.pending() == {"WEBHOOK": 0}
+    # a closed pipeline dead-letters rather than queueing work no worker will pick up
+    notifier.enqueue(webhook(server.url(), subject="late"))
+    assert [n.subject for n in notifier.dead_letters] == ["Top 1/1", "late"]
+
+
+def test_delay_queue_orders_by_due_time_and_refuses_puts_once_closed():
+    queue = DelayQueue()
+    first, second = Notification("EMAIL", ["a@x.com"], "1", ""), Notification("EMAIL", ["b@x.com"], "2", "")
+    assert queue.put(second, not_before=time.time() + 60) and queue.put(first)
+    assert queue.close() == [first, second]
+    assert not queue.put(first) and queue.pending() == 0
+
+
+@pytest.mark.parametrize("status, outcome", [(200, "delivered"), (429, "failed"), (502, "failed"), (410, "rejected")])
+def test_webhook_sink_classifies_responses(status, outcome):
+    with LocalWebhookServer(fail_first=1 if status >= 300 else 0, fail_status=status) as server:
+        delivery = Delivery()
+        WebhookSink().deliver(webhook(server.url()), delivery)
+    results = {"delivered": delivery.delivered, "failed": list(delivery.failed), "rejected": list(delivery.rejected)}
+    assert results[outcome] == [server.url()]
+
+
+def test_sms_gets_its_own_smtp_session():
+    mailer = Mailer(host="smtp.example.com", user="u", password="p", port=2525, starttls=False, bcc_chunk_size=7)
+    clone = mailer.clone()
+    assert clone._lock is not mailer._lock
+    assert vars(clone) | {"_lock": None} == vars(mailer) | {"_lock": None}
@@ -0,0 +1,85 @@
+import pytest
+
+from src.ratelimit import Backoff, CircuitBreaker, CircuitOpenError, EndpointLimiter, TokenBucket, retry_after_seconds
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_bucket_allows_a_burst_then_paces():
+    clock = Clock()
+    bucket = TokenBucket(max_rate=2.0, burst=2, clock=clock)
+    assert bucket.reserve() == 0 and bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    assert bucket.reserve() == pytest.approx(1.0)  # queued behind the previous caller
+    clock.now += 2
+    assert bucket.reserve() == 0
+
+
+def test_bucket_throttling_halves_the_rate_and_honours_retry_after():
+    clock = Clock()
+    bucket = TokenBucket(max_rate=4.0, burst=4, min_rate=1.0, increase=0.5, clock=clock)
+    bucket.throttled(retry_after=10)
+    assert bucket.rate == 2.0
+    assert bucket.reserve() == pytest.approx(10.0)
+    for _ in range(5):
+        bucket.throttled()
+    assert bucket.rate == 1.0
+    for _ in range(10):
+        bucket.succeeded()
+    assert bucket.rate == 4.0
+
+
+def test_breaker_opens_probes_and_closes():
+    clock = Clock()
+    breaker = CircuitBreaker("taxes", failure_threshold=2, reset_seconds=30, clock=clock)
+    breaker.failed()
+    breaker.allow()
+    breaker.failed()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 1
+    with pytest.raises(CircuitOpenError) as raised:
+        breaker.allow()
+    assert raised.value.retry_in_seconds == 30
+    clock.now += 30
+    breaker.allow()  # the one half-open probe
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    breaker.failed()
+    assert breaker.state == CircuitBreaker.OPEN and breaker.trips == 2
+    clock.now += 30
+    breaker.allow()
+    breaker.succeeded()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.allow()
+    assert breaker.rejected == 2
+
+
+def test_successes_reset_the_failure_count():
+    breaker = CircuitBreaker("search", failure_threshold=2, clock=Clock())
+    for _ in range(5):
+        breaker.failed()
+        breaker.succeeded()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retry_after_parsing():
+    assert retry_after_seconds("120") == 120.0
+    assert retry_after_seconds("Wed, 21 Oct 2015 07:28:00 GMT", now=1445412470.0) == 10.0
+    assert retry_after_seconds("soon") is None and retry_after_seconds(None) is None
+
+
+def test_backoff_is_capped():
+    backoff = Backoff(base_seconds=1, cap_seconds=5)
+    assert all(0 <= backoff.delay(attempt) <= 5 for attempt in range(20))
+
+
+def test_limiter_keeps_one_bucket_and_breaker_per_endpoint():
+    limiter = EndpointLimiter(limits={"taxes": (1.0, 1)})
+    assert limiter.bucket("taxes") is limiter.bucket("taxes") and limiter.bucket("taxes").max_rate == 1.0
+    assert limiter.bucket("unknown").max_rate == 1.0
+    assert limiter.stats["taxes"]["breaker"] == CircuitBreaker.CLOSED
@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+from src.recipients import RecipientIndex, Subscriber, parse_line
+
+
+def loaded(*texts):
+    index = RecipientIndex()
+    for text in texts:
+        index.load(text)
+    return index
+
+
+def state(index):
+    return {key: (s.address, s.channel, s.watches) for (key, s) in index.subscribers.items()}, dict(index.invalid)
+
+
+def test_full_replacement_drops_every_previous_subscriber():
+    index = loaded("a@x.com\nb@x.com", "c@x.com\nd@x.com")
+    assert index.emails == ["c@x.com", "d@x.com"]
+    assert index.stats["reloads"] == 1
+
+
+def test_removed_lines_remove_their_subscribers():
+    index = loaded("a@x.com\nb@x.com\n5551234567@vtext.com", "b@x.com")
+    assert (index.emails, index.sms) == (["b@x.com"], [])
+    assert index.for_watch("my/LRAWD") == (["b@x.com"], [])
+
+
+def test_unchanged_content_is_not_parsed_again():
+    index = loaded("a@x.com\nb@x.com")
+    assert not index.load("a@x.com\nb@x.com")
+    index.load("a@x.com\nb@x.com\nc@x.com")
+    assert index.lines_parsed == 3 and index.stats["loads"] == 3
+
+
+def test_duplicates_merge_their_subscriptions():
+    index = loaded("A@X.com: m3/LRAWD\na@x.com: my/LRAWD\n+1555-123-4567@vtext.com: my/LRAWD\n555-123-4567@vtext.com")
+    assert index.emails == ["A@x.com"] and index.subscribers["a@x.com"].watches == {"m3/LRAWD", "my/LRAWD"}
+    assert index.sms == ["5551234567@vtext.com"] and index.subscribers["5551234567@vtext.com"].watches is None
+    assert index.for_watch("mx/LRAWD") == ([], ["5551234567@vtext.com"])
+    # removing one of the duplicates keeps the subscriber, with the remaining line's subscriptions
+    index.load("A@X.com: m3/LRAWD\n+1555-123-4567@vtext.com: my/LRAWD")
+    assert index.subscribers["a@x.com"].watches == {"m3/LRAWD"}
+    assert index.subscribers["5551234567@vtext.com"].watches == {"my/LRAWD"}
+    assert index.for_watch("mx/LRAWD") == ([], [])
+
+
+def test_invalid_lines_differing_only_in_whitespace():
+    index = loaded("a@x.com\nbad\nbad \nnot@valid@x.com", "a@x.com\nbad ")
+    assert index.invalid == {"bad ": "invalid email: bad"}
+    index.load("a@x.com")
+    assert not index.invalid and index.emails == ["a@x.com"]
+
+
+def test_comments_and_blank_lines_are_skipped():
+    index = loaded("# subscribers\n#someone@example.com\n  # 5551234567@vtext.com\n\n   \nsome#one@example.com")
+    assert (index.emails, index.sms, index.invalid) == (["some#one@example.com"], [], {})
+    assert parse_line("#someone@example.com") is None
+
+
+@pytest.mark.parametrize("line, expected", [
+    ("someone@example.com", ("someone@example.com", "EMAIL", None)),
+    ("  someone@Example.COM : my/LRAWD, m3 ,", ("someone@example.com", "EMAIL", frozenset({"my/LRAWD", "m3"}))),
+    ("+1555-123-4567@vtext.com", ("5551234567@vtext.com", "SMS", None)),
+])
+def test_parse_line(line, expected):
+    parsed = parse_line(line)
+    assert isinstance(parsed, Subscriber) and (parsed.address, parsed.channel, parsed.watches) == expected
+
+
+@pytest.mark.parametrize("line", ["not an email", "a@b", "x@-bad.com", "5551234567@example.com", "someone@vtext.com"])
+def test_parse_line_warnings(line):
+    assert isinstance(parse_line(line), str)
+
+
+def test_incremental_loads_match_a_fresh_parse():
+    rng = random.Random(5)
+    pool = [f"user{i}@example.com" for i in range(30)] + [f"USER{i}@example.com: my/LRAWD" for i in range(10)] + \
+        [f"555{i:07d}@vtext.com" for i in range(10)] + ["bad", "bad ", " bad", "# comment", "#user1@example.com", ""]
+    index = RecipientIndex()
+    for _ in range(50):
+        text = "\n".join(rng.sample(pool, k=rng.randrange(0, len(pool))))
+        index.load(text)
+        assert state(index) == state(loaded(text))
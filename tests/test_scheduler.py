@@ -0,0 +1,104 @@
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from src.scheduler import AsyncScheduler, Cron, FixedRate
+
+
+def at(text: str) -> float:
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc).timestamp()
+
+
+def test_fixed_rate_stays_on_the_grid_and_skips_missed_slots():
+    schedule = FixedRate(60)
+    assert schedule.first(1000.0) == 1000.0
+    assert FixedRate(60, immediately=False).first(1000.0) == 1060.0
+    assert schedule.next(1000.0, 1030.0) == 1060.0
+    assert schedule.next(1000.0, 1250.0) == 1300.0  # overran past three slots: the next one on the grid
+
+
+@pytest.mark.parametrize("field,low,high,expected", [
+    ("*", 0, 5, {0, 1, 2, 3, 4, 5}),
+    ("*/2", 0, 5, {0, 2, 4}),
+    ("1-3", 0, 5, {1, 2, 3}),
+    ("1-5/2", 0, 5, {1, 3, 5}),
+    ("3/2", 0, 9, {3, 5, 7, 9}),
+    ("1,4", 0, 5, {1, 4}),
+])
+def test_cron_field_parsing(field, low, high, expected):
+    assert Cron.parse(field, low, high) == expected
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* 24 * * *", "*/0 * * * *", "5-1 * * * *",
+                                        "0 0 31 2 *", "0 0 30,31 2 *", "0 0 31 4,6,9,11 *"])
+def test_cron_rejects_invalid_and_impossible_expressions(expression):
+    with pytest.raises(ValueError):
+        Cron(expression)
+
+
+def test_cron_next():
+    every_three_hours = Cron("0 */3 * * *")
+    assert every_three_hours.first(at("2024-03-01T10:15:00")) == at("2024-03-01T12:00:00")
+    assert every_three_hours.next(at("2024-03-01T12:00:00"), at("2024-03-01T12:00:30")) == at("2024-03-01T15:00:00")
+    leap_day = Cron("30 6 29 2 *")
+    assert leap_day.first(at("2027-11-01T00:00:00")) == at("2028-02-29T06:30:00")
+
+
+def test_cron_day_fields_combine_like_classic_cron():
+    # both restricted: the 1st of the month or any Monday
+    cron = Cron("0 0 1 * 1")
+    assert cron.matches(datetime(2024, 3, 1, tzinfo=timezone.utc))  # a Friday
+    assert cron.matches(datetime(2024, 3, 4, tzinfo=timezone.utc))  # a Monday
+    assert not cron.matches(datetime(2024, 3, 5, tzinfo=timezone.utc))
+    # weekday only: day of month unrestricted
+    assert Cron("0 0 * * 1").first(at("2024-03-01T00:00:00")) == at("2024-03-04T00:00:00")
+
+
+def test_overrun_runs_are_abandoned_on_daemon_threads():
+    release = threading.Event()
+    runs = []
+
+    def slow():
+        runs.append(threading.current_thread())
+        release.wait(5)
+
+    scheduler = AsyncScheduler(grace_seconds=0.1)
+    job = scheduler.add("slow", slow, FixedRate(0.2), timeout_seconds=0.05)
+
+    async def serve():
+        server = asyncio.create_task(scheduler.serve())
+        await asyncio.sleep(0.5)
+        scheduler.stop()
+        await server
+
+    started = time.monotonic()
+    asyncio.run(serve())
+    assert time.monotonic() - started < 2
+    assert job.runs == 1 and job.overruns == 1 and job.skipped >= 1
+    assert runs[0].daemon and runs[0].is_alive()
+    assert scheduler.abandoned == ["slow"]
+    release.set()
+
+
+def test_failures_are_counted_and_the_job_keeps_running():
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        raise IOError("boom")
+
+    scheduler = AsyncScheduler(grace_seconds=0.1)
+    job = scheduler.add("flaky", flaky, FixedRate(0.05))
+
+    async def serve():
+        server = asyncio.create_task(scheduler.serve())
+        await asyncio.sleep(0.3)
+        scheduler.stop()
+        await server
+
+    asyncio.run(serve())
+    assert job.failures == job.runs >= 2
+    assert scheduler.abandoned == []
@@ -0,0 +1,58 @@
+import json
+import threading
+
+import pytest
+
+from src.service import ResultService
+from src.tesla_results import ResultPage
+from testing.fixtures import synthetic_cars
+
+
+def pages():
+    return {"watch": ResultPage(timestamp="Oct 18, 3 PM", total=3, link="https://www.tesla.com",
+                                cars=synthetic_cars(3))}
+
+
+def test_publish_and_serve(tmp_path):
+    service = ResultService(runner=pages, state_dir=str(tmp_path))
+    assert service.latest() is None
+    status, published = service.trigger()
+    assert status == "ran"
+    document = json.loads(published.json_body)
+    assert list(document["watches"]) == ["watch"]
+    assert published.html_body.decode("utf-8") == pages()["watch"].html_long_form
+    assert service.latest() is published  # unchanged on disk: served from memory
+    assert ResultService(runner=pages, state_dir=str(tmp_path)).latest().json_etag == published.json_etag
+
+
+def test_concurrent_triggers_share_one_run(tmp_path):
+    started, release, runs = threading.Event(), threading.Event(), []
+
+    def runner():
+        runs.append(1)
+        started.set()
+        release.wait(5)
+        return pages()
+
+    service = ResultService(runner=runner, state_dir=str(tmp_path))
+    statuses = []
+    threads = [threading.Thread(target=lambda: statuses.append(service.trigger()[0])) for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert len(runs) == 1
+    assert sorted(statuses) == ["coalesced"] * 3 + ["ran"]
+
+
+def test_failed_run_is_raised_to_every_waiter(tmp_path):
+    def runner():
+        raise IOError("boom")
+
+    service = ResultService(runner=runner, state_dir=str(tmp_path))
+    with pytest.raises(IOError):
+        service.trigger()
+    assert service.latest() is None
@@ -0,0 +1,39 @@
+import json
+
+from src.sessions import PooledSession
+from testing.standins import LocalTeslaServer, LocalWebhookServer, TeslaFixture
+
+
+def search(server, session, count=5):
+    query = json.dumps({"query": {"model": "my"}, "offset": 0, "count": count})
+    return session.get(f"{server.url}/inventory/api/v1/inventory-results", params={"query": query}, timeout=5)
+
+
+def test_requests_reuse_one_kept_alive_connection():
+    with LocalTeslaServer(TeslaFixture.synthetic(5)) as server, PooledSession(retry_backoff_factor=0) as session:
+        sizes = [len(search(server, session).content) for _ in range(4)]
+        stats = session.stats
+    assert stats["requests"] == 4 and stats["retries"] == 0
+    assert (stats["connections_opened"], stats["connections_reused"]) == (1, 3)
+    assert stats["bytes_received"] == sum(sizes) and stats["bytes_sent"] == 0
+
+
+def test_server_errors_are_retried_and_counted():
+    with LocalWebhookServer(fail_first=2, fail_status=503) as server, PooledSession(retry_backoff_factor=0) as session:
+        resp = session.post(server.url(), json={"subject": "hi"}, timeout=5)
+        stats = session.stats
+    assert resp.status_code == 200 and server.attempts == 3
+    assert (stats["requests"], stats["retries"]) == (1, 2)
+    assert stats["bytes_sent"] == len(b'{"subject": "hi"}')
+
+
+def test_streamed_bodies_count_what_was_read():
+    fixture = TeslaFixture.synthetic(1)
+    with LocalTeslaServer(fixture, order_page_bytes=64 * 1024) as server, PooledSession() as session:
+        resp = session.get(f"{server.url}/my/order/{fixture.cars[0]['VIN']}", stream=True, timeout=5)
+        assert session.stats["bytes_received"] == 0
+        read = sum(len(chunk) for (_, chunk) in zip(range(2), resp.iter_content(8 * 1024)))
+        resp.close()
+        resp.close()
+        received = session.stats["bytes_received"]
+    assert read == 16 * 1024 and read <= received < 64 * 1024
@@ -0,0 +1,67 @@
+from src.snapshots import FIRST_SEEN, LAST_SEEN, PRICE, Snapshot, SnapshotStore, describe, diff
+from src.tesla_results import TeslaSummary
+from testing.standins import MemoryStorage
+
+
+def car(vin, price, taxes=3000.0, fees=1500.0, options=("MDLY", "LRAWD")):
+    return TeslaSummary.of(vin=vin, purchase_price=price, taxes_amount=taxes, fees_amount=fees, option_codes=options)
+
+
+def snapshot(cars, taken_at, previous=None):
+    return Snapshot.from_cars(cars, taken_at=taken_at, previous=previous)
+
+
+def test_diff_classifies_changes():
+    before = snapshot([car("A", 50000), car("B", 52000), car("C", 54000), car("D", 56000)], taken_at=100)
+    after = snapshot([car("A", 50000), car("B", 51000), car("C", 54000, taxes=3100), car("E", 58000)],
+                     taken_at=200, previous=before)
+    delta = diff(before, after)
+    assert list(delta.added) == ["E"]
+    assert list(delta.removed) == ["D"]
+    assert delta.repriced == {"B": (52000.0, 51000.0)}
+    assert list(delta.updated) == ["C"]
+    assert delta and (delta.since, delta.until) == (100, 200)
+    assert describe(delta) == ["NEW E $58,000.00", "GONE D $56,000.00", "PRICE B $52,000.00 -> $51,000.00"]
+
+
+def test_update_only_is_not_a_change_worth_notifying():
+    before = snapshot([car("A", 50000)], taken_at=100)
+    delta = diff(before, snapshot([car("A", 50000, options=("MDLY", "PAWD"))], taken_at=200, previous=before))
+    assert not delta and list(delta.updated) == ["A"]
+    assert not diff(before, snapshot([car("A", 50000)], taken_at=300, previous=before))
+
+
+def test_first_seen_carries_over():
+    before = snapshot([car("A", 50000)], taken_at=100)
+    after = snapshot([car("A", 49000), car("B", 1)], taken_at=200, previous=before)
+    assert after.records["A"][FIRST_SEEN] == 100 and after.records["A"][LAST_SEEN] == 200
+    assert after.records["B"][FIRST_SEEN] == 200
+    assert Snapshot.loads(after.dumps()).records == after.records
+
+
+def test_listed_but_unenriched_cars_carry_over_unchanged():
+    before = snapshot([car("A", 50000), car("B", 52000), car("C", 54000)], taken_at=100)
+    # B is still on the search page but couldn't be enriched; C is gone from the page
+    during = Snapshot.from_cars([car("A", 50000)], taken_at=200, previous=before, listed=["A", "B"])
+    delta = diff(before, during)
+    assert during.records["B"] == before.records["B"] and list(delta.removed) == ["C"] and not delta.added
+    after = Snapshot.from_cars([car("A", 50000), car("B", 52000)], taken_at=300, previous=during, listed=["A", "B"])
+    assert not diff(during, after) and after.records["B"][FIRST_SEEN] == 100 and after.records["B"][LAST_SEEN] == 300
+    # a listed VIN never seen before only appears once it has been enriched
+    assert "D" not in Snapshot.from_cars([], taken_at=400, previous=after, listed=["D"]).records
+
+
+def test_store_reads_once_and_writes_only_on_change():
+    storage = MemoryStorage()
+    store = SnapshotStore("bucket/snap.json", download=storage.download_text, upload=storage.upload_text)
+    first = store.load()
+    assert len(first) == 0 and store.load() is first  # missing blob: empty snapshot, not re-read
+    current = snapshot([car("A", 50000)], taken_at=100, previous=first)
+    store.save(current, diff(first, current))
+    assert storage.uploads == 2 and set(storage.blobs) == {"bucket/snap.json", "bucket/snap.delta.json"}
+    same = snapshot([car("A", 50000)], taken_at=200, previous=current)
+    store.save(same, diff(current, same))
+    assert storage.uploads == 2 and store.load() is same
+
+    reopened = SnapshotStore("bucket/snap.json", download=storage.download_text, upload=storage.upload_text)
+    assert reopened.load().records["A"][PRICE] == 50000.0
@@ -0,0 +1,111 @@
+import pytest
+
+from src.storage import CachedStorage, LocalStorage, SQLiteStorage, open_storage
+from testing.standins import MemoryStorage
+
+
+class Clock:
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "local", "sqlite"])
+def storage(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStorage()
+    if request.param == "local":
+        return LocalStorage(root=str(tmp_path))
+    return SQLiteStorage(str(tmp_path / "blobs.db"))
+
+
+def test_backends_report_generations(storage):
+    with pytest.raises(FileNotFoundError):
+        storage.fetch("bucket/a.txt")
+    generation = storage.store("bucket/a.txt", "one")
+    content, current = storage.fetch("bucket/a.txt")
+    assert content == "one" and current == generation
+    assert storage.fetch("bucket/a.txt", generation) is None  # unchanged since
+    storage.upload_text("bucket/a.txt", "two")
+    assert storage.download_text("bucket/a.txt") == "two"
+
+
+def test_cache_revalidates_instead_of_downloading(tmp_path):
+    backend = MemoryStorage({"bucket/list.txt": "a@example.com"})
+    clock = Clock()
+    cached = CachedStorage(backend, directory=str(tmp_path), revalidate_seconds=60, write_back=False, clock=clock)
+    assert cached.download_text("bucket/list.txt") == "a@example.com"
+    assert cached.download_text("bucket/list.txt") == "a@example.com"  # within revalidate_seconds: no round trip
+    clock.now += 61
+    assert cached.download_text("bucket/list.txt") == "a@example.com"  # conditional fetch, not modified
+    assert backend.downloads == 1 and cached.stats["hits"] == 1 and cached.stats["revalidated"] == 1
+
+    # a new process starts from the disk cache
+    again = CachedStorage(backend, directory=str(tmp_path), clock=clock)
+    assert again.download_text("bucket/list.txt") == "a@example.com" and backend.downloads == 1
+    backend.store("bucket/list.txt", "b@example.com")
+    assert again.download_text("bucket/list.txt") == "b@example.com" and backend.downloads == 2
+
+
+def test_write_back_uploads_newest_content_and_reads_own_writes(tmp_path):
+    backend = MemoryStorage()
+    cached = CachedStorage(backend, directory=str(tmp_path))
+    for i in range(5):
+        cached.upload_text("bucket/snap.json", f"v{i}")
+    assert cached.download_text("bucket/snap.json") == "v4"
+    assert cached.flush(timeout_seconds=5)
+    assert backend.blobs["bucket/snap.json"][0] == "v4" and backend.uploads <= 5
+    cached.close()
+    with pytest.raises(IOError):
+        cached.upload_text("bucket/snap.json", "late")
+
+
+def test_open_storage(tmp_path):
+    assert isinstance(open_storage(f"file://{tmp_path}"), LocalStorage)
+    assert isinstance(open_storage(f"sqlite://{tmp_path}/x.db"), SQLiteStorage)
+    with pytest.raises(ValueError):
+        open_storage("ftp://nowhere")
+
+
+class FlakyStorage(MemoryStorage):
+    def __init__(self, failures):
+        super().__init__()
+        self.failures = failures
+
+    def store(self, path, content):
+        if self.failures:
+            self.failures -= 1
+            raise IOError("backend unavailable")
+        return super().store(path, content)
+
+
+def test_failed_upload_is_retried_in_the_background(tmp_path):
+    backend = FlakyStorage(failures=1)
+    cached = CachedStorage(backend, directory=str(tmp_path))
+    cached.upload_text("bucket/snap.json", "v1")
+    assert cached.download_text("bucket/snap.json") == "v1"  # served from the cache meanwhile
+    cached.close()  # waits for the retry
+    assert backend.blobs["bucket/snap.json"] == ("v1", 1) and cached.stats["uploads"] == 1
+
+
+def test_unuploaded_write_is_not_trusted_by_the_next_process(tmp_path):
+    backend = FlakyStorage(failures=1)
+    cached = CachedStorage(backend, directory=str(tmp_path), max_upload_attempts=1)
+    cached.upload_text("bucket/snap.json", "lost")
+    cached.close()
+    backend.store("bucket/snap.json", "remote")
+    # the cached copy was never confirmed by the backend: revalidation must download, not reuse it
+    again = CachedStorage(backend, directory=str(tmp_path), revalidate_seconds=3600)
+    assert again.download_text("bucket/snap.json") == "remote"
+
+
+def test_unreadable_cache_file_falls_back_to_the_backend(tmp_path):
+    backend = MemoryStorage({"bucket/list.txt": "a@example.com"})
+    cached = CachedStorage(backend, directory=str(tmp_path), revalidate_seconds=3600)
+    assert cached.download_text("bucket/list.txt") == "a@example.com"
+    with open(cached.cache_file("bucket/list.txt"), "w", encoding="utf-8") as f:
+        f.write("{not json")
+    again = CachedStorage(backend, directory=str(tmp_path), revalidate_seconds=3600)
+    assert again.download_text("bucket/list.txt") == "a@example.com" and backend.downloads == 2
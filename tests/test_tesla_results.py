@@ -0,0 +1,70 @@
+import pytest
+
+from src.tesla_results import ResultPage, TeslaBatch, TeslaSummary
+from testing.fixtures import synthetic_cars
+from testing.legacy import LEGACY_FORMS, legacy_format_page
+
+FORMS = ["html_long_form", "html_short_form", "plain_text"]
+
+
+@pytest.fixture
+def page():
+    return ResultPage(timestamp="Oct 18, 3 PM", total=42, link="https://www.tesla.com/inventory/new/my",
+                      cars=synthetic_cars(25))
+
+
+@pytest.mark.parametrize("form,legacy", list(zip(FORMS, LEGACY_FORMS)))
+def test_forms_identical_to_the_str_format_renderer(page, form, legacy):
+    assert getattr(page, form) == legacy_format_page(page, *legacy)
+
+
+def test_html_keeps_the_heading_whitespace(page):
+    assert page.html_long_form.startswith('<html lang="en"><head></head><body><h3>        <a href=')
+
+
+@pytest.mark.parametrize("form", FORMS)
+def test_stream_matches_rendered_form(page, form):
+    chunks = list(page.stream(form, chunk_size=256))
+    assert len(chunks) > 1
+    assert "".join(chunks) == getattr(page, form)
+
+
+def test_empty_page():
+    page = ResultPage(timestamp="Oct 18, 3 PM", total=0, link="https://www.tesla.com", cars=[])
+    assert page.plain_text == "Top 0/0 @ Oct 18, 3 PM\nFrom: https://www.tesla.com\n\n"
+    assert page.to_dict()["groups"] == {}
+
+
+def fields(car):
+    return {slot: getattr(car, slot) for slot in TeslaSummary.__slots__ if not slot.startswith("_")}
+
+
+def test_batch_rows_round_trip():
+    cars = synthetic_cars(40)
+    batch = TeslaBatch(cars)
+    assert len(batch) == 40 and [fields(car) for car in batch] == [fields(car) for car in cars]
+    assert batch[7].summary == cars[7].summary and batch[7].details == cars[7].details
+    assert list(batch.column("vin")) == [car.vin for car in cars]
+    assert list(batch.column("purchase_price")) == [car.purchase_price for car in cars]
+    assert batch.column("paint") == [car.paint for car in cars]
+    # repeated strings are stored once per column
+    assert len(batch.categories["model"]) == 1 and len(batch.categories["paint"]) == len({car.paint for car in cars})
+
+
+def test_batch_groups_like_the_row_list():
+    cars = synthetic_cars(40)
+    groups = TeslaBatch(cars).group_by_name()
+    expected = {}
+    for car in cars:
+        expected.setdefault(car.name, []).append(car.vin)
+    # same names in first-seen order, each with its cars in input order
+    assert list(groups) == list(expected) and len(groups) > 1
+    assert {name: [car.vin for car in rows] for (name, rows) in groups.items()} == expected
+    assert sum(len(rows) for rows in groups.values()) == 40
+
+
+@pytest.mark.parametrize("form", FORMS)
+def test_batch_page_renders_like_the_list_page(page, form):
+    batched = ResultPage(timestamp=page.timestamp, total=page.total, link=page.link,
+                         cars=TeslaBatch(synthetic_cars(25)))
+    assert batched.count == page.count and getattr(batched, form) == getattr(page, form)
@@ -0,0 +1,106 @@
+import threading
+import time
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from src import tesla_watcher
+from src.metrics import NullMetrics
+from src.tesla_watcher import TeslaWatcher
+from testing.fixtures import WATCH
+from testing.standins import MemoryStorage, synthetic_inventory
+
+
+def stub_watcher(quote, **options):
+    # request_quote replaced: enrichment without any HTTP
+    watcher = TeslaWatcher(**WATCH, storage=MemoryStorage(), recipients=([], []), metrics=NullMetrics(), **options)
+    watcher.request_quote = quote
+    return watcher
+
+
+def inventory(count):
+    cars = synthetic_inventory(count)
+    for i, car in enumerate(cars):
+        car["PurchasePrice"] = 50000 + i  # distinct prices: no two VINs share a cached quote
+    return cars
+
+
+def test_results_keep_input_order_when_quotes_finish_out_of_order():
+    cars = inventory(8)
+
+    def quote(vin, model, trim, price):
+        time.sleep(0.005 * (len(cars) - (price - 50000)))  # the first VIN takes longest
+        return f"https://example.com/{vin}", 3000.0, 1500.0
+
+    enriched = stub_watcher(quote, max_in_flight=8).enrich_all(cars)
+    assert [car.vin for car in enriched] == [car["VIN"] for car in cars]
+
+
+def test_no_more_than_max_in_flight_quotes_at_once():
+    lock, in_flight, peak = threading.Lock(), [0], [0]
+
+    def quote(vin, model, trim, price):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        time.sleep(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return "url", 3000.0, 1500.0
+
+    assert len(stub_watcher(quote, max_in_flight=3).enrich_all(inventory(12))) == 12
+    assert peak[0] == 3
+
+
+def test_failed_vins_are_skipped_without_affecting_the_rest():
+    cars = inventory(5)
+
+    def quote(vin, model, trim, price):
+        if vin == cars[2]["VIN"]:
+            raise IOError("quote failed")
+        return "url", 3000.0, 1500.0
+
+    enriched = stub_watcher(quote, max_in_flight=2).enrich_all(cars)
+    assert [car.vin for car in enriched] == [car["VIN"] for (i, car) in enumerate(cars) if i != 2]
+
+
+def test_batch_deadline_drops_stuck_vins_and_cancels_queued_ones():
+    cars, release, quoted = inventory(4), threading.Event(), []
+
+    def quote(vin, model, trim, price):
+        quoted.append(vin)
+        if vin == cars[0]["VIN"]:
+            release.wait(5)
+        return "url", 3000.0, 1500.0
+
+    # one worker, 4 VINs: a budget of 4 waves of 2 * 0.05s, counted from submission
+    watcher = stub_watcher(quote, max_in_flight=1, timeout_seconds=0.05)
+    started = time.monotonic()
+    try:
+        enriched = watcher.enrich_all(cars)
+        elapsed = time.monotonic() - started
+    finally:
+        release.set()
+    assert enriched == [] and elapsed == pytest.approx(0.4, abs=0.2)
+    time.sleep(0.05)
+    assert quoted == [cars[0]["VIN"]]  # the queued VINs never started
+
+
+@pytest.mark.parametrize("seeded", [
+    dict(latitude=40.6, longitude=-74.3, timezone="America/New_York"),
+    dict(lazy_geocode=True),
+])
+def test_seeded_or_lazy_locations_do_not_geocode_on_construction(monkeypatch, seeded):
+    lookups = []
+
+    def enrich_address(address_text):
+        lookups.append(address_text)
+        return 40.6, -74.3, ZoneInfo("America/New_York")
+    monkeypatch.setattr(tesla_watcher, "enrich_address", enrich_address)
+    watch = {k: v for (k, v) in WATCH.items() if k not in ("latitude", "longitude", "timezone")}
+    watcher = TeslaWatcher(**watch, **seeded, storage=MemoryStorage(), recipients=([], []), metrics=NullMetrics())
+    assert lookups == []
+    assert watcher.timezone == ZoneInfo("America/New_York")
+    assert len(lookups) == (1 if seeded.get("lazy_geocode") else 0)
+    assert (watcher.latitude, watcher.longitude) == (40.6, -74.3)
+    assert len(lookups) == (1 if seeded.get("lazy_geocode") else 0)  # geocoded once, however often it's read
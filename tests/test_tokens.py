@@ -0,0 +1,74 @@
+import time
+
+import pytest
+
+from src.ratelimit import CircuitBreaker
+from src.tokens import CsrfScanner, OrderTokens, TokenCache, extract_csrf
+from src.utils import REGEX_CSRF
+from testing.fixtures import chunked, offline_watcher, order_page
+from testing.standins import LocalSMTPServer, LocalTeslaServer, TeslaFixture
+
+PAIR = b'"csrf_key":"%s","csrf_token":"%s"'
+
+
+@pytest.mark.parametrize("token_at", [0.0, 0.5, 1.0])
+@pytest.mark.parametrize("chunk_bytes", [1, 7, 16 * 1024])
+def test_scanner_agrees_with_the_regex_on_order_pages(token_at, chunk_bytes):
+    page = order_page(64 * 1024, token_at)
+    chunks = [page[i:i + chunk_bytes] for i in range(0, len(page), chunk_bytes)]
+    found, read = extract_csrf(iter(chunks))
+    assert found == REGEX_CSRF.match(page.decode("utf-8")).groups() == ("a1b2c3d4", "Zm9vYmFyYmF6cXV4cXV1eHF1dXg")
+    assert read <= page.index(b"Zm9v") + 27 + chunk_bytes
+
+
+def test_scanner_takes_the_first_pair_where_the_regex_takes_the_last():
+    page = b"<script>" + PAIR % (b"k1", b"t1") + b"</script><script>" + PAIR % (b"k2", b"t2") + b"</script>"
+    assert extract_csrf(chunked(page))[0] == ("k1", "t1")
+    assert REGEX_CSRF.match(page.decode("utf-8")).groups() == ("k2", "t2")
+
+
+def test_scanner_pairs_the_token_with_the_key_right_before_it():
+    page = b'"csrf_key":"stale" "csrf_key":"k1","csrf_token":"t1"'
+    assert extract_csrf([page])[0] == ("k1", "t1")
+
+
+def test_scanner_gives_up_on_a_key_without_a_token():
+    scanner = CsrfScanner()
+    assert scanner.feed(b'"csrf_key":"' + b"x" * 5000) is None
+    assert scanner.feed(PAIR % (b"k1", b"t1")) == ("k1", "t1")
+    assert extract_csrf([b"no tokens here"]) == (None, 14)
+
+
+def test_token_cache_reuses_until_expiry_or_rejection():
+    clock = [0.0]
+    cache = TokenCache(ttl_seconds=60, max_uses=3, clock=lambda: clock[0])
+    fetched = []
+
+    def fetch():
+        fetched.append(1)
+        return OrderTokens("url", f"auth{len(fetched)}", "k", "t", issued_at=clock[0], expires_at=clock[0] + 600)
+
+    first, cached = cache.get("my", fetch)
+    assert not cached and cache.get("my", fetch) == (first, True)
+    cache.get("my", fetch)
+    assert cache.get("my", fetch)[1] is False  # used max_uses times
+    clock[0] += 61
+    second, cached = cache.get("my", fetch)
+    assert not cached and second.expires_at == clock[0] + 60
+    cache.reject("my", second)
+    assert cache.get("my", fetch)[1] is False
+    assert cache.stats == {"tokens": 1, "hits": 2, "misses": 4, "rejections": 1}
+
+
+def test_rejected_cached_tokens_are_not_counted_as_a_success():
+    with LocalTeslaServer(TeslaFixture.synthetic(1)) as tesla, LocalSMTPServer() as smtp:
+        watcher = offline_watcher(tesla, smtp, 1)
+        bucket, breaker = watcher.limiter.bucket("taxes"), watcher.limiter.breaker("taxes")
+        for _ in range(breaker.failure_threshold):
+            breaker.failed()
+        breaker.opened_at = time.monotonic() - breaker.reset_seconds - 1
+        bucket.rate = rate = bucket.max_rate / 2
+        resp = watcher.request("taxes", "POST", url=watcher.tesla_taxes_url, json={}, throttled=(429,), timeout=10)
+    assert resp.status_code == 403
+    assert breaker.state == CircuitBreaker.HALF_OPEN and bucket.rate == rate
+    breaker.allow()  # the 403 didn't hold on to the probe
@@ -0,0 +1,74 @@
+import pytest
+
+from src.metrics import NullMetrics
+from src.watch_set import WatchSet
+from testing.fixtures import WATCH
+from testing.standins import LocalTeslaServer, MemoryStorage, TeslaFixture
+
+MAILING_LIST = "everyone@example.com\nnorth@example.com: north\nlrawd@example.com: my/LRAWD\nperf@example.com: my/PAWD"
+
+
+@pytest.fixture
+def tesla():
+    with LocalTeslaServer(TeslaFixture.synthetic(6)) as server:
+        yield server
+
+
+def watch_set(tesla, watches, **settings):
+    storage = MemoryStorage({"tesla-watcher/mailing_list.txt": MAILING_LIST})
+    defaults = dict(WATCH, tesla_base_url=tesla.url, top_results_count=6, metrics=NullMetrics(),
+                    http_backoff_factor=0.0)
+    return WatchSet(watches=watches, defaults=defaults, storage=storage,
+                    mailing_list_path="tesla-watcher/mailing_list.txt", tax_quotes_path="tesla-watcher/quotes.json",
+                    **settings)
+
+
+def test_watches_share_searches_quotes_session_and_executor(tesla):
+    watches = watch_set(tesla, [{"name": "north"}, {"name": "south", "street": "1 Elm St"}])
+    try:
+        outcomes = watches.run()
+    finally:
+        watches.close()
+    assert outcomes == {"north": None, "south": None}
+    north, south = watches.watchers["north"], watches.watchers["south"]
+    assert north.session is south.session is watches.session
+    assert north.executor is south.executor is watches.executor
+    assert north.tax_quotes is south.tax_quotes is watches.tax_quotes
+    # same search and zipcode: one inventory page and one quote per price between the two watches
+    prices = {car["PurchasePrice"] for car in tesla.fixture.cars}
+    assert tesla.requests["inventory"] == 1 and tesla.requests["taxes"] == len(prices)
+    assert north.last_page.count == south.last_page.count == 6
+    assert watches.storage.blobs["tesla-watcher/quotes.json"]
+
+
+def test_recipients_are_resolved_per_watch(tesla):
+    watches = watch_set(tesla, [{"name": "north"}, {"name": "perf", "trim": "PAWD"}])
+    try:
+        north, perf = watches.watchers["north"], watches.watchers["perf"]
+        assert north.email_recipients == ["everyone@example.com", "north@example.com", "lrawd@example.com"]
+        assert perf.email_recipients == ["everyone@example.com", "perf@example.com"]
+        watches.storage.store("tesla-watcher/mailing_list.txt", "perf@example.com: perf")
+        watches.refresh_recipients()
+        assert (north.email_recipients, perf.email_recipients) == ([], ["perf@example.com"])
+    finally:
+        watches.close()
+
+
+def test_a_failed_watch_does_not_stop_the_others(tesla, monkeypatch):
+    watches = watch_set(tesla, [{"name": "north"}, {"name": "south"}])
+    try:
+        monkeypatch.setattr(watches.watchers["south"], "run", lambda: 1 / 0)
+        outcomes = watches.run()
+        assert outcomes["north"] is None and isinstance(outcomes["south"], ZeroDivisionError)
+        monkeypatch.setattr(watches.watchers["north"], "run", lambda: 1 / 0)
+        with pytest.raises(IOError, match="All 2 watches failed"):
+            watches.run()
+    finally:
+        watches.close()
+
+
+def test_invalid_configurations(tesla):
+    with pytest.raises(ValueError, match="Unknown watch set settings"):
+        watch_set(tesla, [{"name": "north"}], max_concurrent_watch=2)
+    with pytest.raises(ValueError, match="Duplicate watch name"):
+        watch_set(tesla, [{"name": "north"}, {"name": "north"}])